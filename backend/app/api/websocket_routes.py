@@ -1,32 +1,126 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from ..services.rppg import RPPGService
+from ..core.config import settings
+from ..services.ingest import FrameQueue, QueuedMessage
+from ..services.results import ResultStream
+from ..services.sessions import SessionCache, get_session_cache
+from ..services.workers import SessionWorkerPool, get_worker_pool
 import json
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import time
 
 router = APIRouter()
 
-# Create a global executor for CPU-bound tasks
-executor = ThreadPoolExecutor(max_workers=2)
+# Seconds to wait for a closing session's snapshot from its worker
+SNAPSHOT_TIMEOUT = 2.0
+
+
+async def process_session(websocket: WebSocket, pool: SessionWorkerPool, session_id: int, queue: FrameQueue,
+                          stream: ResultStream):
+    """
+    Worker side of a session: hands queued messages to the session's worker,
+    at most ``pool.pipeline_depth`` at a time, so while frames are being
+    processed newer frames replace the waiting one instead of piling up.
+    Results are sent back in order, encoded as the client configured.
+    """
+    in_flight = asyncio.Semaphore(pool.pipeline_depth)
+    results = asyncio.Queue()
+    sender = asyncio.create_task(send_results(websocket, queue, results, in_flight, stream))
+    try:
+        while True:
+            if sender.done():
+                # Surface errors from the sender (e.g. failed send)
+                sender.result()
+            message = await queue.get()
+            if message.kind == "config":
+                stream.apply_config(message.data)
+                pool.configure(session_id, message.data)
+                continue
+
+            await in_flight.acquire()
+            # The session's RPPGService lives in a worker process; ROI means
+            # batches skip the image pipeline entirely
+            if message.kind == "means":
+                results.put_nowait(pool.submit(session_id, "means", message.data))
+            else:
+                results.put_nowait(pool.submit(session_id, message.kind, message.data, message.received_at))
+    finally:
+        sender.cancel()
+
+
+async def send_results(websocket: WebSocket, queue: FrameQueue, results: asyncio.Queue, in_flight: asyncio.Semaphore,
+                       stream: ResultStream):
+    while True:
+        future = await results.get()
+        try:
+            result = await future
+        finally:
+            in_flight.release()
+
+        if result:
+            result["dropped"] = queue.dropped
+            # Send back result (unless unchanged since the last one sent)
+            message = stream.encode(result, time.monotonic())
+            if isinstance(message, bytes):
+                await websocket.send_bytes(message)
+            elif message is not None:
+                await websocket.send_text(message)
+
+
+async def save_session(pool: SessionWorkerPool, cache: SessionCache, session_id: int, token: str,
+                       stream: ResultStream):
+    """
+    Keep the state of a closing session under its resume token, once the
+    frames already handed to its worker are in.
+    """
+    if cache.max_entries == 0:
+        return
+    try:
+        snapshot = await asyncio.wait_for(pool.process(session_id, "snapshot"), SNAPSHOT_TIMEOUT)
+    except Exception as e:
+        print(f"Session snapshot failed: {e}")
+        return
+    cache.put(token, {"service": snapshot, "stream": stream.options()})
+
 
 @router.websocket("/ws/video")
 async def websocket_endpoint(websocket: WebSocket):
+    # Frame parsing needs cv2 / numpy, loaded with the first connection
+    # rather than with the app
+    from ..services.frames import is_batch_message, is_means_message, message_timestamp
+
     await websocket.accept()
-    rppg_service = RPPGService()
-    loop = asyncio.get_event_loop()
+    # Started in the background with the app: waits (off the loop) until it is up
+    pool = await asyncio.to_thread(get_worker_pool)
+    cache = get_session_cache()
+    # A client reconnecting with the token of its previous session (the
+    # ?resume= query parameter) carries on with that session's buffers
+    token = websocket.query_params.get("resume")
+    saved = cache.take(token) if token else None
+    if saved is None:
+        token = cache.new_token()
+    session_id = pool.open_session(None if saved is None else saved["service"])
+    stream = ResultStream()
+    if saved is not None:
+        stream.configure(**saved["stream"])
+    await websocket.send_text(json.dumps({"type": "session", "resumeToken": token, "resumed": saved is not None}))
+    queue = FrameQueue(settings.ws_queue_size, settings.ws_drop_policy, settings.ws_max_frame_lag_ms,
+                       settings.ws_max_burst_bytes, settings.ws_max_means_bytes)
+    worker = asyncio.create_task(process_session(websocket, pool, session_id, queue, stream))
     
     try:
         while True:
             msg = await websocket.receive()
+            if msg.get("type") == "websocket.disconnect":
+                raise WebSocketDisconnect(msg.get("code", 1000))
+            if worker.done():
+                # Surface errors from the worker (e.g. failed send)
+                worker.result()
 
             if msg.get("type") == "websocket.receive" and msg.get("text"):
                 try:
                     payload = json.loads(msg["text"])
                     if isinstance(payload, dict) and payload.get("type") == "config":
-                        rppg_service.configure(
-                            sensitivity=payload.get("rPPGSensitivity"),
-                            motion_rejection=payload.get("motionRejection"),
-                        )
+                        queue.put(QueuedMessage("config", payload, None, None, False))
                 except Exception:
                     pass
                 continue
@@ -34,13 +128,18 @@ async def websocket_endpoint(websocket: WebSocket):
             data = msg.get("bytes")
             if not data:
                 continue
-            
-            # Process in thread pool to avoid blocking the event loop
-            result = await loop.run_in_executor(executor, rppg_service.process_frame, data)
-            
-            if result:
-                # Send back result
-                await websocket.send_text(json.dumps(result))
+
+            received_at = time.time()
+            timestamp = message_timestamp(data)
+            if is_means_message(data):
+                queue.put(QueuedMessage("means", data, timestamp, received_at, False))
+            elif is_batch_message(data):
+                # A burst is a stretch of signal; not replaced by newer frames, only
+                # dropped past the session's burst byte budget
+                queue.put(QueuedMessage("batch", data, timestamp, received_at, False))
+            else:
+                captured = received_at * 1000.0 if timestamp is None else timestamp
+                queue.put(QueuedMessage("frame", data, captured, received_at, True))
                 
     except WebSocketDisconnect:
         print("Client disconnected")
@@ -50,3 +149,7 @@ async def websocket_endpoint(websocket: WebSocket):
             await websocket.close()
         except:
             pass
+    finally:
+        worker.cancel()
+        await save_session(pool, cache, session_id, token, stream)
+        pool.close_session(session_id)
@@ -1,5 +1,10 @@
+from pathlib import Path
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# Relative model / weights paths in the settings are relative to backend/
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
@@ -13,9 +18,73 @@ class Settings(BaseSettings):
         "http://localhost:5173",
     ]
 
+    # Apply pending schema migrations (backend/migrations) when the server
+    # starts; turn off where `python -m app.migrate` runs before deploys
+    db_migrate_on_startup: bool = True
+
     create_default_admin: bool = False
     default_admin_username: str = "admin"
     default_admin_password: str = "admin"
 
+    # Face detector backend for new sessions: "dlib_hog" or "opencv_dnn"
+    face_detector: str = "dlib_hog"
+    face_detector_dnn_model: str = "res10_300x300_ssd_iter_140000.caffemodel"
+    face_detector_dnn_config: str = "deploy.prototxt"
+    face_detector_dnn_confidence: float = 0.5
+    # Weights of the LinkNet34 skin segmentation network ("skinModel":
+    # "linknet" in a session config; needs torch and torchvision)
+    skin_linknet_weights: str = "rPPG/linknet.pth"
+    # Weights of the UNet11 face segmentation network ("skinModel": "unet11")
+    skin_unet11_weights: str = ""
+    # Models each worker process loads and warms up when it starts, by
+    # backend name (e.g. ["dlib_hog", "linknet"]); others are loaded on
+    # first use
+    rppg_preload_models: list[str] = []
+
+    # Per-session frame backpressure on /ws/video: frames waiting to be
+    # processed (1 = latest frame wins), which one to drop when full
+    # ("drop_oldest" or "drop_newest"), and the capture-time lag behind the
+    # newest frame after which a waiting frame is dropped (0 = no limit)
+    ws_queue_size: int = 1
+    ws_drop_policy: str = "drop_oldest"
+    ws_max_frame_lag_ms: float = 500.0
+    # Bytes of frame bursts (several frames per message) and of ROI means
+    # batches that may wait per session; older ones are dropped beyond that
+    # (0 = no limit)
+    ws_max_burst_bytes: int = 32 * 1024 * 1024
+    ws_max_means_bytes: int = 1024 * 1024
+    # Warm resume: a closed session's state is kept this many seconds under
+    # the resume token it was given, for a client reconnecting with
+    # /ws/video?resume=<token>; at most this many sessions (0 = disabled)
+    ws_resume_ttl_s: float = 30.0
+    ws_resume_max_sessions: int = 256
+
+    # Processes holding the per-session rPPG state (0 = one per CPU core)
+    rppg_workers: int = 0
+    # Shared-memory slots for handing frames to the workers; larger messages
+    # (or all of them while every slot is busy) are pickled instead
+    rppg_shm_slots: int = 32
+    rppg_shm_slot_bytes: int = 2 * 1024 * 1024
+    # Frames of one session in flight at once, their decode / localisation /
+    # ROI / signal / vitals stages overlapping in the worker (1 = one frame
+    # at a time). Worth raising for high-fps sessions when there are fewer
+    # sessions than cores
+    rppg_pipeline_depth: int = 1
+    # Cross-session inference batching in each worker (opencv_dnn detection,
+    # skin segmentation networks): requests arriving within this many ms are
+    # run as one batch of at most rppg_batch_max_size (0 = no batching).
+    # Sessions using such a backend are then processed concurrently, as with
+    # a pipeline; dlib_hog sessions are not
+    rppg_batch_max_delay_ms: float = 0.0
+    rppg_batch_max_size: int = 16
+
 
 settings = Settings()
+
+
+def backend_path(path):
+    """
+    A configured file path, resolved against BACKEND_DIR unless absolute.
+    """
+    path = Path(path)
+    return path if path.is_absolute() else BACKEND_DIR / path
@@ -1,43 +1,42 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .database import engine, Base
 from .api import auth, history, websocket_routes
 from .core.config import settings
-from sqlalchemy import text
 
-Base.metadata.create_all(bind=engine)
+# Nothing here touches the database or loads cv2 / numpy / the models: the
+# schema is migrated out of band (python -m app.migrate) or on startup, and
+# the rPPG modules load with the first /ws/video connection
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.db_migrate_on_startup:
+        from .migrate import migrate
+
+        migrate()
+    if settings.create_default_admin:
+        from .migrate import create_default_admin
 
-with engine.begin() as conn:
+        create_default_admin()
+    # Spawn the workers in the background rather than on the first /ws/video
+    # connection, which waits for them if they are not up yet; they import
+    # the rPPG modules (and load settings.rppg_preload_models) in their own
+    # processes while the server is already serving
+    from .services.workers import get_worker_pool, shutdown_worker_pool
+
+    starting = asyncio.create_task(asyncio.to_thread(get_worker_pool))
+    yield
     try:
-        rows = conn.execute(text("PRAGMA table_info(users)")).fetchall()
-        cols = {r[1] for r in rows}
-        if "avatar_url" not in cols:
-            conn.execute(text("ALTER TABLE users ADD COLUMN avatar_url VARCHAR"))
-    except Exception:
-        pass
-
-if settings.create_default_admin:
-    from sqlalchemy.orm import Session
-    from .core import security
-    from . import models
-
-    def create_default_user():
-        db = Session(bind=engine)
-        user = db.query(models.User).filter(models.User.username == settings.default_admin_username).first()
-        if not user:
-            hashed_password = security.get_password_hash(settings.default_admin_password)
-            db_user = models.User(
-                username=settings.default_admin_username,
-                hashed_password=hashed_password,
-                full_name="Admin User",
-            )
-            db.add(db_user)
-            db.commit()
-        db.close()
-
-    create_default_user()
-
-app = FastAPI(title="Infant Monitor Backend")
+        await starting
+    except Exception as e:
+        print(f"Worker pool failed to start: {e}")
+    shutdown_worker_pool()
+
+
+app = FastAPI(title="Infant Monitor Backend", lifespan=lifespan)
 
 # CORS
 origins = settings.cors_allow_origins
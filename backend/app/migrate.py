@@ -0,0 +1,121 @@
+"""
+Versioned schema migrations for the SQLite database.
+
+Migrations live in backend/migrations as ``NNN_<name>.sql`` scripts or
+``NNN_<name>.py`` modules with an ``upgrade(connection)`` function (for
+changes SQLite cannot express idempotently). Each is applied once, in
+version order and in its own transaction, and recorded in the
+schema_migrations table. Run before starting (or rolling) the servers:
+
+    python -m app.migrate
+
+which also creates the default admin when CREATE_DEFAULT_ADMIN is set.
+"""
+import importlib.util
+import re
+from pathlib import Path
+
+from .core.config import settings
+
+MIGRATIONS_DIR = Path(__file__).resolve().parents[1] / "migrations"
+_MIGRATION_NAME = re.compile(r"^(\d+)_\w+\.(sql|py)$")
+
+
+def available_migrations(directory=MIGRATIONS_DIR):
+    """
+    (version, path) of the migration files, in version order.
+    """
+    found = {}
+    for path in Path(directory).iterdir():
+        match = _MIGRATION_NAME.match(path.name)
+        if match is None:
+            continue
+        version = int(match.group(1))
+        if version in found:
+            raise RuntimeError(f"duplicate migration version {version}: {found[version].name}, {path.name}")
+        found[version] = path
+    return sorted(found.items())
+
+
+def applied_versions(connection):
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, "
+        "applied_at DATETIME DEFAULT (CURRENT_TIMESTAMP))"
+    )
+    connection.commit()
+    return {row[0] for row in connection.execute("SELECT version FROM schema_migrations")}
+
+
+def migrate(engine=None, directory=MIGRATIONS_DIR):
+    """
+    Apply the pending migrations; returns the file names applied. A failed
+    migration is rolled back and raised, leaving the later ones pending.
+    """
+    if engine is None:
+        from .database import engine
+    raw = engine.raw_connection()
+    try:
+        # The sqlite3 connection, for executescript and explicit transactions
+        connection = raw.driver_connection
+        applied = applied_versions(connection)
+        done = []
+        for version, path in available_migrations(directory):
+            if version in applied:
+                continue
+            try:
+                if path.suffix == ".sql":
+                    connection.executescript("BEGIN;\n" + path.read_text(encoding="utf-8"))
+                else:
+                    connection.execute("BEGIN")
+                    _load(path).upgrade(connection)
+                connection.execute("INSERT INTO schema_migrations (version, name) VALUES (?, ?)",
+                                   (version, path.name))
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            done.append(path.name)
+        return done
+    finally:
+        raw.close()
+
+
+def create_default_admin(engine=None):
+    """
+    Add the configured default admin unless that user exists.
+    """
+    from sqlalchemy.orm import Session
+
+    from . import models
+    from .core import security
+
+    if engine is None:
+        from .database import engine
+    with Session(bind=engine) as db:
+        user = db.query(models.User).filter(models.User.username == settings.default_admin_username).first()
+        if user is None:
+            db.add(models.User(
+                username=settings.default_admin_username,
+                hashed_password=security.get_password_hash(settings.default_admin_password),
+                full_name="Admin User",
+            ))
+            db.commit()
+
+
+def _load(path):
+    spec = importlib.util.spec_from_file_location(f"migration_{path.stem}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    for name in migrate():
+        print(f"Applied {name}")
+    if settings.create_default_admin:
+        create_default_admin()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Collects single inference requests from many threads (the sessions of a
+    worker process) and runs them as one batched call. The first request
+    opens a batch that closes after ``max_delay_ms`` or at ``max_batch``
+    items; ``fn`` maps the list of items to a list of results, which are
+    handed back to each caller.
+    """
+
+    def __init__(self, fn, max_batch=16, max_delay_ms=5.0, name="batch"):
+        self.fn = fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_delay = max(0.0, float(max_delay_ms)) / 1000.0
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"rppg-{name}", daemon=True)
+        self._thread.start()
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.perf_counter() + self.max_delay
+            stop = False
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+            self._dispatch(batch)
+            if stop:
+                return
+
+    def _dispatch(self, batch):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = list(self.fn([item for item, _ in batch]))
+            if len(results) != len(batch):
+                raise RuntimeError(f"batch of {len(batch)} inputs gave {len(results)} results")
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,195 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed-capacity float ring buffer backed by one contiguous block.
+
+    Each row is written twice (at ``i`` and ``i + capacity``) so the samples in
+    arrival order are always a plain slice of the block: ``view()`` is zero-copy
+    and appending never shifts memory.
+    """
+
+    def __init__(self, capacity, width=4, dtype=np.float64):
+        self.capacity = int(capacity)
+        self.width = int(width)
+        self._data = np.zeros((2 * self.capacity, self.width), dtype=dtype)
+        self._head = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def is_full(self):
+        return self._count == self.capacity
+
+    def clear(self):
+        self._head = 0
+        self._count = 0
+
+    def append(self, row):
+        """
+        Append one row. Returns the evicted oldest row (a copy) once the buffer
+        is full, otherwise None.
+        """
+        evicted = None
+        if self._count < self.capacity:
+            pos = self._head + self._count
+            self._count += 1
+        else:
+            pos = self._head
+            evicted = self._data[pos].copy()
+            self._head = (self._head + 1) % self.capacity
+        self._data[pos] = row
+        self._data[pos + self.capacity] = row
+        return evicted
+
+    def extend(self, rows):
+        """
+        Append many rows with one vectorised write. Only the newest ``capacity``
+        rows are kept if more are given.
+        """
+        rows = np.asarray(rows, dtype=self._data.dtype).reshape(-1, self.width)
+        if rows.shape[0] > self.capacity:
+            rows = rows[-self.capacity:]
+        n = rows.shape[0]
+        if n == 0:
+            return
+        start = self._head + self._count
+        pos = (start + np.arange(n)) % self.capacity
+        self._data[pos] = rows
+        self._data[pos + self.capacity] = rows
+        overflow = max(0, self._count + n - self.capacity)
+        self._count = min(self.capacity, self._count + n)
+        self._head = (self._head + overflow) % self.capacity
+
+    def view(self):
+        """
+        Read-only view of the stored rows in arrival order, shape (len, width).
+        The view is live: it reflects later appends, so copy it to keep it.
+        """
+        v = self._data[self._head:self._head + self._count]
+        v.flags.writeable = False
+        return v
+
+    def column(self, index):
+        return self.view()[:, index]
+
+    def last(self, n):
+        n = max(0, min(int(n), self._count))
+        return self.view()[self._count - n:]
+
+
+# Resampling of captured samples onto a uniform time grid
+RESAMPLE_MODES = ("off", "linear", "cubic")
+# Raw samples used to pick the grid rate (1 / median capture interval)
+RESAMPLE_MIN_POINTS = 8
+# Capture gaps longer than this (s) are not interpolated; the grid restarts
+RESAMPLE_MAX_GAP = 1.0
+
+
+class UniformResampler:
+    """
+    Streaming resampler from capture-timestamped rows onto a uniform grid at
+    ``fs`` Hz (by default the median capture rate of the first
+    RESAMPLE_MIN_POINTS samples, rounded to 1 Hz and then kept).
+
+    ``linear`` interpolates between neighbouring samples; ``cubic`` is a
+    cubic Hermite spline with centred-difference tangents, so it needs one
+    more sample before emitting. Both are local, which makes the output
+    independent of how the input is chunked: a live stream, a burst and an
+    offline replay of the same captures give the same grid samples.
+    """
+
+    def __init__(self, mode="linear", fs=None, max_gap=RESAMPLE_MAX_GAP):
+        self.mode = mode
+        self.fixed_fs = fs
+        self.max_gap = float(max_gap)
+        self.fs = None
+        self.reset()
+
+    def reset(self):
+        """
+        Forget pending samples; the grid rate is kept once chosen.
+        """
+        self._t = np.zeros(0)
+        self._x = None
+        self._next = None
+        self._fresh = True
+
+    def push(self, times, rows):
+        """
+        Add samples (``times`` in seconds, ``rows`` of shape (n, width)) and
+        return the grid rows that can now be interpolated, shape (m, width).
+        Samples not newer than the previous one are ignored.
+        """
+        times = np.asarray(times, dtype=float).reshape(-1)
+        rows = np.asarray(rows, dtype=float).reshape(len(times), -1)
+        if self._x is not None and self._x.shape[1] != rows.shape[1]:
+            self.reset()
+        if self._x is None:
+            self._x = np.zeros((0, rows.shape[1]))
+        t = np.concatenate([self._t, times])
+        x = np.concatenate([self._x, rows])
+        # Keep strictly increasing capture times
+        keep = np.ones(len(t), dtype=bool)
+        if len(t) > 1:
+            keep[1:] = t[1:] > np.maximum.accumulate(t)[:-1]
+        t, x = t[keep], x[keep]
+
+        out = []
+        gaps = np.flatnonzero(np.diff(t) > self.max_gap) + 1
+        for start, stop in zip(np.r_[0, gaps], np.r_[gaps, len(t)]):
+            if start > 0:
+                # A new run after a gap
+                self._next = None
+                self._fresh = True
+            self._t, self._x = t[start:stop], x[start:stop]
+            out.append(self._emit())
+        return np.concatenate(out) if out else np.zeros((0, rows.shape[1]))
+
+    def _emit(self):
+        t, x = self._t, self._x
+        if self.fs is None:
+            if self.fixed_fs:
+                self.fs = float(self.fixed_fs)
+            elif len(t) >= RESAMPLE_MIN_POINTS:
+                self.fs = float(min(60.0, max(5.0, round(1.0 / np.median(np.diff(t[:RESAMPLE_MIN_POINTS]))))))
+            else:
+                return np.zeros((0, x.shape[1]))
+        if len(t) < 2:
+            return np.zeros((0, x.shape[1]))
+        if self._next is None:
+            self._next = t[0]
+        cubic = self.mode == "cubic"
+        # Cubic segments need the sample after their end for its tangent
+        limit = t[-2] if cubic else t[-1]
+        count = int(np.floor((limit - self._next) * self.fs + 1e-9)) + 1 if limit >= self._next else 0
+        grid = self._next + np.arange(max(0, count)) / self.fs
+        if count > 0:
+            k = np.clip(np.searchsorted(t, grid, side="right") - 1, 0, len(t) - 2)
+            h = t[k + 1] - t[k]
+            u = ((grid - t[k]) / h)[:, None]
+            if cubic:
+                m = np.empty_like(x)
+                m[1:-1] = (x[2:] - x[:-2]) / (t[2:] - t[:-2])[:, None]
+                m[-1] = (x[-1] - x[-2]) / (t[-1] - t[-2])
+                # Only the first sample of a run has no predecessor
+                m[0] = (x[1] - x[0]) / (t[1] - t[0]) if self._fresh else 0.0
+                hh = h[:, None]
+                u2, u3 = u * u, u * u * u
+                values = ((2 * u3 - 3 * u2 + 1) * x[k] + (u3 - 2 * u2 + u) * hh * m[k]
+                          + (-2 * u3 + 3 * u2) * x[k + 1] + (u3 - u2) * hh * m[k + 1])
+            else:
+                values = x[k] + u * (x[k + 1] - x[k])
+            self._next = self._next + count / self.fs
+        else:
+            values = np.zeros((0, x.shape[1]))
+        # Keep the segment holding the next grid time (and, for cubic, the
+        # sample before it for the tangent)
+        seg = max(0, int(np.searchsorted(t, self._next, side="right")) - 1)
+        first = max(0, seg - 1) if cubic else seg
+        if first > 0:
+            self._fresh = False
+        self._t, self._x = t[first:], x[first:]
+        return values
@@ -0,0 +1,184 @@
+import threading
+
+import cv2
+import numpy as np
+
+from ..core.config import backend_path, settings
+from .batching import MicroBatcher
+from .registry import WARM_UP_SIZE, registry
+
+
+class DetectorUnavailable(RuntimeError):
+    pass
+
+
+class FaceDetector:
+    """
+    Face detector backend. ``detect`` takes a grey image (or BGR when
+    ``wants_color``) and returns (x, y, w, h) boxes, best first.
+
+    ``fixed_input`` backends resize to their own network input, so callers
+    should not bother with multi-scale retries. ``batchable`` backends run
+    ``detect_batch`` as one inference call, so concurrent sessions gain from
+    sharing it (see BatchedDetector).
+    """
+
+    name = ""
+    wants_color = False
+    fixed_input = False
+    batchable = False
+
+    def detect(self, image, upsample=0):
+        raise NotImplementedError
+
+    def detect_batch(self, images, upsample=0):
+        return [self.detect(image, upsample) for image in images]
+
+    def warm_up(self):
+        width, height = WARM_UP_SIZE
+        shape = (height, width, 3) if self.wants_color else (height, width)
+        self.detect(np.zeros(shape, dtype=np.uint8))
+
+
+class DlibHogDetector(FaceDetector):
+    """
+    dlib HOG + linear SVM frontal face detector.
+    """
+
+    name = "dlib_hog"
+
+    def __init__(self):
+        try:
+            import dlib
+        except ImportError as e:
+            raise DetectorUnavailable("dlib is not installed") from e
+        self._detector = dlib.get_frontal_face_detector()
+
+    def detect(self, image, upsample=0):
+        faces = self._detector(image, int(upsample))
+        # 将Dlib的rectangle对象转换为OpenCV的(x, y, w, h)格式
+        return [(f.left(), f.top(), f.width(), f.height()) for f in faces]
+
+
+class OpenCVDnnDetector(FaceDetector):
+    """
+    OpenCV DNN face detector (res10 300x300 SSD, Caffe) on CPU.
+    """
+
+    name = "opencv_dnn"
+    wants_color = True
+    fixed_input = True
+    batchable = True
+
+    def __init__(self, model_path=None, config_path=None, confidence=None):
+        model_path = backend_path(model_path or settings.face_detector_dnn_model)
+        config_path = backend_path(config_path or settings.face_detector_dnn_config)
+        if not model_path.is_file() or not config_path.is_file():
+            raise DetectorUnavailable(f"missing model files: {model_path}, {config_path}")
+        try:
+            self._net = cv2.dnn.readNetFromCaffe(str(config_path), str(model_path))
+        except cv2.error as e:
+            raise DetectorUnavailable(f"cannot load {model_path}: {e}") from e
+        self._net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self._net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.confidence = float(settings.face_detector_dnn_confidence if confidence is None else confidence)
+        # cv2.dnn.Net keeps its input and activations on the instance
+        self._lock = threading.Lock()
+
+    def detect(self, image, upsample=0):
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        h, w = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, 1.0, (300, 300), (104.0, 177.0, 123.0))
+        with self._lock:
+            self._net.setInput(blob)
+            detections = self._net.forward()
+        return boxes_from_ssd(detections, w, h, self.confidence)
+
+    def detect_batch(self, images, upsample=0):
+        images = [cv2.cvtColor(image, cv2.COLOR_GRAY2BGR) if image.ndim == 2 else image for image in images]
+        blob = cv2.dnn.blobFromImages(images, 1.0, (300, 300), (104.0, 177.0, 123.0))
+        with self._lock:
+            self._net.setInput(blob)
+            detections = self._net.forward()
+        # Column 0 of every detection row is the index of its image
+        rows = detections.reshape(-1, 7)
+        return [boxes_from_ssd(rows[rows[:, 0] == i], image.shape[1], image.shape[0], self.confidence)
+                for i, image in enumerate(images)]
+
+
+class BatchedDetector(FaceDetector):
+    """
+    Shares a batchable backend between the sessions of a process: ``detect``
+    calls arriving within ``max_delay_ms`` of each other are run as one
+    ``detect_batch`` call and the boxes handed back to each caller.
+    """
+
+    def __init__(self, detector, max_batch=16, max_delay_ms=5.0):
+        self.detector = detector
+        self.name = detector.name
+        self.wants_color = detector.wants_color
+        self.fixed_input = detector.fixed_input
+        self.batchable = detector.batchable
+        self.batcher = MicroBatcher(self._run, max_batch, max_delay_ms, name=f"detect-{detector.name}")
+
+    def detect(self, image, upsample=0):
+        return self.batcher((image, upsample))
+
+    def detect_batch(self, images, upsample=0):
+        return self.detector.detect_batch(images, upsample)
+
+    def warm_up(self):
+        self.detector.warm_up()
+
+    def _run(self, items):
+        results = [None] * len(items)
+        for upsample in {u for _, u in items}:
+            index = [i for i, (_, u) in enumerate(items) if u == upsample]
+            boxes = self.detector.detect_batch([items[i][0] for i in index], upsample)
+            for i, b in zip(index, boxes):
+                results[i] = b
+        return results
+
+
+def boxes_from_ssd(detections, width, height, confidence):
+    """
+    Convert an SSD DetectionOutput blob (1, 1, N, 7) with normalised corners
+    into (x, y, w, h) pixel boxes above ``confidence``, best first.
+    """
+    rows = np.asarray(detections, dtype=float).reshape(-1, 7)
+    rows = rows[rows[:, 2] >= confidence]
+    rows = rows[np.argsort(-rows[:, 2])]
+    boxes = []
+    for _, _, _, x1, y1, x2, y2 in rows:
+        x1, x2 = np.clip([x1 * width, x2 * width], 0, width)
+        y1, y2 = np.clip([y1 * height, y2 * height], 0, height)
+        if x2 - x1 >= 2 and y2 - y1 >= 2:
+            boxes.append((int(x1), int(y1), int(x2 - x1), int(y2 - y1)))
+    return boxes
+
+
+DETECTOR_BACKENDS = {
+    DlibHogDetector.name: DlibHogDetector,
+    OpenCVDnnDetector.name: OpenCVDnnDetector,
+}
+
+def get_detector(name=None):
+    """
+    Process-wide shared detector instance for a backend name (default from
+    settings), from the model registry: loaded and warmed up on first use
+    unless preloaded. Batchable backends are wrapped in a BatchedDetector
+    when settings.rppg_batch_max_delay_ms is set.
+    """
+    name = name or settings.face_detector
+    backend = DETECTOR_BACKENDS.get(name)
+    if backend is None:
+        raise DetectorUnavailable(f"unknown face detector backend: {name}")
+
+    def load():
+        detector = backend()
+        if detector.batchable and settings.rppg_batch_max_delay_ms > 0:
+            detector = BatchedDetector(detector, settings.rppg_batch_max_size, settings.rppg_batch_max_delay_ms)
+        return detector
+
+    return registry.get("detector", name, load)
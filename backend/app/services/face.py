@@ -0,0 +1,145 @@
+import time
+
+import cv2
+import numpy as np
+
+
+class FaceTracker:
+    """
+    Cheap frame-to-frame face tracking between full detections.
+
+    The face patch from the last detection is kept as a small grey template and
+    searched for with normalised cross-correlation in a padded window around
+    the previous box, at reduced resolution. The box keeps its size; the match
+    score is the tracking confidence.
+    """
+
+    def __init__(self, search_pad=0.4, min_score=0.6, template_size=48):
+        self.search_pad = float(search_pad)
+        self.min_score = float(min_score)
+        self.template_size = int(template_size)
+        self.box = None
+        self.score = 0.0
+        self._template = None
+        self._scale = 1.0
+
+    def reset(self):
+        self.box = None
+        self.score = 0.0
+        self._template = None
+
+    def start(self, gray, box):
+        """
+        (Re)initialise from a detected (x, y, w, h) box on a grey frame.
+        """
+        x, y, w, h = _clip_box(box, gray.shape)
+        if w < 8 or h < 8:
+            self.reset()
+            return
+        self._scale = min(1.0, self.template_size / float(max(w, h)))
+        patch = gray[y:y + h, x:x + w]
+        self._template = _scaled(patch, self._scale)
+        self.box = (x, y, w, h)
+        self.score = 1.0
+
+    def state(self):
+        """
+        (box, template, scale) of the current track, or None; picklable.
+        """
+        if self.box is None or self._template is None:
+            return None
+        return (tuple(int(v) for v in self.box), self._template.copy(), self._scale)
+
+    def set_state(self, state):
+        """
+        Continue a track from another tracker's ``state()``.
+        """
+        if state is None:
+            self.reset()
+            return
+        box, template, scale = state
+        self.box = tuple(int(v) for v in box)
+        self._template = np.ascontiguousarray(template, dtype=np.uint8)
+        self._scale = float(scale)
+        self.score = 1.0
+
+    def shift(self, dx, dy):
+        """
+        Move the box when the image origin changes (face-crop uploads); the
+        template is unaffected.
+        """
+        if self.box is not None:
+            x, y, w, h = self.box
+            self.box = (x + int(dx), y + int(dy), w, h)
+
+    def update(self, gray):
+        """
+        Track into a new grey frame. Returns the new box, or None when the
+        match is below ``min_score`` (the caller should detect again).
+        """
+        if self._template is None or self.box is None:
+            return None
+        x, y, w, h = self.box
+        pad_x = int(w * self.search_pad)
+        pad_y = int(h * self.search_pad)
+        sx, sy, sw, sh = _clip_box((x - pad_x, y - pad_y, w + 2 * pad_x, h + 2 * pad_y), gray.shape)
+        window = _scaled(gray[sy:sy + sh, sx:sx + sw], self._scale)
+        th, tw = self._template.shape[:2]
+        if window.shape[0] < th or window.shape[1] < tw:
+            self.score = 0.0
+            return None
+        result = cv2.matchTemplate(window, self._template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, loc = cv2.minMaxLoc(result)
+        self.score = float(score)
+        if self.score < self.min_score:
+            return None
+        nx = sx + int(round(loc[0] / self._scale))
+        ny = sy + int(round(loc[1] / self._scale))
+        self.box = _clip_box((nx, ny, w, h), gray.shape)
+        return self.box
+
+
+class StageTimings:
+    """
+    Exponential moving average of per-stage latency, in milliseconds.
+    """
+
+    def __init__(self, alpha=0.1):
+        self.alpha = float(alpha)
+        self.ms = {}
+        self.counts = {}
+
+    def record(self, stage, seconds):
+        ms = seconds * 1000.0
+        prev = self.ms.get(stage)
+        self.ms[stage] = ms if prev is None else prev + self.alpha * (ms - prev)
+        self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def since(self, stage, start):
+        """
+        Record the time elapsed since a ``time.perf_counter()`` value and return now.
+        """
+        now = time.perf_counter()
+        self.record(stage, now - start)
+        return now
+
+    def snapshot(self):
+        # Stages may record from other threads (pipeline.FramePipeline)
+        return {stage: round(ms, 2) for stage, ms in list(self.ms.items())}
+
+
+def _scaled(image, scale):
+    if scale >= 1.0:
+        return image
+    h, w = image.shape[:2]
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def _clip_box(box, shape):
+    x, y, w, h = (int(round(v)) for v in box)
+    x = max(0, min(x, shape[1] - 1))
+    y = max(0, min(y, shape[0] - 1))
+    w = max(0, min(w, shape[1] - x))
+    h = max(0, min(h, shape[0] - y))
+    return (x, y, w, h)
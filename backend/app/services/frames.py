@@ -0,0 +1,359 @@
+import struct
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# Frames are processed at most this wide
+MAX_FRAME_WIDTH = 640
+
+# Raw pixel frame messages on /ws/video (little-endian):
+#   magic b"RPPG", version u8, pixel format u8, header size u16,
+#   sequence number u32, capture timestamp f64 (ms, client clock),
+#   width u16, height u16,
+# version 2 appends the crop offset x u16, y u16 and the full frame
+# width u16, height u16 (face-crop uploads), then the pixels. Any other
+# binary message is an encoded image (JPEG, PNG). Newer versions may grow
+# the header; readers skip to ``header size``.
+FRAME_MAGIC = b"RPPG"
+FRAME_VERSION = 2
+FRAME_HEADER = struct.Struct("<4sBBHIdHH")
+CROP_HEADER = struct.Struct("<HHHH")
+
+# PIXEL_JPEG carries an encoded image (any format imdecode reads) as payload
+PIXEL_RGBA, PIXEL_I420, PIXEL_NV12, PIXEL_JPEG = 1, 2, 3, 4
+PIXEL_FORMATS = {
+    PIXEL_RGBA: "rgba",
+    PIXEL_I420: "i420",
+    PIXEL_NV12: "nv12",
+    PIXEL_JPEG: "jpeg",
+}
+
+# offset_* and full_* describe where a crop sits in the client's frame;
+# for whole frames the offset is 0 and the full size is the frame size
+FrameHeader = namedtuple(
+    "FrameHeader", "version pixel_format seq timestamp width height offset_x offset_y full_width full_height",
+    defaults=(0, 0, 0, 0),
+)
+
+# ROI means messages on /ws/video, for clients that do their own face and
+# ROI work (little-endian): magic b"RPMS", version u8, regions per record u8,
+# record count u16, sequence number of the first record u32, then per
+# record a capture timestamp f64 (ms) and regions x (r, g, b) float32 means.
+MEANS_MAGIC = b"RPMS"
+MEANS_VERSION = 1
+MEANS_HEADER = struct.Struct("<4sBBHI")
+
+MeansHeader = namedtuple("MeansHeader", "version regions count seq")
+
+# Frame burst messages: several timestamped frames in one WebSocket message
+# (little-endian): magic b"RPBT", version u8, pad, frame count u16, then per
+# frame its length u32 and a raw frame message (see parse_frame_message).
+BATCH_MAGIC = b"RPBT"
+BATCH_VERSION = 1
+BATCH_HEADER = struct.Struct("<4sBxH")
+_BATCH_LENGTH = struct.Struct("<I")
+
+# libjpeg can scale by 1/2, 1/4 and 1/8 while decoding (DCT-domain)
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+# Start-of-frame markers carrying the image size (not DHT, JPG or DAC)
+_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_size(data):
+    """
+    (width, height) from the SOF segment of a JPEG, without decoding it, or
+    None if ``data`` is not a JPEG (or the header is cut short).
+    """
+    data = memoryview(data)
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    n = len(data)
+    while i + 4 <= n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        (length,) = struct.unpack_from(">H", data, i + 2)
+        if marker in _SOF_MARKERS:
+            if i + 9 > n:
+                return None
+            height, width = struct.unpack_from(">HH", data, i + 5)
+            return width, height
+        if marker == 0xDA:
+            # Start of scan before any SOF
+            return None
+        i += 2 + length
+    return None
+
+
+def reduced_decode_flag(width, max_width=MAX_FRAME_WIDTH):
+    """
+    Strongest libjpeg reduction that still leaves the image at least
+    ``max_width`` wide (the remainder is an ordinary resize).
+    """
+    for factor, flag in _REDUCED_FLAGS:
+        if width // factor >= max_width:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def decode_frame(frame_data, max_width=MAX_FRAME_WIDTH):
+    """
+    Decode an encoded frame to BGR no wider than ``max_width``. Oversized
+    JPEGs are scaled down inside the decoder, picked from the header size, so
+    the full-resolution image is never materialised. EXIF rotation is not
+    considered when picking the factor (browser canvas frames carry none).
+    Returns None if the data cannot be decoded.
+    """
+    nparr = np.frombuffer(frame_data, np.uint8)
+    size = jpeg_size(nparr)
+    flag = reduced_decode_flag(size[0], max_width) if size else cv2.IMREAD_COLOR
+    frame = cv2.imdecode(nparr, flag)
+    if frame is None:
+        return None
+
+    h, w = frame.shape[:2]
+    if w > max_width:
+        scale = max_width / float(w)
+        new_h = max(1, int(h * scale))
+        frame = cv2.resize(frame, (max_width, new_h), interpolation=cv2.INTER_AREA)
+    return frame
+
+
+def frame_size(pixel_format, width, height):
+    """
+    Payload size in bytes of a raw frame (None for encoded payloads).
+    """
+    if pixel_format == PIXEL_JPEG:
+        return None
+    if pixel_format == PIXEL_RGBA:
+        return width * height * 4
+    # 4:2:0 planes need even dimensions
+    return width * height * 3 // 2
+
+
+def parse_frame_message(data):
+    """
+    Split a raw pixel frame message into (FrameHeader, pixels), with
+    ``pixels`` a read-only view into ``data`` (no copy) shaped for the pixel
+    format (the flat encoded bytes for PIXEL_JPEG). Returns None when
+    ``data`` is not a raw frame (an encoded image). Raises ValueError on a
+    malformed raw frame.
+    """
+    if len(data) < FRAME_HEADER.size or bytes(data[:4]) != FRAME_MAGIC:
+        return None
+    _, version, pixel_format, header_size, seq, timestamp, width, height = FRAME_HEADER.unpack_from(data)
+    min_size = FRAME_HEADER.size + (CROP_HEADER.size if version >= 2 else 0)
+    if version < 1 or header_size < min_size or len(data) < header_size:
+        raise ValueError(f"bad frame header (version {version}, size {header_size})")
+    offset_x = offset_y = 0
+    full_width, full_height = width, height
+    if version >= 2:
+        offset_x, offset_y, full_width, full_height = CROP_HEADER.unpack_from(data, FRAME_HEADER.size)
+        full_width = full_width or width
+        full_height = full_height or height
+    if pixel_format not in PIXEL_FORMATS:
+        raise ValueError(f"unknown pixel format {pixel_format}")
+    if width == 0 or height == 0 or (pixel_format != PIXEL_RGBA and (width % 2 or height % 2)):
+        raise ValueError(f"bad frame size {width}x{height}")
+    header = FrameHeader(version, pixel_format, seq, timestamp, width, height,
+                         offset_x, offset_y, full_width, full_height)
+    size = frame_size(pixel_format, width, height)
+    if size is None:
+        return header, np.frombuffer(data, np.uint8, offset=header_size)
+    if len(data) - header_size < size:
+        raise ValueError(f"short frame: {len(data) - header_size} of {size} bytes")
+
+    pixels = np.frombuffer(data, np.uint8, count=size, offset=header_size)
+    if pixel_format == PIXEL_RGBA:
+        pixels = pixels.reshape(height, width, 4)
+    else:
+        pixels = pixels.reshape(height * 3 // 2, width)
+    return header, pixels
+
+
+def encode_frame_message(pixels, pixel_format, seq=0, timestamp=0.0, offset=(0, 0), full_size=None,
+                         size=None):
+    """
+    Build a raw pixel frame message (the client side of parse_frame_message).
+    For PIXEL_JPEG, ``pixels`` are the encoded bytes and ``size`` their
+    (width, height). ``offset`` and ``full_size`` place a crop in the frame.
+    """
+    if pixel_format == PIXEL_JPEG:
+        payload = bytes(pixels)
+        width, height = size
+    else:
+        pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+        payload = pixels.tobytes()
+        if pixel_format == PIXEL_RGBA:
+            height, width = pixels.shape[:2]
+        else:
+            height, width = pixels.shape[0] * 2 // 3, pixels.shape[1]
+    full_width, full_height = full_size or (width, height)
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, pixel_format, FRAME_HEADER.size + CROP_HEADER.size,
+                               seq & 0xFFFFFFFF, float(timestamp), width, height)
+    header += CROP_HEADER.pack(int(offset[0]), int(offset[1]), full_width, full_height)
+    return header + payload
+
+
+_TO_BGR = {
+    PIXEL_RGBA: cv2.COLOR_RGBA2BGR,
+    PIXEL_I420: cv2.COLOR_YUV2BGR_I420,
+    PIXEL_NV12: cv2.COLOR_YUV2BGR_NV12,
+}
+
+
+def frame_scale(header, max_width=MAX_FRAME_WIDTH):
+    """
+    Scale from the client's frame to processing coordinates: whole frames
+    are processed at most ``max_width`` wide, and crops at the same scale as
+    the frame they were cut from.
+    """
+    return min(1.0, max_width / float(header.full_width or header.width))
+
+
+def raw_to_bgr(header, pixels, max_width=MAX_FRAME_WIDTH):
+    """
+    BGR frame no wider than ``max_width`` from parsed raw pixels.
+    """
+    if header.pixel_format == PIXEL_JPEG:
+        return decode_frame(pixels, max_width)
+    frame = cv2.cvtColor(pixels, _TO_BGR[header.pixel_format])
+    h, w = frame.shape[:2]
+    if w > max_width:
+        frame = cv2.resize(frame, (max_width, max(1, int(h * max_width / w))), interpolation=cv2.INTER_AREA)
+    return frame
+
+
+def read_frame(frame_data, max_width=MAX_FRAME_WIDTH):
+    """
+    Frame from a /ws/video binary message: raw pixels when it carries the
+    frame header, otherwise an encoded image. Returns (frame, header); the
+    header is None for bare encoded images and frame is None if unreadable.
+    Crops come back at the scale of their full frame (see frame_scale).
+    """
+    try:
+        parsed = parse_frame_message(frame_data)
+    except ValueError:
+        return None, None
+    if parsed is None:
+        return decode_frame(frame_data, max_width), None
+    header, pixels = parsed
+    target = max(1, int(round(header.width * frame_scale(header, max_width))))
+    return raw_to_bgr(header, pixels, target), header
+
+
+def means_dtype(regions):
+    return np.dtype([("timestamp", "<f8"), ("rgb", "<f4", (regions, 3))])
+
+
+def is_means_message(data):
+    return len(data) >= MEANS_HEADER.size and bytes(data[:4]) == MEANS_MAGIC
+
+
+def parse_means_message(data):
+    """
+    Split a ROI means message into (MeansHeader, records); ``records`` is a
+    structured view into ``data`` (no copy) with ``timestamp`` (count,) and
+    ``rgb`` (count, regions, 3). Returns None when ``data`` is not a means
+    message, raises ValueError when it is malformed.
+    """
+    if not is_means_message(data):
+        return None
+    _, version, regions, count, seq = MEANS_HEADER.unpack_from(data)
+    if version != MEANS_VERSION or regions == 0:
+        raise ValueError(f"bad means header (version {version}, {regions} regions)")
+    dtype = means_dtype(regions)
+    if len(data) - MEANS_HEADER.size < count * dtype.itemsize:
+        raise ValueError(f"short means message: {count} records of {dtype.itemsize} bytes expected")
+    records = np.frombuffer(data, dtype, count=count, offset=MEANS_HEADER.size)
+    return MeansHeader(version, regions, count, seq), records
+
+
+def encode_means_message(timestamps, rgb, seq=0):
+    """
+    Build a ROI means message from (count,) timestamps in ms and
+    (count, regions, 3) means (the client side of parse_means_message).
+    """
+    rgb = np.asarray(rgb, dtype=float)
+    if rgb.ndim == 2:
+        rgb = rgb[:, None, :]
+    records = np.empty(len(rgb), dtype=means_dtype(rgb.shape[1]))
+    records["timestamp"] = timestamps
+    records["rgb"] = rgb
+    header = MEANS_HEADER.pack(MEANS_MAGIC, MEANS_VERSION, rgb.shape[1], len(rgb), seq & 0xFFFFFFFF)
+    return header + records.tobytes()
+
+
+def is_batch_message(data):
+    return len(data) >= BATCH_HEADER.size and bytes(data[:4]) == BATCH_MAGIC
+
+
+def parse_batch_message(data):
+    """
+    Split a frame burst message into its frame messages (memoryviews into
+    ``data``, no copy). Returns None when ``data`` is not a burst message,
+    raises ValueError when it is malformed.
+    """
+    if not is_batch_message(data):
+        return None
+    _, version, count = BATCH_HEADER.unpack_from(data)
+    if version != BATCH_VERSION:
+        raise ValueError(f"bad batch header (version {version})")
+    view = memoryview(data)
+    frames = []
+    offset = BATCH_HEADER.size
+    for _ in range(count):
+        if offset + _BATCH_LENGTH.size > len(view):
+            raise ValueError("short batch message")
+        (length,) = _BATCH_LENGTH.unpack_from(view, offset)
+        offset += _BATCH_LENGTH.size
+        if offset + length > len(view):
+            raise ValueError("short batch message")
+        frames.append(view[offset:offset + length])
+        offset += length
+    return frames
+
+
+def encode_batch_message(frames):
+    """
+    Build a frame burst message from frame messages (encode_frame_message).
+    """
+    parts = [BATCH_HEADER.pack(BATCH_MAGIC, BATCH_VERSION, len(frames))]
+    for frame in frames:
+        parts.append(_BATCH_LENGTH.pack(len(frame)))
+        parts.append(bytes(frame))
+    return b"".join(parts)
+
+
+def message_timestamp(data):
+    """
+    Capture timestamp in ms carried by a /ws/video binary message (raw frame
+    header, the newest record of a means batch or the newest frame of a
+    burst), or None.
+    """
+    if len(data) >= FRAME_HEADER.size and bytes(data[:4]) == FRAME_MAGIC:
+        timestamp = FRAME_HEADER.unpack_from(data)[5]
+        return timestamp if timestamp > 0 else None
+    if is_means_message(data):
+        _, _, regions, count, _ = MEANS_HEADER.unpack_from(data)
+        size = means_dtype(regions).itemsize
+        end = MEANS_HEADER.size + count * size
+        if count and regions and len(data) >= end:
+            return struct.unpack_from("<d", data, end - size)[0]
+    if is_batch_message(data):
+        try:
+            frames = parse_batch_message(data)
+        except ValueError:
+            return None
+        return message_timestamp(frames[-1]) if frames else None
+    return None
@@ -0,0 +1,104 @@
+import asyncio
+from collections import deque, namedtuple
+
+DROP_POLICIES = ("drop_oldest", "drop_newest")
+
+# kind is "frame", "batch", "means" or "config"; timestamp is the capture time in ms
+# (client clock, or arrival time when the message carries none)
+QueuedMessage = namedtuple("QueuedMessage", "kind data timestamp received_at droppable")
+
+
+class FrameQueue:
+    """
+    Per-session ingest queue between the WebSocket reader and the worker.
+
+    At most ``maxsize`` droppable messages (image frames) wait at a time;
+    when a new one arrives on a full queue the oldest waiting frame is
+    dropped ("drop_oldest", so with maxsize 1 the latest frame wins) or the
+    new one is ("drop_newest"). Frames whose capture time is more than
+    ``max_lag_ms`` behind the newest frame seen are dropped when dequeued.
+    Non-droppable messages (config, frame bursts, ROI means batches) are not
+    replaced by newer frames and stay in order with them. Config is always
+    kept; the bursts ("batch") waiting may take at most ``max_burst_bytes``
+    and the means batches ("means") at most ``max_means_bytes``: beyond that
+    the oldest waiting messages of that kind are dropped, or the new one with
+    "drop_newest" (or when it is larger than the budget on its own).
+    """
+
+    def __init__(self, maxsize=1, policy="drop_oldest", max_lag_ms=None, max_burst_bytes=None,
+                 max_means_bytes=None):
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy if policy in DROP_POLICIES else "drop_oldest"
+        self.max_lag_ms = float(max_lag_ms) if max_lag_ms else None
+        self.max_burst_bytes = int(max_burst_bytes) if max_burst_bytes else None
+        self.max_means_bytes = int(max_means_bytes) if max_means_bytes else None
+        self.dropped = 0
+        self._items = deque()
+        self._waiting = 0
+        # Bytes waiting per budgeted kind
+        self._bytes = {"batch": 0, "means": 0}
+        self._latest = None
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, message):
+        """
+        Queue a message; returns False if it was dropped on arrival.
+        """
+        if message.droppable:
+            if self._latest is None or message.timestamp > self._latest:
+                self._latest = message.timestamp
+            if self._waiting >= self.maxsize:
+                self.dropped += 1
+                if self.policy == "drop_newest":
+                    return False
+                for i, queued in enumerate(self._items):
+                    if queued.droppable:
+                        del self._items[i]
+                        self._waiting -= 1
+                        break
+            self._waiting += 1
+        elif message.kind in self._bytes and not self._make_room(message.kind, len(message.data)):
+            self.dropped += 1
+            return False
+        self._items.append(message)
+        self._ready.set()
+        return True
+
+    async def get(self):
+        while True:
+            while not self._items:
+                self._ready.clear()
+                await self._ready.wait()
+            message = self._items.popleft()
+            if not message.droppable:
+                if message.kind in self._bytes:
+                    self._bytes[message.kind] -= len(message.data)
+                return message
+            self._waiting -= 1
+            if self.max_lag_ms is not None and self._latest - message.timestamp > self.max_lag_ms:
+                self.dropped += 1
+                continue
+            return message
+
+    def _make_room(self, kind, size):
+        """
+        Reserve ``size`` bytes of the budget of ``kind``, dropping the oldest
+        waiting messages of that kind if the policy allows; False if the
+        message cannot wait.
+        """
+        limit = self.max_burst_bytes if kind == "batch" else self.max_means_bytes
+        if limit is not None and self._bytes[kind] + size > limit:
+            if size > limit or self.policy == "drop_newest":
+                return False
+            for queued in list(self._items):
+                if self._bytes[kind] + size <= limit:
+                    break
+                if queued.kind == kind:
+                    self._items.remove(queued)
+                    self._bytes[kind] -= len(queued.data)
+                    self.dropped += 1
+        self._bytes[kind] += size
+        return True
@@ -0,0 +1,96 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+from .rppg import FRAME_STAGES, FrameJob
+
+# Frames waiting between two stages
+STAGE_QUEUE_SIZE = 2
+
+# Stages sharing the signal buffers: a frame holds them from entering the
+# first to leaving the last, so vitals never see a later frame's samples
+BUFFER_STAGES = ("signal", "vitals")
+
+
+class FramePipeline:
+    """
+    Runs the FRAME_STAGES of one RPPGService concurrently across consecutive
+    frames: one thread per stage, bounded FIFO queues in between. Frame N+1
+    is decoded while frame N is being localised and frame N-1 updates the
+    signal buffers, yet every stage sees the frames in submission order, so
+    the tracker and the sample buffers are updated exactly as by
+    ``process_frame``; the signal and vitals stages of a frame run back to
+    back (BUFFER_STAGES). The heavy stages (decode, detection, ROI means, FFT)
+    spend most of their time in cv2/numpy with the GIL released.
+
+    ``submit`` blocks while the first queue is full, which is the backpressure
+    towards the caller.
+    """
+
+    def __init__(self, service, queue_size=STAGE_QUEUE_SIZE):
+        self.service = service
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in FRAME_STAGES]
+        self._idle = threading.Condition()
+        self._in_flight = 0
+        self._buffers = threading.Semaphore(1)
+        self._threads = []
+        for i, stage in enumerate(FRAME_STAGES):
+            out = self._queues[i + 1] if i + 1 < len(FRAME_STAGES) else None
+            thread = threading.Thread(target=self._run, args=(stage, self._queues[i], out),
+                                      name=f"rppg-{stage}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, frame_data, received_at=None):
+        """
+        Queue a frame; returns a Future of its ``process_frame`` result.
+        Futures complete in submission order.
+        """
+        future = Future()
+        with self._idle:
+            self._in_flight += 1
+        self._queues[0].put([FrameJob(frame_data, received_at), future, None])
+        return future
+
+    def drain(self):
+        """
+        Wait until every submitted frame has been through all stages, e.g.
+        before changing the configuration or ingesting samples another way.
+        """
+        with self._idle:
+            self._idle.wait_for(lambda: self._in_flight == 0)
+
+    def close(self):
+        self.drain()
+        for q in self._queues:
+            q.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self, name, inbox, outbox):
+        stage = getattr(self.service, name + "_stage")
+        while True:
+            item = inbox.get()
+            if item is None:
+                return
+            job, future, error = item
+            if name == BUFFER_STAGES[0]:
+                self._buffers.acquire()
+            if error is None:
+                try:
+                    stage(job)
+                except Exception as e:
+                    # Later stages skip the frame; the error is reported in order
+                    item[2] = e
+            if name == BUFFER_STAGES[-1]:
+                self._buffers.release()
+            if outbox is not None:
+                outbox.put(item)
+                continue
+            if item[2] is not None:
+                future.set_exception(item[2])
+            else:
+                future.set_result(job.result)
+            with self._idle:
+                self._in_flight -= 1
+                self._idle.notify_all()
@@ -0,0 +1,80 @@
+import threading
+
+# Blank input for warm-up inferences (width, height)
+WARM_UP_SIZE = (320, 240)
+
+
+class ModelRegistry:
+    """
+    Inference models shared by every session of a process, keyed by (kind,
+    name). Each one is built once, on first use or by ``preload_models``,
+    and gets one warm-up inference (its ``warm_up()``) before it is handed
+    out, so no session pays for weight loading, lazy initialisation or
+    kernel selection on a live frame. Concurrent first uses of a model
+    wait for a single load.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._models
+
+    def get(self, kind, name, factory):
+        """
+        The model for (kind, name), built by ``factory()`` if not loaded
+        yet. Errors of the factory or the warm-up propagate and nothing is
+        stored, so a later call tries again.
+        """
+        key = (kind, name)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        with self._lock:
+            loading = self._loading.setdefault(key, threading.Lock())
+        with loading:
+            model = self._models.get(key)
+            if model is None:
+                model = factory()
+                warm_up = getattr(model, "warm_up", None)
+                if warm_up is not None:
+                    warm_up()
+                self._models[key] = model
+        return model
+
+    def loaded(self):
+        return sorted(self._models)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+
+registry = ModelRegistry()
+
+
+def preload_models(names):
+    """
+    Load and warm up models by backend name (face detectors and skin
+    segmentation networks), e.g. settings.rppg_preload_models when a worker
+    starts. Returns the names that could not be loaded.
+    """
+    # The backends look themselves up in this registry
+    from .detectors import DETECTOR_BACKENDS, get_detector
+    from .segmentation import SEGMENTATION_BACKENDS, get_segmenter
+
+    failed = []
+    for name in names:
+        try:
+            if name in DETECTOR_BACKENDS:
+                get_detector(name)
+            elif name in SEGMENTATION_BACKENDS:
+                get_segmenter(name)
+            else:
+                raise KeyError(name)
+        except Exception as e:
+            print(f"Cannot preload model {name}: {e}")
+            failed.append(name)
+    return failed
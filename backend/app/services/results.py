@@ -0,0 +1,168 @@
+import json
+import struct
+
+RESULT_ENCODINGS = ("json", "binary")
+
+# Binary result messages (sent as WebSocket binary frames). Little-endian
+# header: magic "RPRS", version u8, flags u8, quality code u8, pad, result
+# id u32 (consecutive per session, gaps = lost messages), frame seq u32;
+# then bpm, spo2, resp_rate, snr, lighting as f32 and the dropped-frame
+# count u32; then the ROI and the crop request as 4 x i32 when flagged.
+RESULT_MAGIC = b"RPRS"
+RESULT_VERSION = 1
+RESULT_HEADER = struct.Struct("<4sBBBxII")
+RESULT_BODY = struct.Struct("<5fI")
+RESULT_BOX = struct.Struct("<4i")
+
+FLAG_KEYFRAME = 1
+FLAG_SEQ = 2
+FLAG_ROI = 4
+# Crop request present (upload mode "crop"); a zero-size box means null
+FLAG_CROP = 8
+
+QUALITY_CODES = ("", "Good", "Fair", "Poor", "No Face", "ROI Error")
+VITAL_FIELDS = ("bpm", "spo2", "resp_rate", "snr", "lighting")
+
+# Seconds between full-state messages when only changes are sent
+KEYFRAME_INTERVAL = 2.0
+
+
+def encode_result(result, result_id, keyframe=False):
+    flags = FLAG_KEYFRAME if keyframe else 0
+    seq = result.get("seq")
+    roi = result.get("roi")
+    crop = result.get("crop", False)
+    if seq is not None:
+        flags |= FLAG_SEQ
+    if roi is not None:
+        flags |= FLAG_ROI
+    if crop is not False:
+        flags |= FLAG_CROP
+    quality = result.get("quality", "")
+    parts = [
+        RESULT_HEADER.pack(RESULT_MAGIC, RESULT_VERSION, flags,
+                           QUALITY_CODES.index(quality) if quality in QUALITY_CODES else 0,
+                           result_id & 0xFFFFFFFF, 0 if seq is None else seq & 0xFFFFFFFF),
+        RESULT_BODY.pack(*(float(result.get(k) or 0) for k in VITAL_FIELDS), int(result.get("dropped", 0))),
+    ]
+    if roi is not None:
+        parts.append(RESULT_BOX.pack(*roi))
+    if crop is not False:
+        parts.append(RESULT_BOX.pack(*(crop or (0, 0, 0, 0))))
+    return b"".join(parts)
+
+
+def decode_result(data):
+    """
+    Inverse of encode_result: the result dict plus "id" and "keyframe".
+    """
+    data = memoryview(data)
+    magic, version, flags, quality, result_id, seq = RESULT_HEADER.unpack_from(data)
+    if magic != RESULT_MAGIC or version != RESULT_VERSION:
+        raise ValueError("not a result message")
+    offset = RESULT_HEADER.size
+    *vitals, dropped = RESULT_BODY.unpack_from(data, offset)
+    offset += RESULT_BODY.size
+    result = {k: round(v, 1) for k, v in zip(VITAL_FIELDS, vitals)}
+    result["quality"] = QUALITY_CODES[quality] if quality < len(QUALITY_CODES) else ""
+    result["dropped"] = dropped
+    result["id"] = result_id
+    result["keyframe"] = bool(flags & FLAG_KEYFRAME)
+    if flags & FLAG_SEQ:
+        result["seq"] = seq
+    if flags & FLAG_ROI:
+        result["roi"] = list(RESULT_BOX.unpack_from(data, offset))
+        offset += RESULT_BOX.size
+    if flags & FLAG_CROP:
+        crop = list(RESULT_BOX.unpack_from(data, offset))
+        result["crop"] = crop if crop[2] > 0 and crop[3] > 0 else None
+    return result
+
+
+class ResultStream:
+    """
+    Outbound side of a session: encodes result dicts as JSON text (default)
+    or binary result messages, and with ``min_delta`` set only sends a
+    result when a vital moved by more than that, the quality or the crop
+    request changed, or a keyframe is due every ``keyframe_interval``
+    seconds. ``max_rate`` caps the messages per second (keyframes aside);
+    a change held back is sent with the next result allowed through.
+    """
+
+    def __init__(self):
+        self.encoding = "json"
+        self.min_delta = None
+        self.max_rate = 0.0
+        self.keyframe_interval = KEYFRAME_INTERVAL
+        self.sent = 0
+        self._last = None
+        self._last_sent_at = None
+        self._last_keyframe_at = None
+
+    def configure(self, encoding=None, min_delta=None, max_rate=None, keyframe_interval=None):
+        if encoding is not None and encoding in RESULT_ENCODINGS:
+            self.encoding = encoding
+        if min_delta is not None:
+            try:
+                v = float(min_delta)
+                self.min_delta = None if v < 0 else v
+            except Exception:
+                pass
+        if max_rate is not None:
+            try:
+                self.max_rate = max(0.0, float(max_rate))
+            except Exception:
+                pass
+        if keyframe_interval is not None:
+            try:
+                self.keyframe_interval = max(0.1, float(keyframe_interval))
+            except Exception:
+                pass
+
+    def options(self):
+        """
+        The configure() arguments reproducing this stream's settings.
+        """
+        return {
+            "encoding": self.encoding,
+            "min_delta": -1.0 if self.min_delta is None else self.min_delta,
+            "max_rate": self.max_rate,
+            "keyframe_interval": self.keyframe_interval,
+        }
+
+    def apply_config(self, payload):
+        """
+        Apply the result options of a client "config" message.
+        """
+        self.configure(
+            encoding=payload.get("resultEncoding"),
+            min_delta=payload.get("resultMinDelta"),
+            max_rate=payload.get("resultMaxRate"),
+            keyframe_interval=payload.get("resultKeyframeInterval"),
+        )
+
+    def encode(self, result, now):
+        """
+        Message for a result at ``now`` (seconds, monotonic): str, bytes, or
+        None when it is not sent.
+        """
+        keyframe = self._last_keyframe_at is None or now - self._last_keyframe_at >= self.keyframe_interval
+        if not keyframe:
+            if self.max_rate > 0 and now - self._last_sent_at < 1.0 / self.max_rate:
+                return None
+            if self.min_delta is not None and not self._changed(result):
+                return None
+        if keyframe:
+            self._last_keyframe_at = now
+        self._last = result
+        self._last_sent_at = now
+        self.sent += 1
+        if self.encoding == "binary":
+            return encode_result(result, self.sent - 1, keyframe)
+        return json.dumps(result)
+
+    def _changed(self, result):
+        last = self._last
+        if result.get("quality") != last.get("quality") or result.get("crop") != last.get("crop"):
+            return True
+        return any(abs(float(result.get(k) or 0) - float(last.get(k) or 0)) > self.min_delta for k in VITAL_FIELDS)
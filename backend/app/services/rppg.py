@@ -3,27 +3,295 @@ import numpy as np
 from scipy import signal
 import base64
 import time
-import dlib
+
+from ..core.config import settings
+from .buffers import RESAMPLE_MODES, RingBuffer, UniformResampler
+from .detectors import DETECTOR_BACKENDS, BatchedDetector, DetectorUnavailable, get_detector
+from .face import FaceTracker, StageTimings, _clip_box
+from .filters import StreamingBandpass
+from .frames import frame_scale, parse_batch_message, parse_means_message, read_frame
+from .segmentation import SEGMENTATION_BACKENDS, BatchedSegmenter, get_segmenter
+from .skin import DEFAULT_SKIN_LUT, SkinLUT
+from .spectrum import SlidingBandDFT, _band_gain, _hann_trend_bins
+from .vitals import VitalsScheduler
+
+# Column layout of the per-session sample block
+COL_RED, COL_GREEN, COL_BLUE, COL_LIGHTING = 0, 1, 2, 3
+
+# Cardiac band in Hz
+HR_BAND = (0.7, 4.0)
+
+# Respiration band in Hz
+RESP_BAND = (0.1, 0.5)
+
+# "batch": FFT of the whole buffer per estimate; "sliding": incremental DFT over HR_BAND
+SPECTRUM_MODES = ("batch", "sliding")
+
+# "filtfilt": zero-phase filtering of the whole window per estimate;
+# "streaming": causal SOS filters with persistent state, one sample at a time
+FILTER_MODES = ("filtfilt", "streaming")
+
+# Column layout of the streaming filter output block
+COL_POS, COL_BVP, COL_RESP = 0, 1, 2
+
+# POS projection window for the per-sample pulse (~1.6 s at 30 fps)
+POS_WINDOW = 48
+
+# Opening applied to the skin mask when skin_morphology is on
+_SKIN_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+
+# Use the fused integral-image ROI pass once the ROIs (summed) cover at least
+# this share of the box spanning them
+FUSED_ROI_MIN_COVERAGE = 0.5
+
+# "fixed": forehead + both cheeks, equally weighted; "grid": ROI_GRID x ROI_GRID
+# blocks over the face box, each weighted by the band SNR of its own pulse
+ROI_MODES = ("fixed", "grid")
+ROI_GRID = 8
+
+# Columns per region in the grid sample block: r, g, b and skin fraction
+REGION_WIDTH = 4
+
+# "full": clients send whole frames; "crop": once a face is found the result
+# carries a padded face box ("crop", client frame coordinates) and the client
+# sends only that crop until "crop" comes back null
+UPLOAD_MODES = ("full", "crop")
+CROP_PAD = 0.5
+
+# Heart-rate smoothing span in seconds of stream time, from motionRejection
+# 0 to 100: the 3 to 10 estimates it averaged at the dashboard's 10 fps when
+# every frame produced one. Its length in estimates follows the bpm cadence
+BPM_SMOOTHING_S = (0.3, 1.0)
+EMPTY_VITALS = {"bpm": 0, "snr": 0, "spo2": 0, "resp_rate": 0, "lighting": 0}
+
+# "detect": run the detector on every frame; "track": detect every
+# DETECT_INTERVAL frames (or when tracking confidence drops) and track in between
+LOCALISATION_MODES = ("detect", "track")
+DETECT_INTERVAL = 10
+
+# Adaptive detection scale: the HOG detector finds faces down to ~80 px
+# without upsampling, so detect on a copy where the last face is about
+# DETECT_FACE_WIDTH px wide (or the frame is DETECT_FIRST_WIDTH px wide when
+# there is no previous face) and only escalate when nothing is found. While
+# no face is found (baby out of frame or covered) the full-resolution,
+# upsampled search runs on the first and then every DETECT_ESCALATE_EVERY-th
+# missed detection only; the other misses cost one downscaled pass.
+DETECT_FACE_WIDTH = 100
+DETECT_FIRST_WIDTH = 320
+DETECT_ESCALATE_EVERY = 5
+
+
+def pos_sample(window):
+    """
+    POS pulse value of the newest sample of a (win, 3) R, G, B window. The
+    normalised projections have zero mean over the window, so only the window
+    mean and covariance are needed (same value as ``pos_series``).
+    """
+    n = window.shape[0]
+    mean = window.sum(axis=0) / n
+    if not np.all(mean > 0):
+        return 0.0
+    cov = window.T @ window / n - np.outer(mean, mean)
+    a1 = np.array([0.0, 1.0 / mean[1], -1.0 / mean[2]])
+    a2 = np.array([-2.0 / mean[0], 1.0 / mean[1], 1.0 / mean[2]])
+    var_s2 = float(a2 @ cov @ a2)
+    alpha = float(np.sqrt(max(float(a1 @ cov @ a1), 0.0) / var_s2)) if var_s2 > 0 else 0.0
+    return float((a1 + alpha * a2) @ window[-1])
+
+
+def pos_series(rgb, win=POS_WINDOW):
+    """
+    Causal per-sample POS pulse: for every sample, project the last ``win``
+    temporally normalised R, G, B samples and keep the newest value (mean
+    removed). Samples without a full window are 0.
+    """
+    rgb = np.asarray(rgb, dtype=float)
+    out = np.zeros(rgb.shape[0])
+    if rgb.shape[0] < win:
+        return out
+    windows = np.lib.stride_tricks.sliding_window_view(rgb, win, axis=0)  # (m, 3, win)
+    mean = windows.mean(axis=2, keepdims=True)
+    valid = np.all(mean[:, :, 0] > 0, axis=1)
+    cn = windows / np.where(mean > 0, mean, 1.0)
+    s1 = cn[:, 1] - cn[:, 2]
+    s2 = cn[:, 1] + cn[:, 2] - 2 * cn[:, 0]
+    std_s2 = s2.std(axis=1)
+    alpha = np.divide(s1.std(axis=1), std_s2, out=np.zeros_like(std_s2), where=std_s2 > 0)
+    h = s1 + alpha[:, None] * s2
+    out[win - 1:] = np.where(valid, h[:, -1] - h.mean(axis=1), 0.0)
+    return out
+
+
+def grid_means(crop, mask, grid):
+    """
+    Skin-masked mean colour of ``grid`` x ``grid`` blocks of a BGR crop,
+    read off integral images at the block edges instead of looping over
+    blocks. Returns a (grid * grid, REGION_WIDTH) array of
+    (r, g, b, skin fraction) rows in row-major block order. Blocks under 10%
+    skin use the plain block mean, like extract_roi_means.
+    """
+    h, w = mask.shape[:2]
+    ys = np.linspace(0, h, grid + 1).astype(int)
+    xs = np.linspace(0, w, grid + 1).astype(int)
+
+    def block_sums(image):
+        ii = cv2.integral(image, sdepth=cv2.CV_32S)[ys][:, xs]
+        return np.diff(np.diff(ii, axis=0), axis=1).reshape(grid * grid, -1).astype(float)
+
+    area = np.outer(np.diff(ys), np.diff(xs)).reshape(-1).astype(float)
+    count = block_sums(mask)[:, 0] / 255.0
+    skin = count >= area * 0.1
+    means = block_sums(cv2.bitwise_and(crop, crop, mask=mask))
+    if not np.all(skin):
+        means[~skin] = block_sums(crop)[~skin]
+    means /= np.where(skin, count, area)[:, None]
+    out = np.empty((grid * grid, REGION_WIDTH))
+    out[:, :3] = means[:, ::-1]
+    out[:, 3] = count / area
+    return out
+
+
+def pos_regions(rgb):
+    """
+    Whole-window POS pulse of every region at once, as calculate_pos_signal
+    does for the fused trace. ``rgb`` is (T, n_regions, 3); returns
+    (n_regions, T). Regions with a zero channel mean give a zero row.
+    """
+    rgb = np.asarray(rgb, dtype=float)
+    mean = rgb.mean(axis=0)
+    valid = np.all(mean > 0, axis=1)
+    cn = rgb / np.where(mean > 0, mean, 1.0)
+    s1 = cn[:, :, 1] - cn[:, :, 2]
+    s2 = cn[:, :, 1] + cn[:, :, 2] - 2 * cn[:, :, 0]
+    std_s2 = s2.std(axis=0)
+    alpha = np.divide(s1.std(axis=0), std_s2, out=np.zeros_like(std_s2), where=std_s2 > 0)
+    h = s1 + alpha * s2
+    h[:, ~valid] = 0.0
+    return h.T
+
+
+def snr_score(snr_db):
+    """
+    Map band SNR in dB to the 0-100 score reported to clients (> 6 dB is
+    usually decent).
+    """
+    return np.clip((np.asarray(snr_db) + 5.0) / 15.0 * 100.0, 0.0, 100.0)
+
+
+# Detector used when the configured backend cannot be loaded (e.g. missing
+# model files); backends already reported as unavailable in this process
+FALLBACK_DETECTOR = "dlib_hog"
+_UNAVAILABLE_DETECTORS = set()
+
+
+# Per-frame stages of RPPGService.process_frame, in order; each one is a
+# ``<name>_stage(job)`` method
+FRAME_STAGES = ("decode", "localise", "roi_means", "signal", "vitals")
+
+
+class FrameJob:
+    """
+    One frame on its way through the FRAME_STAGES. Each stage fills in its
+    fields; a stage that finds no face or no usable ROI sets ``quality`` and
+    leaves ``row`` empty, and the later stages pass the frame through.
+    """
+
+    __slots__ = ("data", "received_at", "frame", "header", "captured", "origin", "face", "crop_box",
+                 "roi", "row", "regions", "quality", "result")
+
+    def __init__(self, data, received_at=None):
+        self.data = data
+        self.received_at = received_at
+        self.frame = None
+        self.header = None
+        self.captured = None
+        self.origin = (0, 0)
+        self.face = None
+        self.crop_box = None
+        self.roi = None
+        self.row = None
+        self.regions = None
+        self.quality = None
+        self.result = None
+
+
+# Format of RPPGService.snapshot(); snapshots of another version are ignored
+SNAPSHOT_VERSION = 1
+
 
 class RPPGService:
     def __init__(self):
-        # 使用Dlib的HOG+SVM人脸检测器
-        self.detector = dlib.get_frontal_face_detector()
+        # Face detector backend, shared per process and loaded on first use
+        # (default from settings.face_detector, e.g. Dlib的HOG+SVM人脸检测器)
+        self.detector_name = None
+        self._detector = None
+        # Backend asked for but unavailable when a fallback is in use
+        self.detector_fallback_from = None
         self.buffer_size = 300  # ~10 seconds at 30fps
         
-        # Buffers for POS
-        self.raw_red_buffer = []
-        self.raw_green_buffer = []
-        self.raw_blue_buffer = []
+        # Raw R, G, B and lighting samples, one row per frame (see COL_*)
+        self.samples = RingBuffer(self.buffer_size, width=4)
         
-        self.signal_buffer = []      # Processed rPPG signal
-        self.lighting_buffer = []
+        self.signal_buffer = np.zeros(0)      # Processed rPPG signal
         self.fps = 30.0 
         self._last_frame_ts = None
+        # Samples are placed on a uniform grid by capture time; self.fps is
+        # then the grid rate, and the EMA only tracks the capture rate
+        self.resample_mode = "linear"
+        self.resampler = UniformResampler(self.resample_mode)
+        self.capture_fps = 30.0
+        # Header of the last raw pixel frame (None for encoded images)
+        self.last_frame_header = None
+        # Face-crop uploads: processing-coordinate origin of the current
+        # image in the full frame, and the crop asked of the client
+        self.upload_mode = "full"
+        self._origin = (0, 0)
+        self.crop_box = None
         self.bpm_history = [] 
         self.max_history_len = 5 
         self.sensitivity = 75
         self.motion_rejection = 40
+        self.spectrum_mode = "batch"
+        self._sdft = None
+
+        # Streaming filter stage: per-sample POS, band-passed BVP and respiration
+        self.filter_mode = "filtfilt"
+        self.filtered = RingBuffer(self.buffer_size, width=3)
+        self._bvp_filter = None
+        self._resp_filter = None
+        self._filtered_evicted = None
+
+        # Vitals cadence: cached values between evaluations, on a clock that
+        # advances by one sample period per appended sample
+        self.scheduler = VitalsScheduler()
+        self._vitals = dict(EMPTY_VITALS)
+        self._stream_time = 0.0
+
+        # ROI layout; in grid mode the per-region samples are kept alongside
+        # the fused ones, REGION_WIDTH columns per region
+        self.roi_mode = "fixed"
+        self.roi_grid = ROI_GRID
+        self.regions = None
+        self.region_weights = None
+
+        # Skin classifier: None uses DEFAULT_SKIN_LUT; with skin_calibration a
+        # table is fitted to the first face of the session
+        self.skin_lut = None
+        self.skin_morphology = True
+        self.skin_calibration = False
+        # Or a shared segmentation network (segmentation.SEGMENTATION_BACKENDS)
+        self.skin_model = "lut"
+        self._segmenter = None
+
+        # Face localisation: detect-once-then-track
+        self.localisation_mode = "track"
+        self.detect_interval = DETECT_INTERVAL
+        self.tracker = FaceTracker()
+        self._frames_since_detect = 0
+        self._last_face_width = None
+        self._missed_detections = 0
+        self.timings = StageTimings()
+        self.report_timings = False
         
         # Kalman Filter State
         self.kalman_x = 0.0 # Estimate
@@ -31,7 +299,11 @@ class RPPGService:
         self.kalman_q = 0.0001 # Process noise covariance
         self.kalman_r = 0.1 # Measurement noise covariance
 
-    def configure(self, sensitivity=None, motion_rejection=None):
+    def configure(self, sensitivity=None, motion_rejection=None, spectrum_mode=None, filter_mode=None,
+                  vitals_cadence=None, localisation_mode=None, detect_interval=None,
+                  report_timings=None, face_detector=None, roi_mode=None, roi_grid=None,
+                  skin_morphology=None, skin_calibration=None, upload_mode=None, skin_model=None,
+                  resample_mode=None):
         if sensitivity is not None:
             try:
                 v = float(sensitivity)
@@ -46,6 +318,218 @@ class RPPGService:
                 self.motion_rejection = v
             except Exception:
                 pass
+        if spectrum_mode is not None and spectrum_mode in SPECTRUM_MODES:
+            if spectrum_mode != self.spectrum_mode:
+                self._sdft = None
+            self.spectrum_mode = spectrum_mode
+        if filter_mode is not None and filter_mode in FILTER_MODES:
+            if filter_mode != self.filter_mode:
+                self._bvp_filter = None
+                self._sdft = None
+            self.filter_mode = filter_mode
+        # A new motion_rejection changes the filter order; the streaming stage
+        # notices on the next sample and re-filters its history.
+        if isinstance(vitals_cadence, dict):
+            self.scheduler.configure(vitals_cadence)
+        if localisation_mode is not None and localisation_mode in LOCALISATION_MODES:
+            self.localisation_mode = localisation_mode
+        if detect_interval is not None:
+            try:
+                self.detect_interval = int(max(1, min(300, int(detect_interval))))
+            except Exception:
+                pass
+        if report_timings is not None:
+            self.report_timings = bool(report_timings)
+        if face_detector is not None and face_detector in DETECTOR_BACKENDS:
+            try:
+                self._load_detector(face_detector)
+            except Exception:
+                pass
+        if roi_mode is not None and roi_mode in ROI_MODES:
+            if roi_mode != self.roi_mode:
+                # Region history must be contiguous in time
+                self.regions = None
+                self.region_weights = None
+            self.roi_mode = roi_mode
+        if roi_grid is not None:
+            try:
+                grid = int(max(2, min(16, int(roi_grid))))
+                if grid != self.roi_grid:
+                    self.regions = None
+                    self.region_weights = None
+                self.roi_grid = grid
+            except Exception:
+                pass
+        if skin_morphology is not None:
+            self.skin_morphology = bool(skin_morphology)
+        if skin_calibration is not None:
+            self.skin_calibration = bool(skin_calibration)
+            # (Re)calibrate on the next face, or go back to the fixed bounds
+            self.skin_lut = None
+        if upload_mode is not None and upload_mode in UPLOAD_MODES:
+            self.upload_mode = upload_mode
+            self.crop_box = None
+        if resample_mode is not None and resample_mode in RESAMPLE_MODES and resample_mode != self.resample_mode:
+            self.resample_mode = resample_mode
+            self.resampler = UniformResampler(resample_mode)
+        if skin_model == "lut":
+            self.skin_model = skin_model
+            self._segmenter = None
+        elif skin_model is not None and skin_model in SEGMENTATION_BACKENDS:
+            try:
+                self._segmenter = get_segmenter(skin_model)
+                self.skin_model = skin_model
+            except Exception:
+                pass
+
+    def apply_config(self, payload):
+        """
+        Apply a client "config" message (camelCase keys, unknown ones ignored).
+        """
+        self.configure(
+            sensitivity=payload.get("rPPGSensitivity"),
+            motion_rejection=payload.get("motionRejection"),
+            spectrum_mode=payload.get("spectrumMode"),
+            filter_mode=payload.get("filterMode"),
+            vitals_cadence=payload.get("vitalsCadence"),
+            localisation_mode=payload.get("localisationMode"),
+            detect_interval=payload.get("detectInterval"),
+            report_timings=payload.get("reportTimings"),
+            face_detector=payload.get("faceDetector"),
+            roi_mode=payload.get("roiMode"),
+            roi_grid=payload.get("roiGrid"),
+            skin_morphology=payload.get("skinMorphology"),
+            skin_calibration=payload.get("skinCalibration"),
+            upload_mode=payload.get("uploadMode"),
+            skin_model=payload.get("skinModel"),
+            resample_mode=payload.get("resampleMode"),
+        )
+
+    def snapshot(self):
+        """
+        Compact, picklable session state for resuming in a new service after
+        a reconnect: configuration, the sample buffers, fps estimates, bpm
+        history and the tracked face. Filter states, spectra and pending
+        resampler input are not kept; restore() rebuilds them.
+        """
+        return {
+            "version": SNAPSHOT_VERSION,
+            "config": {
+                "sensitivity": self.sensitivity,
+                "motion_rejection": self.motion_rejection,
+                "spectrum_mode": self.spectrum_mode,
+                "filter_mode": self.filter_mode,
+                "vitals_cadence": dict(self.scheduler.cadence),
+                "localisation_mode": self.localisation_mode,
+                "detect_interval": self.detect_interval,
+                "report_timings": self.report_timings,
+                "face_detector": self.detector_name,
+                "roi_mode": self.roi_mode,
+                "roi_grid": self.roi_grid,
+                "skin_morphology": self.skin_morphology,
+                "skin_calibration": self.skin_calibration,
+                "upload_mode": self.upload_mode,
+                "skin_model": self.skin_model,
+                "resample_mode": self.resample_mode,
+            },
+            "samples": self.samples.view().copy(),
+            "regions": None if self.regions is None else self.regions.view().copy(),
+            "fps": self.fps,
+            "capture_fps": self.capture_fps,
+            "resample_fs": self.resampler.fs,
+            "stream_time": self._stream_time,
+            "vitals": dict(self._vitals),
+            "bpm_history": list(self.bpm_history),
+            "kalman": (self.kalman_x, self.kalman_p),
+            "face": self.tracker.state(),
+            "face_width": self._last_face_width,
+            "origin": self._origin,
+            "crop_box": self.crop_box,
+            "skin_lut": None if self.skin_lut is None else (self.skin_lut.table, self.skin_lut.bits),
+        }
+
+    def restore(self, snapshot):
+        """
+        Continue from a snapshot() of an earlier session, so readings resume
+        with the next frame instead of after another warm-up. Returns False
+        (and changes nothing) for a snapshot of another format version.
+        """
+        if not snapshot or snapshot.get("version") != SNAPSHOT_VERSION:
+            return False
+        self.configure(**snapshot["config"])
+        samples = np.asarray(snapshot["samples"], dtype=float).reshape(-1, 4)
+        self.samples.clear()
+        self.samples.extend(samples)
+        regions = snapshot["regions"]
+        self.regions = None
+        self.region_weights = None
+        if regions is not None and len(regions) == len(samples):
+            self.regions = RingBuffer(self.buffer_size, width=regions.shape[1])
+            self.regions.extend(regions)
+        self.fps = float(snapshot["fps"])
+        self.capture_fps = float(snapshot["capture_fps"])
+        self.resampler.fs = snapshot["resample_fs"]
+        self._last_frame_ts = None
+        self._stream_time = float(snapshot["stream_time"])
+        # Every metric is due again with the first new sample
+        self.scheduler.reset()
+        self._vitals = dict(snapshot["vitals"])
+        self.bpm_history = list(snapshot["bpm_history"])
+        self.kalman_x, self.kalman_p = snapshot["kalman"]
+        self.tracker.set_state(snapshot["face"])
+        self._frames_since_detect = 0
+        self._last_face_width = snapshot["face_width"]
+        self._origin = tuple(snapshot["origin"])
+        self.crop_box = snapshot["crop_box"]
+        if snapshot["skin_lut"] is not None:
+            self.skin_lut = SkinLUT(*snapshot["skin_lut"])
+        self.filtered.clear()
+        self._bvp_filter = None
+        self._resp_filter = None
+        if self.filter_mode == "streaming" and len(self.samples):
+            self._rebuild_streaming_filters(self._filter_order())
+        self._sdft = None
+        self._filtered_evicted = None
+        self._update_sliding_spectrum(None, None)
+        return True
+
+    @property
+    def detector(self):
+        if self._detector is None:
+            self._load_detector(self.detector_name or settings.face_detector)
+        return self._detector
+
+    def _load_detector(self, name):
+        """
+        Switch to the shared detector of a backend, or to FALLBACK_DETECTOR
+        when that backend cannot be loaded (reported once per process).
+        """
+        try:
+            detector = get_detector(name)
+            self.detector_fallback_from = None
+        except DetectorUnavailable as e:
+            if name == FALLBACK_DETECTOR:
+                raise
+            if name not in _UNAVAILABLE_DETECTORS:
+                _UNAVAILABLE_DETECTORS.add(name)
+                print(f"Face detector {name} unavailable ({e}); using {FALLBACK_DETECTOR}")
+            detector = get_detector(FALLBACK_DETECTOR)
+            self.detector_fallback_from = name
+            name = FALLBACK_DETECTOR
+        self._detector = detector
+        self.detector_name = name
+
+    @detector.setter
+    def detector(self, detector):
+        self._detector = detector
+
+    @property
+    def shares_batches(self):
+        """
+        Whether the face detector or skin segmentation network in use batches
+        inference across sessions (BatchedDetector / BatchedSegmenter).
+        """
+        return isinstance(self.detector, BatchedDetector) or isinstance(self._segmenter, BatchedSegmenter)
 
     def _required_snr(self):
         s = float(self.sensitivity)
@@ -67,21 +551,19 @@ class RPPGService:
 
     def skin_segmentation(self, roi):
         """
-        Apply skin segmentation using YCrCb color space
+        Apply skin segmentation with the session's skin lookup table (the
+        YCrCb bounds, or a table calibrated on the first face), or with the
+        segmentation network when one is configured
         """
         try:
-            ycrcb = cv2.cvtColor(roi, cv2.COLOR_BGR2YCrCb)
-            # Define skin color range in YCrCb
-            lower = np.array([0, 133, 77], dtype=np.uint8)
-            upper = np.array([255, 173, 127], dtype=np.uint8)
-            
-            mask = cv2.inRange(ycrcb, lower, upper)
-            
+            if self._segmenter is not None:
+                return self._segmenter.segment(roi)
+            mask = (self.skin_lut or DEFAULT_SKIN_LUT).classify(roi)
+
             # Morphological operations to remove noise
-            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-            mask = cv2.erode(mask, kernel, iterations=1)
-            mask = cv2.dilate(mask, kernel, iterations=1)
-            
+            if self.skin_morphology:
+                mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, _SKIN_KERNEL)
+
             return mask
         except Exception:
             return np.ones(roi.shape[:2], dtype=np.uint8) * 255
@@ -132,145 +614,623 @@ class RPPGService:
              
         return (r_mean, g_mean, b_mean)
         
-    def process_frame(self, frame_data: bytes):
+    def calibrate_skin(self, frame, face):
+        """
+        Fit the session's skin table to the centre of a face box (nose and
+        inner cheeks, away from eyes, hair and background).
+        """
+        fx, fy, fw, fh = face
+        x, y, w, h = _clip_box((fx + fw * 0.3, fy + fh * 0.4, fw * 0.4, fh * 0.35), frame.shape)
+        lut = SkinLUT.calibrate(frame[y:y + h, x:x + w])
+        if lut is not None:
+            self.skin_lut = lut
+        return lut is not None
+
+    def extract_grid(self, frame, face):
+        """
+        Per-region (r, g, b, skin fraction) rows for a roi_grid x roi_grid
+        layout over the face box, or None when the box is too small.
+        """
+        x, y, w, h = _clip_box(face, frame.shape)
+        if w < self.roi_grid or h < self.roi_grid:
+            return None
+        crop = frame[y:y + h, x:x + w]
+        return grid_means(crop, self.skin_segmentation(crop), self.roi_grid)
+
+    def extract_rois(self, frame, rois):
+        """
+        Mean RGB per ROI. The fused pass segments the whole region spanned by
+        the ROIs, so it only pays off when they cover enough of it (dense or
+        overlapping layouts); sparse layouts are cheaper ROI by ROI.
+        """
+        r = np.asarray(rois, dtype=float).reshape(-1, 4)
+        if len(r) == 0:
+            return []
+        span = (np.max(r[:, 0] + r[:, 2]) - np.min(r[:, 0])) * (np.max(r[:, 1] + r[:, 3]) - np.min(r[:, 1]))
+        if span > 0 and np.sum(r[:, 2] * r[:, 3]) >= FUSED_ROI_MIN_COVERAGE * span:
+            return self.extract_rois_fused(frame, rois)
+        return [self.extract_roi_means(frame, rx, ry, rw, rh) for (rx, ry, rw, rh) in rois]
+
+    def extract_rois_fused(self, frame, rois):
+        """
+        Mean RGB of any number of ROIs in one pass: colour conversion, skin
+        mask and morphology run once over the region covering all ROIs, then
+        integral images of mask*B, mask*G, mask*R and the mask give each ROI
+        sum in O(1). Same fallback as extract_roi_means (plain mean when under
+        10% of the ROI is skin). Returns (r, g, b) or None per ROI.
+        """
+        if len(rois) == 0:
+            return []
+        H, W = frame.shape[:2]
+        # Same clamping as extract_roi_means, as [x1, y1, x2, y2] rows
+        boxes = []
+        for (rx, ry, rw, rh) in rois:
+            x, y = min(W, max(0, int(rx))), min(H, max(0, int(ry)))
+            boxes.append((x, y, max(x, min(W, x + int(rw))), max(y, min(H, y + int(rh)))))
+        ox = min(b[0] for b in boxes)
+        oy = min(b[1] for b in boxes)
+        ex = max(b[2] for b in boxes)
+        ey = max(b[3] for b in boxes)
+        if ex <= ox or ey <= oy:
+            return [None] * len(boxes)
+
+        crop = frame[oy:ey, ox:ex]
+        mask = self.skin_segmentation(crop)
+        skin = cv2.bitwise_and(crop, crop, mask=mask)
+        b = np.asarray(boxes) - (ox, oy, ox, oy)
+        area = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+        x1, y1, x2, y2 = b.T
+
+        def box_sums(image):
+            ii = cv2.integral(image, sdepth=cv2.CV_32S)
+            return (ii[y2, x2] - ii[y1, x2] - ii[y2, x1] + ii[y1, x1]).astype(float)
+
+        masked = box_sums(skin)
+        count = box_sums(mask) / 255.0
+        # Fallback to full ROI mean if segmentation fails (e.g. low light)
+        fallback = count < area * 0.1
+        if np.any(fallback & (area > 0)):
+            masked[fallback] = box_sums(crop)[fallback]
+            count[fallback] = area[fallback]
+        means = masked / np.maximum(count, 1e-9)[:, None]
+        return [None if area[i] == 0 else (means[i, 2], means[i, 1], means[i, 0]) for i in range(len(boxes))]
+
+    def process_frame(self, frame_data: bytes, received_at=None):
         """
         Process a single frame: Detect face -> Multi-ROI Extraction -> POS Algorithm -> Filtering
+
+        The frame rate is estimated from the capture timestamp in the frame
+        header, else from ``received_at`` (arrival time in seconds), so frames
+        that waited in a queue do not skew it.
+
+        Runs the FRAME_STAGES one after the other; pipeline.FramePipeline runs
+        them concurrently across consecutive frames.
         """
-        # 1. Decode image
-        nparr = np.frombuffer(frame_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if frame is None:
+        job = FrameJob(frame_data, received_at)
+        for stage in FRAME_STAGES:
+            getattr(self, stage + "_stage")(job)
+        return job.result
+
+    def decode_stage(self, job):
+        """
+        Decode image (raw pixels, or an encoded image downscaled while
+        decoding when oversized). Touches no session state.
+        """
+        t0 = time.perf_counter()
+        job.frame, job.header = read_frame(job.data)
+        job.data = None
+        if job.frame is None:
+            return
+        header = job.header
+        if header is not None and header.timestamp > 0:
+            job.captured = header.timestamp / 1000.0
+        else:
+            job.captured = time.time() if job.received_at is None else job.received_at
+        self.timings.since("decode", t0)
+
+    def localise_stage(self, job):
+        """
+        Face detection / tracking, the crop to ask for next and, once per
+        session, skin calibration.
+        """
+        if job.frame is None:
+            return
+        frame = job.frame
+        # Crops are processed in their own coordinates; keep the tracker there
+        origin = self._frame_origin(job.header)
+        if origin != self._origin:
+            self.tracker.shift(self._origin[0] - origin[0], self._origin[1] - origin[1])
+            self._origin = origin
+        job.origin = origin
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        face = self.locate_face(gray, frame)
+        job.crop_box = self._crop_request(face, job.header)
+        if face is None:
+            job.quality = "No Face"
+            return
+        job.face = face
+
+        if self.skin_calibration and self.skin_lut is None:
+            self.calibrate_skin(frame, face)
+
+    def roi_means_stage(self, job):
+        """
+        Multi-ROI extraction: the fused (r, g, b, lighting) sample and, in
+        grid mode, the per-region rows.
+        """
+        if job.face is None:
+            return
+        t0 = time.perf_counter()
+        frame, face = job.frame, job.face
+        fx, fy, fw, fh = face
+
+        if self.roi_mode == "grid":
+            regions = self.extract_grid(frame, face)
+            if regions is None:
+                job.quality = "ROI Error"
+                return
+            # Fused trace (SpO2, respiration, lighting) from the skin blocks
+            skin = regions[:, 3] >= 0.1
+            r_mean, g_mean, b_mean = regions[skin if np.any(skin) else slice(None), :3].mean(axis=0)
+            job.regions = regions
+            job.roi = face
+        else:
+            # Define ROIs: Forehead, Left Cheek, Right Cheek
+            rois_defs = [
+                (fx + fw * 0.25, fy + fh * 0.1, fw * 0.5, fh * 0.2), # Forehead
+                (fx + fw * 0.1, fy + fh * 0.55, fw * 0.2, fh * 0.2), # Left Cheek
+                (fx + fw * 0.7, fy + fh * 0.55, fw * 0.2, fh * 0.2)  # Right Cheek
+            ]
+
+            r_sum, g_sum, b_sum = 0.0, 0.0, 0.0
+            valid_rois = 0
+
+            for means in self.extract_rois(frame, rois_defs):
+                if means:
+                    r_sum += means[0]
+                    g_sum += means[1]
+                    b_sum += means[2]
+                    valid_rois += 1
+
+            if valid_rois == 0:
+                job.quality = "ROI Error"
+                return
+
+            # Average the means (Spatial Fusion)
+            r_mean = r_sum / valid_rois
+            g_mean = g_sum / valid_rois
+            b_mean = b_sum / valid_rois
+            job.roi = rois_defs[0]
+
+        # Lighting calculation (Gray mean)
+        lighting_mean = (r_mean * 0.299 + g_mean * 0.587 + b_mean * 0.114)
+        job.row = (r_mean, g_mean, b_mean, lighting_mean)
+        # The image is not needed past this stage
+        job.frame = None
+        self.timings.since("roi", t0)
+
+    def signal_stage(self, job):
+        """
+        Frame rate update and buffer append, strictly in frame order.
+        """
+        if job.captured is None:
+            return
+        t0 = time.perf_counter()
+        self._update_fps(job.captured)
+        if job.row is None:
+            return
+        self._ingest([job.captured], [job.row], None if job.regions is None else [job.regions])
+        self.timings.since("signal", t0)
+
+    def vitals_stage(self, job):
+        """
+        Vitals (on their own cadence) and the result dict of the frame.
+        """
+        self.last_frame_header = job.header
+        if job.captured is None:
+            # Undecodable frame
+            job.result = None
+            return
+        self.crop_box = job.crop_box
+        if job.row is None:
+            job.result = self._result({
+                "bpm": 0, "spo2": 0, "resp_rate": 0, "snr": 0, "lighting": 0, "quality": job.quality
+            })
+            return
+
+        t0 = time.perf_counter()
+        vitals = self.compute_vitals()
+        self.timings.since("vitals", t0)
+
+        # Return Main ROI for visualization
+        ox, oy = job.origin
+        roi = job.roi
+        result = self._vitals_result(vitals)
+        result["roi"] = [int(roi[0]) + ox, int(roi[1]) + oy, int(roi[2]), int(roi[3])]
+        job.result = self._result(result)
+
+    def _detection_scales(self, width):
+        """
+        (scale, upsample) attempts in order: a downscaled pass sized from the
+        last face found, then full resolution with one upsample (the original
+        behaviour, which also finds what a plain full-resolution pass would),
+        skipped during a run of misses except every DETECT_ESCALATE_EVERY-th.
+        Backends with a fixed network input get a single full-resolution pass.
+        """
+        if self.detector.fixed_input:
+            return [(1.0, 0)]
+        if self._last_face_width:
+            scale = DETECT_FACE_WIDTH / float(self._last_face_width)
+        else:
+            scale = DETECT_FIRST_WIDTH / float(width)
+        attempts = []
+        if scale < 0.9:
+            attempts.append((scale, 0))
+        if not attempts or self._missed_detections % DETECT_ESCALATE_EVERY == 0:
+            attempts.append((1.0, 1))
+        return attempts
+
+    def detect_faces(self, gray, frame=None):
+        """
+        Run the detector with the adaptive scale policy. Returns (x, y, w, h)
+        boxes in full-resolution coordinates.
+        """
+        detector = self.detector
+        source = frame if detector.wants_color and frame is not None else gray
+        for scale, upsample in self._detection_scales(gray.shape[1]):
+            if scale < 1.0:
+                image = cv2.resize(source, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            else:
+                image = source
+            # upsample表示向上采样次数以检测更小的人脸
+            faces = detector.detect(image, upsample)
+            if len(faces) > 0:
+                # 映射回原分辨率
+                boxes = [
+                    (int(round(x / scale)), int(round(y / scale)),
+                     int(round(w / scale)), int(round(h / scale)))
+                    for (x, y, w, h) in faces
+                ]
+                self._last_face_width = boxes[0][2]
+                self._missed_detections = 0
+                return boxes
+        # The last face width still sizes the next attempt
+        self._missed_detections += 1
+        return []
+
+    def process_batch_message(self, data, received_at=None):
+        """
+        Ingest a frame burst message (see frames.parse_batch_message). Returns
+        the result dict for the burst, or None if unreadable.
+        """
+        try:
+            frames = parse_batch_message(data)
+        except ValueError:
+            return None
+        if not frames:
+            return None
+        return self.process_batch(frames, received_at)
+
+    def process_batch(self, frames, received_at=None):
+        """
+        Process several timestamped frames at once: decode, localisation and
+        ROI means frame by frame (the tracker follows the face through the
+        burst), then all samples go into the buffers as one block and the
+        vitals stage runs once. Returns the result of the newest frame, or
+        None if no frame could be decoded.
+        """
+        jobs = []
+        for data in frames:
+            job = FrameJob(data, received_at)
+            self.decode_stage(job)
+            self.localise_stage(job)
+            self.roi_means_stage(job)
+            if job.captured is not None:
+                jobs.append(job)
+        if not jobs:
+            self.last_frame_header = None
+            return None
+
+        t0 = time.perf_counter()
+        for job in jobs:
+            self._update_fps(job.captured)
+        sampled = [job for job in jobs if job.row is not None]
+        if sampled:
+            regions = None if sampled[0].regions is None else [job.regions for job in sampled]
+            self._ingest([job.captured for job in sampled], [job.row for job in sampled], regions)
+        self.timings.since("signal", t0)
+
+        self.vitals_stage(jobs[-1])
+        return jobs[-1].result
+
+    def process_means_message(self, data):
+        """
+        Ingest a ROI means message (see frames.parse_means_message): clients
+        that locate the face and average the ROIs themselves send batches of
+        per-frame means, which skip decode, detection and ROI extraction.
+        Returns the result dict for the batch, or None if unreadable.
+        """
+        try:
+            parsed = parse_means_message(data)
+        except ValueError:
+            return None
+        if parsed is None:
             return None
+        header, records = parsed
+        self.last_frame_header = None
+        result = self.process_means(records["timestamp"], records["rgb"])
+        if header.count:
+            result["seq"] = (header.seq + header.count - 1) & 0xFFFFFFFF
+        return result
 
-        h, w = frame.shape[:2]
-        max_w = 640
-        if w > max_w:
-            scale = max_w / float(w)
-            new_w = max_w
-            new_h = max(1, int(h * scale))
-            frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_AREA)
+    def process_means(self, timestamps, rgb):
+        """
+        Feed per-frame ROI means straight into the signal buffers and run the
+        vitals stage once for the batch. ``timestamps`` are capture times in
+        ms, ``rgb`` is (n_frames, n_regions, 3); several regions are fused
+        like the fixed ROIs, or kept per region in grid mode.
+        """
+        rgb = np.asarray(rgb, dtype=float)
+        if rgb.ndim == 2:
+            rgb = rgb[:, None, :]
+        t0 = time.perf_counter()
+        times, rows, grid = [], [], []
+        for ts, means in zip(timestamps, rgb):
+            valid = np.all(np.isfinite(means), axis=1) & np.any(means > 0, axis=1)
+            if not np.any(valid):
+                continue
+            self._update_fps(float(ts) / 1000.0)
+            r_mean, g_mean, b_mean = means[valid].mean(axis=0)
+            times.append(float(ts) / 1000.0)
+            rows.append((r_mean, g_mean, b_mean, r_mean * 0.299 + g_mean * 0.587 + b_mean * 0.114))
+            if self.roi_mode == "grid" and len(means) > 1:
+                regions = np.empty((len(means), REGION_WIDTH))
+                regions[:, :3] = np.where(valid[:, None], means, 0.0)
+                regions[:, 3] = valid
+                grid.append(regions)
+        if times:
+            self._ingest(times, rows, grid or None)
+        t0 = self.timings.since("signal", t0)
 
-        now = time.time()
+        vitals = self.compute_vitals()
+        self.timings.since("vitals", t0)
+        return self._result(self._vitals_result(vitals))
+
+    def _update_fps(self, now):
+        """
+        Frame rate EMA from the arrival (or capture) time of each frame, in
+        seconds. It is the sample rate unless samples are resampled.
+        """
         if self._last_frame_ts is not None:
             dt = now - self._last_frame_ts
             if dt > 1e-6:
                 inst_fps = 1.0 / dt
                 inst_fps = float(min(60.0, max(5.0, inst_fps)))
-                self.fps = float(0.9 * self.fps + 0.1 * inst_fps)
+                self.capture_fps = float(0.9 * self.capture_fps + 0.1 * inst_fps)
+                if self.resample_mode == "off":
+                    self.fps = self.capture_fps
         self._last_frame_ts = now
 
-        # 2. Face Detection
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        # 使用Dlib的HOG+SVM检测器，参数1表示向上采样1次以检测更小的人脸
-        faces = self.detector(gray, 1)
-        
+    def _ingest(self, times, rows, regions=None):
+        """
+        Append captured samples (capture ``times`` in seconds, (r, g, b,
+        lighting) ``rows`` and optionally the grid mode region rows of each),
+        through the uniform resampler unless it is off.
+        """
+        rows = np.asarray(rows, dtype=float).reshape(len(times), -1)
+        if regions is not None:
+            rows = np.hstack([rows, np.asarray(regions, dtype=float).reshape(len(times), -1)])
+        if self.resample_mode != "off":
+            rows = self.resampler.push(times, rows)
+            if self.resampler.fs is not None:
+                self.fps = self.resampler.fs
+        # Blocks end where a vitals metric falls due, so cadenced metrics see
+        # the same buffers as with samples arriving one by one
+        i = 0
+        while i < len(rows):
+            k = min(i + self._samples_until_vitals(len(rows) - i), i + self.samples.capacity - POS_WINDOW)
+            block = rows[i:max(k, i + 1)]
+            self._append_samples(block[:, :4], block[:, 4:] if block.shape[1] > 4 else None)
+            self.compute_vitals(final=False)
+            i += len(block)
+
+    def _samples_until_vitals(self, limit):
+        """
+        Samples (1..limit) that can be appended before compute_vitals has
+        anything to evaluate: the end of warm-up, or the next due time.
+        """
+        warm = self.fps * self._min_seconds_needed()
+        count = len(self.samples)
+        if count <= warm:
+            need = int(np.floor(warm - count)) + 1
+            if count + need > self.samples.capacity:
+                return limit
+            return max(1, min(limit, need))
+        next_due = self.scheduler.next_due()
+        if next_due is None:
+            return 1
+        # Same repeated addition as _append_sample
+        clock = np.add.accumulate(np.r_[self._stream_time, np.full(limit, 1.0 / self.fps)])[1:]
+        hit = np.flatnonzero(clock >= next_due)
+        return int(hit[0]) + 1 if hit.size else limit
+
+    def _vitals_result(self, vitals):
+        snr = vitals["snr"]
+        return {
+            "bpm": round(vitals["bpm"], 1),
+            "spo2": round(vitals["spo2"], 1),
+            "resp_rate": round(vitals["resp_rate"], 1),
+            "snr": round(snr, 1), 
+            "lighting": round(vitals["lighting"], 1),
+            "quality": "Good" if snr > max(20.0, self._required_snr() + 8.0) else "Fair" if snr > self._required_snr() else "Poor",
+        }
+
+    def _frame_origin(self, header):
+        if header is None or (header.offset_x == 0 and header.offset_y == 0):
+            return (0, 0)
+        scale = frame_scale(header)
+        return (int(round(header.offset_x * scale)), int(round(header.offset_y * scale)))
+
+    def _crop_request(self, face, header):
+        """
+        Padded face box [x, y, w, h] in the client's frame coordinates for
+        the next upload, or None to ask for a full frame (no face, or frames
+        without the raw frame header, whose full size is unknown).
+        """
+        if self.upload_mode != "crop" or face is None or header is None:
+            return None
+        scale = frame_scale(header)
+        x, y, w, h = face
+        pad_x = w * CROP_PAD
+        pad_y = h * CROP_PAD
+        x1 = max(0, int((x + self._origin[0] - pad_x) / scale)) & ~1
+        y1 = max(0, int((y + self._origin[1] - pad_y) / scale)) & ~1
+        x2 = min(header.full_width, int(np.ceil((x + self._origin[0] + w + pad_x) / scale)))
+        y2 = min(header.full_height, int(np.ceil((y + self._origin[1] + h + pad_y) / scale)))
+        # Even sizes keep 4:2:0 crops valid
+        w2 = (x2 - x1) & ~1
+        h2 = (y2 - y1) & ~1
+        if w2 <= 0 or h2 <= 0:
+            return None
+        return [x1, y1, w2, h2]
+
+    def _result(self, result):
+        """
+        Per-frame result, tagged with the frame's sequence number (raw frame
+        protocol) and, when asked for, the stage timings. The face detector
+        in use is named with the timings, and always while it stands in for
+        an unavailable one ("detector_fallback_from").
+        """
+        if self.last_frame_header is not None:
+            result["seq"] = self.last_frame_header.seq
+        if self.upload_mode == "crop":
+            result["crop"] = self.crop_box
+        if self.report_timings:
+            result["timings"] = self.timings.snapshot()
+        if self._detector is not None and (self.report_timings or self.detector_fallback_from):
+            result["detector"] = self._detector.name
+            if self.detector_fallback_from:
+                result["detector_fallback_from"] = self.detector_fallback_from
+        return result
+
+    def locate_face(self, gray, frame=None):
+        """
+        Face box (x, y, w, h) on the grey frame, or None. In "track" mode the
+        detector only runs every ``detect_interval`` frames or when the tracker
+        loses confidence; the frames in between are tracked.
+        """
+        if (self.localisation_mode == "track" and self.tracker.box is not None
+                and self._frames_since_detect < self.detect_interval):
+            t0 = time.perf_counter()
+            box = self.tracker.update(gray)
+            self.timings.since("track", t0)
+            if box is not None:
+                self._frames_since_detect += 1
+                return box
+
+        t0 = time.perf_counter()
+        faces = self.detect_faces(gray, frame)
+        self.timings.since("detect", t0)
+        # Counts this frame, so the detector runs once every detect_interval frames
+        self._frames_since_detect = 1
         if len(faces) == 0:
-            return {
-                "bpm": 0, "spo2": 0, "resp_rate": 0, "snr": 0, "lighting": 0, "quality": "No Face"
-            }
-            
-        # 3. Multi-ROI Extraction
-        # 将Dlib的rectangle对象转换为OpenCV的(x, y, w, h)格式
-        face = faces[0]
-        fx, fy, fw, fh = face.left(), face.top(), face.width(), face.height()
-        
-        # Define ROIs: Forehead, Left Cheek, Right Cheek
-        rois_defs = [
-            (fx + fw * 0.25, fy + fh * 0.1, fw * 0.5, fh * 0.2), # Forehead
-            (fx + fw * 0.1, fy + fh * 0.55, fw * 0.2, fh * 0.2), # Left Cheek
-            (fx + fw * 0.7, fy + fh * 0.55, fw * 0.2, fh * 0.2)  # Right Cheek
-        ]
-        
-        r_sum, g_sum, b_sum = 0.0, 0.0, 0.0
-        valid_rois = 0
-        
-        for (rx, ry, rw, rh) in rois_defs:
-            means = self.extract_roi_means(frame, rx, ry, rw, rh)
-            if means:
-                r_sum += means[0]
-                g_sum += means[1]
-                b_sum += means[2]
-                valid_rois += 1
-        
-        if valid_rois == 0:
-             return {"bpm": 0, "spo2": 0, "resp_rate": 0, "snr": 0, "lighting": 0, "quality": "ROI Error"}
-             
-        # Average the means (Spatial Fusion)
-        r_mean = r_sum / valid_rois
-        g_mean = g_sum / valid_rois
-        b_mean = b_sum / valid_rois
-        
-        # Lighting calculation (Gray mean)
-        lighting_mean = (r_mean * 0.299 + g_mean * 0.587 + b_mean * 0.114)
-        
-        # 4. Update Raw Buffers
-        self.raw_red_buffer.append(r_mean)
-        self.raw_green_buffer.append(g_mean)
-        self.raw_blue_buffer.append(b_mean)
-        self.lighting_buffer.append(lighting_mean)
-        
-        if len(self.raw_red_buffer) > self.buffer_size:
-            self.raw_red_buffer.pop(0)
-            self.raw_green_buffer.pop(0)
-            self.raw_blue_buffer.pop(0)
-            self.lighting_buffer.pop(0)
-            
-        # 5. Calculate Vitals
-        bpm = 0
-        spo2 = 0
-        resp_rate = 0
-        snr = 0
-        lighting = 0
-        
-        if len(self.raw_red_buffer) > self.fps * self._min_seconds_needed():
+            self.tracker.reset()
+            return None
+        box = faces[0]
+        if self.localisation_mode == "track":
+            self.tracker.start(gray, box)
+        return box
+
+    def compute_vitals(self, final=True):
+        """
+        Expensive vitals stage, kept apart from the per-frame work (decode,
+        ROI means, buffer append). Each metric is re-evaluated when the
+        scheduler says it is due on the stream clock; in between the cached
+        value is returned. Before warm-up everything reads 0.
+
+        Samples appended in bulk get a ``final=False`` call after each one,
+        so metrics with a cadence are evaluated at the same stream times
+        however the samples were delivered; metrics with cadence 0 run once
+        per final call.
+        """
+        if len(self.samples) <= self.fps * self._min_seconds_needed():
+            self._vitals = dict(EMPTY_VITALS)
+            self.scheduler.reset()
+            return dict(self._vitals)
+
+        now = self._stream_time
+        vitals = self._vitals
+
+        def due(metric):
+            return (final or self.scheduler.cadence.get(metric, 0.0) > 0) and self.scheduler.due(metric, now)
+
+        if due("bpm"):
+            vitals["bpm"], vitals["snr"] = self.estimate_bpm()
+        if due("spo2"):
+            vitals["spo2"] = self.calculate_spo2()
+        if due("resp_rate"):
+            vitals["resp_rate"] = self.calculate_resp_rate()
+        if due("lighting"):
+            vitals["lighting"] = self.calculate_lighting()
+        return dict(vitals)
+
+    def estimate_bpm(self):
+        """
+        Spectral heart-rate estimate followed by SNR-gated history smoothing.
+        Returns (bpm, snr).
+        """
+        if self._grid_ready():
+            raw_bpm, snr = self.calculate_bpm_snr_grid()
+        elif self._sdft is not None:
+            raw_bpm, snr = self.calculate_bpm_snr_sliding()
+        elif self._streaming_ready():
+            # Already band-passed, continuously
+            bvp = self.filtered.column(COL_BVP)
+            self.signal_buffer = bvp
+            raw_bpm, snr = self.calculate_bpm_snr(bvp, prefiltered=True)
+        else:
             # POS Algorithm & Filtering
             pos_signal = self.calculate_pos_signal()
-            self.signal_buffer = pos_signal.tolist() # Update signal buffer for legacy access if needed
-            
+            self.signal_buffer = pos_signal
             raw_bpm, snr = self.calculate_bpm_snr(pos_signal)
+        
+        # Adaptive Smoothing based on SNR
+        self.max_history_len = self._bpm_smoothing_len()
+        if snr > self._required_snr() and 40 < raw_bpm < 200:
+            self.bpm_history.append(raw_bpm)
+            if len(self.bpm_history) > self.max_history_len:
+                self.bpm_history.pop(0)
+            weights = np.linspace(1, 2, len(self.bpm_history))
+            weights /= weights.sum()
+            bpm = np.sum(np.array(self.bpm_history) * weights)
             
-            # Adaptive Smoothing based on SNR
-            history_len = int(max(3, min(10, round(3 + (self.motion_rejection / 100.0) * 7))))
-            self.max_history_len = history_len
-            if snr > self._required_snr() and 40 < raw_bpm < 200:
-                self.bpm_history.append(raw_bpm)
-                if len(self.bpm_history) > self.max_history_len:
-                    self.bpm_history.pop(0)
-                weights = np.linspace(1, 2, len(self.bpm_history))
-                weights /= weights.sum()
-                bpm = np.sum(np.array(self.bpm_history) * weights)
-                
-                # Update Kalman with the smoothed BPM
-                # bpm = self.apply_kalman(bpm) 
-            else:
-                bpm = self.bpm_history[-1] if self.bpm_history else 0
-            
-            spo2 = self.calculate_spo2()
-            resp_rate = self.calculate_resp_rate()
-            lighting = self.calculate_lighting()
-            
-        # Return Main ROI for visualization
-        main_roi = [int(rois_defs[0][0]), int(rois_defs[0][1]), int(rois_defs[0][2]), int(rois_defs[0][3])]
-            
-        return {
-            "bpm": round(bpm, 1),
-            "spo2": round(spo2, 1),
-            "resp_rate": round(resp_rate, 1),
-            "snr": round(snr, 1), 
-            "lighting": round(lighting, 1),
-            "quality": "Good" if snr > max(20.0, self._required_snr() + 8.0) else "Fair" if snr > self._required_snr() else "Poor",
-            "roi": main_roi
-        }
+            # Update Kalman with the smoothed BPM
+            # bpm = self.apply_kalman(bpm) 
+        else:
+            bpm = self.bpm_history[-1] if self.bpm_history else 0
+        return bpm, snr
+
+    def _bpm_smoothing_len(self):
+        """
+        Estimates in the bpm smoothing window: BPM_SMOOTHING_S by motion
+        rejection, times the rate estimates are made at (the bpm cadence,
+        or the frame rate when it runs every frame).
+        """
+        low, high = BPM_SMOOTHING_S
+        span = low + (high - low) * min(1.0, max(0.0, float(self.motion_rejection) / 100.0))
+        rate = self.scheduler.cadence.get("bpm", 0.0) or self.fps
+        return int(max(1, round(span * rate)))
 
     def calculate_pos_signal(self):
         """
         Plane-Orthogonal-to-Skin (POS) Algorithm
         """
         # Sliding window approach usually, but here we process the whole buffer for simplicity and stability
-        r = np.array(self.raw_red_buffer)
-        g = np.array(self.raw_green_buffer)
-        b = np.array(self.raw_blue_buffer)
+        data = self.samples.view()
+        r = data[:, COL_RED]
+        g = data[:, COL_GREEN]
+        b = data[:, COL_BLUE]
         
         # Temporal Normalization
         # Divide by mean to remove DC component scaling
@@ -305,21 +1265,25 @@ class RPPGService:
         
         return h
 
-    def calculate_bpm_snr(self, signal_data):
+    def calculate_bpm_snr(self, signal_data, prefiltered=False):
         n = len(signal_data)
         if n < int(self.fps * 6):
             return 0.0, 0.0
 
-        # Detrending
-        detrended = signal.detrend(signal_data)
-        
-        # Bandpass Filter (0.7 - 4.0 Hz)
-        # Adaptive: if lighting is poor (check last lighting val), maybe narrow the band?
-        # For now, stick to standard
-        order = int(max(2, min(4, round(2 + (self.motion_rejection / 100.0) * 2))))
-        b, a = signal.butter(order, [0.7, 4.0], btype='bandpass', fs=self.fps)
-        filtered = signal.filtfilt(b, a, detrended)
-        smooth_win = int(max(1, min(5, round(1 + (self.motion_rejection / 100.0) * 4))))
+        if prefiltered:
+            # Output of the streaming filter stage
+            filtered = np.asarray(signal_data, dtype=float)
+        else:
+            # Detrending
+            detrended = signal.detrend(signal_data)
+            
+            # Bandpass Filter (0.7 - 4.0 Hz)
+            # Adaptive: if lighting is poor (check last lighting val), maybe narrow the band?
+            # For now, stick to standard
+            order = self._filter_order()
+            b, a = signal.butter(order, list(HR_BAND), btype='bandpass', fs=self.fps)
+            filtered = signal.filtfilt(b, a, detrended)
+        smooth_win = self._smooth_window()
         if smooth_win > 1:
             kernel = np.ones(smooth_win, dtype=float) / float(smooth_win)
             filtered = np.convolve(filtered, kernel, mode="same")
@@ -339,7 +1303,13 @@ class RPPGService:
         freqs = np.fft.rfftfreq(n, 1 / self.fps)
         power = (np.abs(spectrum) ** 2).astype(float)
 
-        band_mask = (freqs >= 0.7) & (freqs <= 4.0)
+        return self._band_peak_snr(freqs, power)
+
+    def _band_peak_snr(self, freqs, power):
+        """
+        Peak frequency in HR_BAND and its SNR score, shared by both spectrum modes
+        """
+        band_mask = (freqs >= HR_BAND[0]) & (freqs <= HR_BAND[1])
         if not np.any(band_mask):
             return 0.0, 0.0
 
@@ -350,27 +1320,262 @@ class RPPGService:
         bpm = peak_freq * 60.0
 
         # SNR Calculation
-        bw = float(0.18 + (100.0 - float(self.sensitivity)) * 0.0015)
+        bw = self._snr_bandwidth()
         signal_mask = np.abs(band_freqs - peak_freq) <= bw
         signal_power = float(np.sum(band_power[signal_mask]))
         noise_power = float(np.sum(band_power[~signal_mask]))
 
         eps = 1e-12
         snr_db = 10.0 * np.log10((signal_power + eps) / (noise_power + eps))
-        
-        # Map dB to 0-100 score (approximate)
-        # > 6dB is usually decent
-        snr = ((snr_db + 5.0) / 15.0) * 100.0
-        snr = float(min(100.0, max(0.0, snr)))
+        snr = float(snr_score(snr_db))
 
         return bpm, snr
 
+    def _grid_ready(self):
+        return (self.roi_mode == "grid" and self.regions is not None
+                and len(self.regions) >= int(self.fps * 6))
+
+    def calculate_bpm_snr_grid(self):
+        """
+        Grid mode: POS, band-pass and spectrum for all regions as (n_regions, T)
+        arrays, each region weighted by its own band SNR score (0 for regions
+        that are mostly not skin, e.g. occluded by a hand or blanket). The
+        weighted sum of the unit-variance region pulses gives the estimate.
+        """
+        data = self.regions.view()
+        data = data.reshape(data.shape[0], -1, REGION_WIDTH)
+        pos = pos_regions(data[:, :, :3])
+        n = pos.shape[1]
+
+        b, a = signal.butter(self._filter_order(), list(HR_BAND), btype='bandpass', fs=self.fps)
+        filtered = signal.filtfilt(b, a, signal.detrend(pos, axis=1), axis=1)
+
+        freqs = np.fft.rfftfreq(n, 1 / self.fps)
+        band = (freqs >= HR_BAND[0]) & (freqs <= HR_BAND[1])
+        if not np.any(band):
+            return 0.0, 0.0
+        power = np.abs(np.fft.rfft(filtered * np.hanning(n), axis=1)[:, band]) ** 2
+        band_freqs = freqs[band]
+        peak = band_freqs[np.argmax(power, axis=1)]
+        in_peak = np.abs(band_freqs[None, :] - peak[:, None]) <= self._snr_bandwidth()
+        signal_power = np.sum(power * in_peak, axis=1)
+        noise_power = np.sum(power * ~in_peak, axis=1)
+        eps = 1e-12
+        weights = snr_score(10.0 * np.log10((signal_power + eps) / (noise_power + eps)))
+        weights = weights * (data[:, :, 3].mean(axis=0) >= 0.1)
+        if weights.sum() <= 0:
+            weights = np.ones(len(weights))
+        weights = weights / weights.sum()
+        self.region_weights = weights
+
+        std = filtered.std(axis=1)
+        unit = filtered / np.where(std > 0, std, 1.0)[:, None]
+        combined = weights @ unit
+        self.signal_buffer = combined
+        return self.calculate_bpm_snr(combined, prefiltered=True)
+
+    def _snr_bandwidth(self):
+        # Half-width in Hz of the peak counted as signal
+        return float(0.18 + (100.0 - float(self.sensitivity)) * 0.0015)
+
+    def _filter_order(self):
+        return int(max(2, min(4, round(2 + (self.motion_rejection / 100.0) * 2))))
+
+    def _smooth_window(self):
+        return int(max(1, min(5, round(1 + (self.motion_rejection / 100.0) * 4))))
+
+    def _append_sample(self, row, regions=None):
+        """
+        Push one (r, g, b, lighting) sample through the buffers and the
+        incremental stages that follow it. ``regions`` are the grid mode
+        (n_regions, REGION_WIDTH) rows of the same frame.
+        """
+        evicted = self.samples.append(row)
+        if regions is not None:
+            regions = np.asarray(regions, dtype=float).reshape(-1)
+            if self.regions is None or self.regions.width != regions.size:
+                self.regions = RingBuffer(self.buffer_size, width=regions.size)
+            self.regions.append(regions)
+        self._stream_time += 1.0 / self.fps
+        if self._update_streaming_filters(evicted is not None):
+            # Filter history was rebuilt, the spectrum must follow
+            self._sdft = None
+        if self.filter_mode == "streaming":
+            new, old = self.filtered.last(1)[0], self._filtered_evicted
+            self._update_sliding_spectrum(new[COL_BVP:COL_BVP + 1],
+                                          None if old is None else old[COL_BVP:COL_BVP + 1])
+        else:
+            self._update_sliding_spectrum(row[:3], None if evicted is None else evicted[:3])
+
+    def _append_samples(self, rows, regions=None):
+        """
+        Block version of _append_sample: one write per buffer, the streaming
+        filters run over the block and the sliding spectrum is rebuilt from
+        the window. ``rows`` is (m, 4), ``regions`` (m, n_regions *
+        REGION_WIDTH); m must not exceed the buffer capacity minus POS_WINDOW.
+        """
+        rows = np.asarray(rows, dtype=float).reshape(-1, 4)
+        m = len(rows)
+        if m <= 1:
+            if m:
+                self._append_sample(rows[0], None if regions is None else regions[0])
+            return
+        consistent = len(self.filtered) == len(self.samples)
+        self.samples.extend(rows)
+        if regions is not None:
+            regions = np.asarray(regions, dtype=float).reshape(m, -1)
+            if self.regions is None or self.regions.width != regions.shape[1]:
+                self.regions = RingBuffer(self.buffer_size, width=regions.shape[1])
+            self.regions.extend(regions)
+        self._stream_time = float(np.add.accumulate(np.r_[self._stream_time, np.full(m, 1.0 / self.fps)])[-1])
+        self._extend_streaming_filters(m, consistent)
+        self._sdft = None
+        self._filtered_evicted = None
+        self._update_sliding_spectrum(None, None)
+
+    def _extend_streaming_filters(self, m, consistent):
+        """
+        Streaming filter stage for the last ``m`` samples at once (see
+        _update_streaming_filters).
+        """
+        if self.filter_mode != "streaming":
+            return
+        order = self._filter_order()
+        if (not consistent or self._bvp_filter is None or self._resp_filter is None
+                or self._bvp_filter.needs_rebuild(order, self.fps)
+                or self._resp_filter.needs_rebuild(2, self.fps)):
+            self._rebuild_streaming_filters(order)
+            return
+        rgb = self.samples.last(m + POS_WINDOW - 1)[:, :3]
+        pos = pos_series(rgb)[-m:]
+        green = self.samples.last(m)[:, COL_GREEN]
+        self.filtered.extend(np.column_stack([pos, self._bvp_filter.extend(pos), self._resp_filter.extend(green)]))
+
+    def _rebuild_streaming_filters(self, order):
+        data = self.samples.view()
+        pos = pos_series(data[:, :3])
+        self._bvp_filter = StreamingBandpass(order, HR_BAND, self.fps)
+        self._resp_filter = StreamingBandpass(2, RESP_BAND, self.fps)
+        bvp = self._bvp_filter.run(pos)
+        resp = self._resp_filter.run(data[:, COL_GREEN])
+        self.filtered.clear()
+        self.filtered.extend(np.column_stack([pos, bvp, resp]))
+
+    def _streaming_ready(self):
+        return (self.filter_mode == "streaming" and self._bvp_filter is not None
+                and len(self.filtered) == len(self.samples))
+
+    def _update_streaming_filters(self, wrapped):
+        """
+        Streaming filter stage: per-sample POS pulse -> causal band-pass (BVP),
+        and green channel -> causal respiration band-pass, stored alongside the
+        raw samples. The filters are designed once per (order, fs bucket); when
+        the order (motion_rejection) or the fps bucket changes they are rebuilt
+        and the stored history is re-filtered once. Returns True on a rebuild.
+        """
+        self._filtered_evicted = None
+        if self.filter_mode != "streaming":
+            return False
+        order = self._filter_order()
+        if (self._bvp_filter is None or self._resp_filter is None
+                or self._bvp_filter.needs_rebuild(order, self.fps)
+                or self._resp_filter.needs_rebuild(2, self.fps)
+                or len(self.filtered) != len(self.samples) - (0 if wrapped else 1)):
+            self._rebuild_streaming_filters(order)
+            return True
+
+        window = self.samples.last(POS_WINDOW)[:, :3]
+        pos = pos_sample(window) if window.shape[0] == POS_WINDOW else 0.0
+        green = float(self.samples.last(1)[0, COL_GREEN])
+        self._filtered_evicted = self.filtered.append(
+            (pos, self._bvp_filter.step(pos), self._resp_filter.step(green)))
+        return False
+
+    def _update_sliding_spectrum(self, new, old):
+        """
+        Advance the sliding DFT by one sample (O(bins)). It tracks the raw
+        R, G, B channels, or the BVP column when the streaming filter stage is
+        on. The estimator only exists while the buffer is full; it is rebuilt
+        from the buffer when the tracked bins no longer cover HR_BAND for the
+        current fps and once per window length to flush rounding error.
+        """
+        if self.spectrum_mode != "sliding" or not self.samples.is_full():
+            self._sdft = None
+            return
+        if self.filter_mode == "streaming":
+            source = self.filtered.view()[:, COL_BVP:COL_BVP + 1]
+        else:
+            source = self.samples.view()[:, :3]
+        n = self.samples.capacity
+        if source.shape[0] != n:
+            self._sdft = None
+            return
+        k_lo = int(np.floor(HR_BAND[0] * n / self.fps)) - 1
+        k_hi = int(np.ceil(HR_BAND[1] * n / self.fps)) + 1
+        sdft = self._sdft
+        if (sdft is None or old is None or sdft.channels != source.shape[1]
+                or sdft.updates >= n or not sdft.covers(k_lo, k_hi)):
+            # Leave a couple of bins of headroom so small fps drift does not force a rebuild
+            sdft = SlidingBandDFT(n, k_lo - 2, k_hi + 2, channels=source.shape[1])
+            sdft.reset(source)
+            self._sdft = sdft
+        else:
+            sdft.update(new, old)
+
+    def calculate_bpm_snr_sliding(self):
+        """
+        Same estimate as calculate_bpm_snr (POS -> detrend -> band-pass ->
+        smoothing -> Hann -> band peak/SNR), evaluated on the sliding DFT bins.
+        POS and detrending are linear, so they are applied to the per-channel
+        bins through the running window sums; the zero-phase band-pass and the
+        moving average become their magnitude responses at each bin.
+        """
+        sdft = self._sdft
+        n = sdft.n
+        k = sdft.k[1:-1]
+        freqs = k * self.fps / n
+        if sdft.channels == 1:
+            # BVP from the streaming filter stage: already band-passed
+            gain = _band_gain(n, sdft.k_lo + 1, sdft.k_hi - 1, None,
+                              self._smooth_window(), round(self.fps, 1), HR_BAND)
+            power = (np.abs(sdft.hann_bins()[0] * gain) ** 2).astype(float)
+            return self._band_peak_snr(freqs, power)
+
+        mean = sdft.sum_x / n
+        if np.any(mean == 0):
+            return 0.0, 0.0
+        cov = sdft.sum_xx / n - np.outer(mean, mean)
+
+        # POS projection as channel weights: h = s1 + alpha * s2 on normalised r, g, b
+        a1 = np.array([0.0, 1.0 / mean[1], -1.0 / mean[2]])
+        a2 = np.array([-2.0 / mean[0], 1.0 / mean[1], 1.0 / mean[2]])
+        std_s1 = float(np.sqrt(max(a1 @ cov @ a1, 0.0)))
+        std_s2 = float(np.sqrt(max(a2 @ cov @ a2, 0.0)))
+        alpha = std_s1 / std_s2 if std_s2 > 0 else 0.0
+        w = a1 + alpha * a2
+
+        spectrum = w @ sdft.hann_bins()
+
+        # Remove the least-squares line, as signal.detrend does
+        t_mean = (n - 1) / 2.0
+        s_tt = n * (n * n - 1) / 12.0
+        slope = float(w @ (sdft.sum_tx - t_mean * sdft.sum_x)) / s_tt
+        intercept = float(w @ mean) - slope * t_mean
+        const_bins, ramp_bins = _hann_trend_bins(n, sdft.k_lo + 1, sdft.k_hi - 1)
+        spectrum = spectrum - intercept * const_bins - slope * ramp_bins
+
+        gain = _band_gain(n, sdft.k_lo + 1, sdft.k_hi - 1, self._filter_order(),
+                          self._smooth_window(), round(self.fps, 1), HR_BAND)
+        power = (np.abs(spectrum * gain) ** 2).astype(float)
+        return self._band_peak_snr(freqs, power)
+
     def calculate_spo2(self):
         # Using raw buffers for SpO2 (Ratio of Ratios)
-        if len(self.raw_red_buffer) < 30: return 98.0
+        if len(self.samples) < 30: return 98.0
         
-        r_data = np.array(self.raw_red_buffer)
-        b_data = np.array(self.raw_blue_buffer)
+        data = self.samples.view()
+        r_data = data[:, COL_RED]
+        b_data = data[:, COL_BLUE]
         
         r_dc = np.mean(r_data)
         b_dc = np.mean(b_data)
@@ -390,17 +1595,20 @@ class RPPGService:
         # Use the POS signal for respiration? Or just Green?
         # Respiration is usually stronger in Green or the raw intensity.
         # Let's use the Green channel raw buffer for Respiration as it's more sensitive to volume changes
-        if len(self.raw_green_buffer) < int(self.fps * 10): return 16
+        if len(self.samples) < int(self.fps * 10): return 16
         
-        n = int(min(len(self.raw_green_buffer), max(1, self.fps * 20)))
-        data = np.array(self.raw_green_buffer[-n:], dtype=float)
-        detrended = signal.detrend(data)
-        
-        b, a = signal.butter(2, [0.1, 0.5], btype='bandpass', fs=self.fps)
-        try:
-            filtered = signal.filtfilt(b, a, detrended)
-        except:
-            return 16 
+        n = int(min(len(self.samples), max(1, self.fps * 20)))
+        if self._streaming_ready():
+            filtered = self.filtered.last(n)[:, COL_RESP]
+        else:
+            data = self.samples.last(n)[:, COL_GREEN]
+            detrended = signal.detrend(data)
+            
+            b, a = signal.butter(2, list(RESP_BAND), btype='bandpass', fs=self.fps)
+            try:
+                filtered = signal.filtfilt(b, a, detrended)
+            except:
+                return 16 
             
         n = len(filtered)
         freqs = np.fft.rfftfreq(n, 1/self.fps)
@@ -415,7 +1623,7 @@ class RPPGService:
         return freqs[peak_idx] * 60
 
     def calculate_lighting(self):
-        data = np.array(self.lighting_buffer, dtype=float)
+        data = self.samples.column(COL_LIGHTING)
         if data.size < int(self.fps): return 0
         mean = float(np.mean(data))
         std = float(np.std(data))
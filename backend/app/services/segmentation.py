@@ -0,0 +1,159 @@
+import cv2
+import numpy as np
+
+from ..core.config import backend_path, settings
+from .batching import MicroBatcher
+from .registry import registry
+
+# Network input of the rPPG skin segmentation models
+SEGMENTATION_SIZE = 256
+_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+class SegmenterUnavailable(RuntimeError):
+    pass
+
+
+class SkinSegmenter:
+    """
+    Learned skin segmentation backend, the alternative to the SkinLUT colour
+    classifier. ``segment_batch`` takes BGR crops of any size and returns a
+    0/255 uint8 mask per crop, at the crop's size.
+    """
+
+    name = ""
+
+    def segment(self, image):
+        return self.segment_batch([image])[0]
+
+    def segment_batch(self, images):
+        raise NotImplementedError
+
+    def warm_up(self):
+        self.segment_batch([np.zeros((SEGMENTATION_SIZE, SEGMENTATION_SIZE, 3), dtype=np.uint8)])
+
+
+class LinkNetSegmenter(SkinSegmenter):
+    """
+    LinkNet34 skin segmentation of the rPPG package (``rPPG/linknet.pth``),
+    with its preprocessing (RGB, 256x256, ImageNet normalisation) and its
+    0.8 threshold on the output, on CPU unless CUDA is available.
+    """
+
+    name = "linknet"
+
+    def __init__(self, weights_path=None, threshold=0.8):
+        try:
+            import torch
+
+            from rPPG import models
+        except ImportError as e:
+            raise SegmenterUnavailable("torch and torchvision are not installed") from e
+        weights_path = backend_path(weights_path or self._default_weights())
+        if not weights_path.is_file():
+            raise SegmenterUnavailable(f"missing model file: {weights_path}")
+        self._torch = torch
+        self.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+        model = self._build(models)
+        try:
+            model.load_state_dict(torch.load(str(weights_path), map_location=self.device))
+        except Exception as e:
+            raise SegmenterUnavailable(f"cannot load {weights_path}: {e}") from e
+        self.model = model.eval().to(self.device)
+        self.threshold = float(threshold)
+
+    def _default_weights(self):
+        return settings.skin_linknet_weights
+
+    def _build(self, models):
+        return models.LinkNet34(pretrained=False)
+
+    def _threshold(self, pred):
+        return self.threshold
+
+    def segment_batch(self, images):
+        torch = self._torch
+        batch = np.stack([
+            (cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), (SEGMENTATION_SIZE, SEGMENTATION_SIZE),
+                        interpolation=cv2.INTER_LINEAR).astype(np.float32) / 255.0 - _MEAN) / _STD
+            for image in images
+        ]).transpose(0, 3, 1, 2)
+        with torch.no_grad():
+            pred = self.model(torch.from_numpy(np.ascontiguousarray(batch)).to(self.device))
+        pred = pred[:, 0].cpu().numpy()
+        masks = []
+        for image, p in zip(images, pred):
+            h, w = image.shape[:2]
+            mask = (p > self._threshold(p)).astype(np.uint8) * 255
+            masks.append(cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST))
+        return masks
+
+
+class UNet11Segmenter(LinkNetSegmenter):
+    """
+    UNet11 face segmentation of the rPPG package (FaceSegGPU), with the same
+    preprocessing and FaceSegGPU's adaptive threshold (mean + std / 2 of the
+    output, within 0.5..0.9). Needs trained weights (settings.
+    skin_unet11_weights); the package only ships LinkNet34's.
+    """
+
+    name = "unet11"
+
+    def _default_weights(self):
+        if not settings.skin_unet11_weights:
+            raise SegmenterUnavailable("no UNet11 weights configured")
+        return settings.skin_unet11_weights
+
+    def _build(self, models):
+        return models.UNet11(pretrained=False)
+
+    def _threshold(self, pred):
+        return float(np.clip(pred.mean() + 0.5 * pred.std(), 0.5, 0.9))
+
+
+class BatchedSegmenter(SkinSegmenter):
+    """
+    Shares a segmentation network between the sessions of a process, like
+    detectors.BatchedDetector: crops arriving within ``max_delay_ms`` of each
+    other go through the network as one batch.
+    """
+
+    def __init__(self, segmenter, max_batch=16, max_delay_ms=5.0):
+        self.segmenter = segmenter
+        self.name = segmenter.name
+        self.batcher = MicroBatcher(segmenter.segment_batch, max_batch, max_delay_ms,
+                                    name=f"segment-{segmenter.name}")
+
+    def segment(self, image):
+        return self.batcher(image)
+
+    def segment_batch(self, images):
+        return self.segmenter.segment_batch(images)
+
+    def warm_up(self):
+        self.segmenter.warm_up()
+
+
+SEGMENTATION_BACKENDS = {
+    LinkNetSegmenter.name: LinkNetSegmenter,
+    UNet11Segmenter.name: UNet11Segmenter,
+}
+
+def get_segmenter(name):
+    """
+    Process-wide shared segmentation network for a backend name, from the
+    model registry (loaded and warmed up on first use unless preloaded),
+    batched across sessions when settings.rppg_batch_max_delay_ms is set.
+    """
+    backend = SEGMENTATION_BACKENDS.get(name)
+    if backend is None:
+        raise SegmenterUnavailable(f"unknown skin segmentation backend: {name}")
+
+    def load():
+        segmenter = backend()
+        if settings.rppg_batch_max_delay_ms > 0:
+            segmenter = BatchedSegmenter(segmenter, settings.rppg_batch_max_size, settings.rppg_batch_max_delay_ms)
+        return segmenter
+
+    return registry.get("segmenter", name, load)
@@ -0,0 +1,76 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from ..core.config import settings
+
+
+class SessionCache:
+    """
+    Snapshots of recently closed sessions, keyed by resume token, so a
+    client that reconnects within ``ttl`` seconds carries on with its signal
+    buffers instead of warming up again. At most ``max_entries`` snapshots
+    are kept (the oldest go first, 0 = resume disabled); each one can be
+    taken once.
+    """
+
+    def __init__(self, ttl=30.0, max_entries=256, clock=time.monotonic):
+        self.ttl = max(0.0, float(ttl))
+        self.max_entries = max(0, int(max_entries))
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            self._expire(self._clock())
+            return len(self._entries)
+
+    @staticmethod
+    def new_token():
+        return secrets.token_urlsafe(16)
+
+    def put(self, token, snapshot):
+        if self.max_entries == 0 or self.ttl == 0:
+            return
+        with self._lock:
+            now = self._clock()
+            self._entries.pop(token, None)
+            self._entries[token] = (now + self.ttl, snapshot)
+            self._expire(now)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def take(self, token):
+        """
+        The snapshot stored under ``token`` (removed from the cache), or
+        None if there is none or it expired.
+        """
+        with self._lock:
+            self._expire(self._clock())
+            entry = self._entries.pop(token, None)
+        return None if entry is None else entry[1]
+
+    def _expire(self, now):
+        # Entries are in insertion order, which is expiry order
+        while self._entries:
+            token, (expires, _) = next(iter(self._entries.items()))
+            if expires > now:
+                break
+            del self._entries[token]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_session_cache():
+    """
+    Process-wide session cache, sized from settings.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SessionCache(settings.ws_resume_ttl_s, settings.ws_resume_max_sessions)
+        return _cache
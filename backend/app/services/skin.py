@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+
+# Skin color range in YCrCb
+SKIN_YCRCB_LOWER = np.array([0, 133, 77], dtype=np.uint8)
+SKIN_YCRCB_UPPER = np.array([255, 173, 127], dtype=np.uint8)
+
+# Quantisation of the BGR lookup table: 2**bits levels per channel
+SKIN_LUT_BITS = 5
+
+# Calibration: Cr/Cb percentiles of the face patch, widened by a margin
+CALIBRATION_PERCENTILES = (5.0, 95.0)
+CALIBRATION_MARGIN = 6
+CALIBRATION_MIN_PIXELS = 200
+
+_RANGES = [0, 256, 0, 256, 0, 256]
+
+
+class SkinLUT:
+    """
+    Quantised BGR -> skin lookup table. ``classify`` is a single gather per
+    pixel (cv2.calcBackProject with the table as a 3-D histogram) returning
+    a 0/255 mask, whatever skin model the table was built from.
+    """
+
+    def __init__(self, table, bits=SKIN_LUT_BITS):
+        self.bits = int(bits)
+        self.table = np.ascontiguousarray(table, dtype=np.float32)
+        # Keep the 3-D shape; a plain ndarray would be read as 2-D multi-channel
+        self._hist = cv2.Mat(self.table, wrap_channels=False)
+
+    @classmethod
+    def from_ycrcb(cls, lower=SKIN_YCRCB_LOWER, upper=SKIN_YCRCB_UPPER, bits=SKIN_LUT_BITS):
+        """
+        Table of the YCrCb box classifier, evaluated at the bin centres.
+        """
+        levels = 1 << bits
+        step = 256 // levels
+        centres = (np.arange(levels) * step + step // 2).astype(np.uint8)
+        bgr = np.stack(np.meshgrid(centres, centres, centres, indexing="ij"), axis=-1).reshape(1, -1, 3)
+        ycrcb = cv2.cvtColor(bgr, cv2.COLOR_BGR2YCrCb)
+        mask = cv2.inRange(ycrcb, np.asarray(lower, dtype=np.uint8), np.asarray(upper, dtype=np.uint8))
+        return cls(mask.reshape(levels, levels, levels), bits)
+
+    @classmethod
+    def calibrate(cls, patch, bits=SKIN_LUT_BITS):
+        """
+        Table fitted to a BGR patch known to be mostly skin (e.g. the centre
+        of the first detected face): the Cr/Cb bounds become the patch
+        percentiles plus a margin, so skin tones and white balance that the
+        fixed bounds miss are still picked up. Returns None if the patch is
+        too small.
+        """
+        pixels = np.asarray(patch).reshape(-1, 3)
+        if pixels.shape[0] < CALIBRATION_MIN_PIXELS:
+            return None
+        ycrcb = cv2.cvtColor(pixels.reshape(1, -1, 3).astype(np.uint8), cv2.COLOR_BGR2YCrCb).reshape(-1, 3)
+        lo, hi = np.percentile(ycrcb[:, 1:], CALIBRATION_PERCENTILES, axis=0)
+        lower = np.array([0, *np.clip(lo - CALIBRATION_MARGIN, 0, 255)], dtype=np.uint8)
+        upper = np.array([255, *np.clip(hi + CALIBRATION_MARGIN, 0, 255)], dtype=np.uint8)
+        return cls.from_ycrcb(lower, upper, bits)
+
+    def classify(self, image):
+        return cv2.calcBackProject([image], [0, 1, 2], self._hist, _RANGES, 1)
+
+
+DEFAULT_SKIN_LUT = SkinLUT.from_ycrcb()
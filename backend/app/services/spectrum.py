@@ -0,0 +1,108 @@
+import numpy as np
+from scipy import signal
+
+
+class SlidingBandDFT:
+    """
+    Sliding DFT over a full window of ``n`` samples that only tracks bins
+    ``k_lo..k_hi`` for several channels at once.
+
+    Besides the bins it keeps running window sums (per channel, cross products
+    and time-weighted) so means, covariances and the linear trend of any linear
+    combination of the channels are available in O(channels^2).
+    """
+
+    def __init__(self, n, k_lo, k_hi, channels):
+        self.n = int(n)
+        self.k_lo = int(max(1, k_lo))
+        self.k_hi = int(min(self.n // 2, k_hi))
+        self.k = np.arange(self.k_lo, self.k_hi + 1)
+        self.channels = int(channels)
+        self._twiddle = np.exp(2j * np.pi * self.k / self.n)
+        self.bins = np.zeros((self.channels, self.k.size), dtype=complex)
+        self.sum_x = np.zeros(self.channels)
+        self.sum_tx = np.zeros(self.channels)
+        self.sum_xx = np.zeros((self.channels, self.channels))
+        self.updates = 0
+
+    def covers(self, k_lo, k_hi):
+        return self.k_lo <= k_lo and k_hi <= self.k_hi
+
+    def reset(self, window):
+        """
+        Recompute bins and sums exactly from a (n, channels) window.
+        """
+        window = np.asarray(window, dtype=float)
+        t = np.arange(self.n)
+        basis = np.exp(-2j * np.pi * np.outer(t, self.k) / self.n)
+        self.bins = window.T @ basis
+        self.sum_x = window.sum(axis=0)
+        self.sum_tx = t @ window
+        self.sum_xx = window.T @ window
+        self.updates = 0
+
+    def update(self, new, old):
+        """
+        Slide the window by one sample: ``old`` leaves, ``new`` enters.
+        """
+        new = np.asarray(new, dtype=float)
+        old = np.asarray(old, dtype=float)
+        self.bins = (self.bins + (new - old)[:, None]) * self._twiddle
+        self.sum_tx = self.sum_tx - self.sum_x + old + (self.n - 1) * new
+        self.sum_x = self.sum_x + new - old
+        self.sum_xx = self.sum_xx + np.outer(new, new) - np.outer(old, old)
+        self.updates += 1
+
+    def hann_bins(self):
+        """
+        Bins of the (periodic) Hann-windowed signal for k_lo+1..k_hi-1,
+        obtained from neighbouring bins without another transform.
+        """
+        x = self.bins
+        return 0.5 * x[:, 1:-1] - 0.25 * (x[:, :-2] + x[:, 2:])
+
+
+_TREND_BINS_CACHE = {}
+
+
+def _hann_trend_bins(n, k_lo, k_hi):
+    """
+    DFT bins k_lo..k_hi of a periodic-Hann-windowed constant and ramp of length n
+    """
+    key = (n, k_lo, k_hi)
+    cached = _TREND_BINS_CACHE.get(key)
+    if cached is None:
+        t = np.arange(n)
+        window = 0.5 - 0.5 * np.cos(2 * np.pi * t / n)
+        basis = np.exp(-2j * np.pi * np.outer(t, np.arange(k_lo, k_hi + 1)) / n)
+        cached = (window @ basis, (window * t) @ basis)
+        _TREND_BINS_CACHE[key] = cached
+    return cached
+
+
+_BAND_GAIN_CACHE = {}
+
+
+def _band_gain(n, k_lo, k_hi, order, smooth_win, fps, band):
+    """
+    Amplitude gain at bins k_lo..k_hi of the batch path's filtfilt ``band``
+    band-pass (applied twice, skipped when order is None) followed by its moving-average
+    smoothing. Only depends on k / n and the cut-offs relative to fps, so it is
+    cached per fps step.
+    """
+    key = (n, k_lo, k_hi, order, smooth_win, fps, tuple(band))
+    gain = _BAND_GAIN_CACHE.get(key)
+    if gain is None:
+        w = 2 * np.pi * np.arange(k_lo, k_hi + 1) / n
+        gain = np.ones(w.size)
+        if order is not None:
+            b, a = signal.butter(order, list(band), btype='bandpass', fs=fps)
+            _, resp = signal.freqz(b, a, worN=w)
+            gain = np.abs(resp) ** 2
+        if smooth_win > 1:
+            x = w / 2.0
+            gain = gain * np.abs(np.sin(smooth_win * x) / (smooth_win * np.sin(x)))
+        if len(_BAND_GAIN_CACHE) > 256:
+            _BAND_GAIN_CACHE.clear()
+        _BAND_GAIN_CACHE[key] = gain
+    return gain
@@ -0,0 +1,52 @@
+# Vitals re-evaluation rate per metric in Hz of stream time; 0 = every frame
+DEFAULT_VITALS_CADENCE = {"bpm": 4.0, "spo2": 1.0, "resp_rate": 0.5, "lighting": 1.0}
+
+
+class VitalsScheduler:
+    """
+    Decides when each vitals metric is due, given a per-metric rate in Hz and
+    the session's stream clock (seconds of signal, not wall time).
+    """
+
+    def __init__(self, cadence=None):
+        self.cadence = dict(DEFAULT_VITALS_CADENCE)
+        self._next_due = {}
+        if cadence:
+            self.configure(cadence)
+
+    def configure(self, cadence):
+        for metric, rate in cadence.items():
+            if metric not in DEFAULT_VITALS_CADENCE:
+                continue
+            try:
+                self.cadence[metric] = max(0.0, min(60.0, float(rate)))
+            except (TypeError, ValueError):
+                continue
+            self._next_due.pop(metric, None)
+
+    def reset(self):
+        self._next_due.clear()
+
+    def next_due(self):
+        """
+        Earliest stream time at which a metric with a cadence is due: None if
+        one has not been evaluated yet (due now), inf if none has a cadence.
+        """
+        times = [self._next_due.get(m) for m, rate in self.cadence.items() if rate > 0]
+        if any(t is None for t in times):
+            return None
+        return min(times, default=float("inf"))
+
+    def due(self, metric, now):
+        rate = self.cadence.get(metric, 0.0)
+        if rate <= 0:
+            return True
+        next_due = self._next_due.get(metric)
+        if next_due is not None and now < next_due:
+            return False
+        period = 1.0 / rate
+        # Keep a steady grid, but do not try to catch up after a long gap
+        if next_due is None or now - next_due >= period:
+            next_due = now
+        self._next_due[metric] = next_due + period
+        return True
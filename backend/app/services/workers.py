@@ -0,0 +1,436 @@
+import asyncio
+import atexit
+import functools
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+from ..core.config import settings
+
+# Seconds between liveness checks of a worker while waiting for results
+_POLL_INTERVAL = 0.5
+
+
+# A message written to a shared-memory slot, passed instead of the bytes
+SlotRef = namedtuple("SlotRef", "index length")
+
+
+class SlotPool:
+    """
+    Fixed-size frame slots in one shared memory block. The server process
+    creates it and hands out free slots; workers attach by name and read
+    messages in place, so only (slot index, length) crosses the process
+    boundary whatever the frame size.
+    """
+
+    def __init__(self, slots, slot_size, name=None):
+        self.slots = int(slots)
+        self.slot_size = int(slot_size)
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_size)
+            self._free = list(range(self.slots))
+        else:
+            # Spawned workers share the creator's resource tracker, which
+            # unlinks the block only if the creator leaks it
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._free = []
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def free(self):
+        return len(self._free)
+
+    def put(self, data):
+        """
+        Copy a message into a free slot; None if it does not fit or no slot is free.
+        """
+        length = len(data)
+        if length > self.slot_size:
+            return None
+        with self._lock:
+            if not self._free:
+                return None
+            index = self._free.pop()
+        start = index * self.slot_size
+        self._shm.buf[start:start + length] = data
+        return SlotRef(index, length)
+
+    def release(self, ref):
+        with self._lock:
+            self._free.append(ref.index)
+
+    def view(self, ref):
+        start = ref.index * self.slot_size
+        return self._shm.buf[start:start + ref.length]
+
+    def close(self, unlink=False):
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+def _worker_main(inbox, outbox, slots_args=None, pipeline_depth=1):
+    """
+    Worker process loop. Sessions live here for their whole lifetime; only
+    frame bytes (or a SlotRef to them) come in and result dicts go out.
+    Requests are (op, session_id, request_id, *args); None stops the worker.
+    The models of settings.rppg_preload_models are loaded before the first
+    request.
+    """
+    from .registry import preload_models
+
+    preload_models(settings.rppg_preload_models)
+    slots = SlotPool(*slots_args) if slots_args else None
+    sessions = _WorkerSessions(inbox, outbox, slots, pipeline_depth)
+    while True:
+        request = inbox.get()
+        if request is None:
+            break
+        sessions.handle(request)
+
+
+class _WorkerSessions:
+    """
+    The sessions of one worker process and the handling of their requests.
+    With ``pipeline_depth`` > 1, or for sessions whose detector or skin
+    segmentation network batches across sessions, each session's frames go
+    through a FramePipeline and are answered as they leave it, in order;
+    sessions then run concurrently and those calls can share batches. A
+    session's backends can change with its configuration, so the pipeline
+    is added or removed after each config request. A request of
+    another kind applies after the session's frames in flight: it is parked,
+    with the session's later requests, until the last frame submitted is
+    done, then replayed from the inbox, so the other sessions carry on
+    meanwhile.
+    """
+
+    # Posted to the own inbox when a session's parked requests may go on
+    _RESUME = "resume"
+
+    def __init__(self, inbox, outbox, slots=None, pipeline_depth=1):
+        from .pipeline import FramePipeline
+        from .rppg import RPPGService
+
+        self._pipeline_class = FramePipeline
+        self._service_class = RPPGService
+        self.inbox = inbox
+        self.outbox = outbox
+        self.slots = slots
+        self.pipeline_depth = pipeline_depth
+        self.sessions = {}
+        self.pipelines = {}
+        # Future of the last frame submitted to each pipeline (they complete
+        # in order) and the requests parked behind it
+        self._last_frame = {}
+        self._parked = {}
+
+    def handle(self, request):
+        op, session_id, request_id, *args = request
+        if op == self._RESUME:
+            for parked in self._parked.pop(session_id, ()):
+                self.handle(parked)
+            return
+        if session_id in self._parked:
+            self._parked[session_id].append(request)
+            return
+        if op == "open":
+            self.sessions[session_id] = self._service_class()
+            if args and args[0] is not None:
+                self.sessions[session_id].restore(args[0])
+            self._update_pipeline(session_id)
+            return
+        pipeline = self.pipelines.get(session_id)
+        if pipeline is not None:
+            if op == "frame":
+                data, *rest = args
+                if isinstance(data, SlotRef):
+                    data = self.slots.view(data)
+                future = pipeline.submit(data, *rest)
+                future.add_done_callback(functools.partial(_frame_done, self.outbox, request_id, data))
+                self._last_frame[session_id] = future
+                return
+            last = self._last_frame.pop(session_id, None)
+            if last is not None and not last.done():
+                self._parked[session_id] = [request]
+                last.add_done_callback(lambda _: self.inbox.put((self._RESUME, session_id, None)))
+                return
+        if op == "close":
+            self.sessions.pop(session_id, None)
+            pipeline = self.pipelines.pop(session_id, None)
+            if pipeline is not None:
+                pipeline.close()
+            return
+        service = self.sessions.get(session_id)
+        if service is None:
+            if request_id is not None:
+                self.outbox.put((request_id, None, f"unknown session {session_id}"))
+            return
+        data = None
+        try:
+            if op == "config":
+                service.apply_config(*args)
+                self._update_pipeline(session_id)
+                result = None
+            elif op == "snapshot":
+                result = service.snapshot()
+            else:
+                data, *rest = args
+                if isinstance(data, SlotRef):
+                    data = self.slots.view(data)
+                if op == "means":
+                    result = service.process_means_message(data, *rest)
+                elif op == "batch":
+                    result = service.process_batch_message(data, *rest)
+                else:
+                    result = service.process_frame(data, *rest)
+        except Exception as e:
+            if request_id is not None:
+                self.outbox.put((request_id, None, f"{type(e).__name__}: {e}"))
+            return
+        finally:
+            _release(data)
+        if request_id is not None:
+            self.outbox.put((request_id, result, None))
+
+    def _update_pipeline(self, session_id):
+        """
+        Pipeline the session only where it gains: deeper pipelines, or
+        backends that batch across sessions (single-session dlib detection
+        would only pay for the extra threads and handoffs). No frame of the
+        session is in flight here.
+        """
+        service = self.sessions[session_id]
+        wanted = self.pipeline_depth > 1 or (settings.rppg_batch_max_delay_ms > 0 and service.shares_batches)
+        pipeline = self.pipelines.get(session_id)
+        if wanted and pipeline is None:
+            self.pipelines[session_id] = self._pipeline_class(service, self.pipeline_depth)
+        elif not wanted and pipeline is not None:
+            self.pipelines.pop(session_id).close()
+
+
+def _frame_done(outbox, request_id, data, future):
+    _release(data)
+    exc = future.exception()
+    if exc is not None:
+        outbox.put((request_id, None, f"{type(exc).__name__}: {exc}"))
+    else:
+        outbox.put((request_id, future.result(), None))
+
+
+def _release(data):
+    if isinstance(data, memoryview):
+        # The slot is reused once the result is back
+        try:
+            data.release()
+        except BufferError:
+            pass
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+class _Worker:
+    def __init__(self, ctx, index, slots=None, pipeline_depth=1):
+        self.index = index
+        self.inbox = ctx.Queue()
+        self.outbox = ctx.Queue()
+        self.sessions = set()
+        slots_args = (slots.slots, slots.slot_size, slots.name) if slots else None
+        self.process = ctx.Process(target=_worker_main, args=(self.inbox, self.outbox, slots_args, pipeline_depth),
+                                   name=f"rppg-worker-{index}", daemon=True)
+        self.process.start()
+
+
+class SessionWorkerPool:
+    """
+    Shards sessions over ``size`` worker processes (default: one per core).
+    A session is pinned to one worker when opened, so its RPPGService stays
+    resident there and its requests are handled in order; the GIL of the
+    server process no longer caps the DSP work. Frames are handed over in
+    ``slots`` shared-memory slots of ``slot_size`` bytes when they fit.
+    With ``pipeline_depth`` > 1 the stages of consecutive frames of a
+    session overlap inside its worker (see pipeline.FramePipeline); that many
+    frames can then usefully be in flight per session.
+    """
+
+    def __init__(self, size=None, slots=0, slot_size=0, pipeline_depth=1):
+        self.size = int(size or os.cpu_count() or 1)
+        self._ctx = multiprocessing.get_context("spawn")
+        self.slots = SlotPool(slots, slot_size) if slots > 0 and slot_size > 0 else None
+        self.pipeline_depth = max(1, int(pipeline_depth))
+        self._ids = itertools.count(1)
+        self._sessions = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._workers = [_Worker(self._ctx, i, self.slots, self.pipeline_depth) for i in range(self.size)]
+        for worker in self._workers:
+            self._start_collector(worker)
+
+    def open_session(self, snapshot=None):
+        """
+        Start a session on the least loaded worker, continuing from an
+        ``RPPGService.snapshot()`` if given.
+        """
+        with self._lock:
+            # A crashed worker is being replaced; do not pin new sessions to it
+            alive = [w for w in self._workers if w.process.is_alive()] or self._workers
+            worker = min(alive, key=lambda w: len(w.sessions))
+            session_id = next(self._ids)
+            worker.sessions.add(session_id)
+            self._sessions[session_id] = worker
+        worker.inbox.put(("open", session_id, None, snapshot))
+        return session_id
+
+    def close_session(self, session_id):
+        with self._lock:
+            worker = self._sessions.pop(session_id, None)
+            if worker is None:
+                return
+            worker.sessions.discard(session_id)
+        if not self._closed:
+            worker.inbox.put(("close", session_id, None))
+
+    def configure(self, session_id, payload):
+        self._sessions[session_id].inbox.put(("config", session_id, None, payload))
+
+    def submit(self, session_id, op, *args):
+        """
+        Queue ``op`` ("frame", "batch" or "means" with the message, or
+        "snapshot") for a session in its worker and return an asyncio future
+        of the result dict. Requests reach the worker in call order,
+        configuration included.
+        """
+        worker = self._sessions[session_id]
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not worker.process.is_alive():
+            future.set_exception(WorkerError(f"worker {worker.index} exited"))
+            return future
+        ref = self.slots.put(args[0]) if args and self.slots is not None else None
+        if ref is not None:
+            args = (ref, *args[1:])
+        with self._lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = (loop, future, worker, ref)
+        worker.inbox.put((op, session_id, request_id, *args))
+        return future
+
+    async def process(self, session_id, op, *args):
+        """
+        Run ``op`` for a session in its worker and return the result dict.
+        """
+        return await self.submit(session_id, op, *args)
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+        for worker in self._workers:
+            worker.inbox.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        if self.slots is not None:
+            self.slots.close(unlink=True)
+
+    def _start_collector(self, worker):
+        threading.Thread(target=self._collect, args=(worker,), name=f"rppg-results-{worker.index}",
+                         daemon=True).start()
+
+    def _collect(self, worker):
+        """
+        Result thread for one worker: resolves the awaiting futures. If the
+        worker process dies (or its queue breaks) they all fail, and a new
+        worker takes its place for the sessions opened from then on.
+        """
+        while True:
+            try:
+                request_id, result, error = worker.outbox.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                if worker.process.is_alive():
+                    continue
+                break
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                pending = self._pending.pop(request_id, None)
+            if pending is None:
+                continue
+            loop, future, _, ref = pending
+            if ref is not None:
+                self.slots.release(ref)
+            exc = WorkerError(error) if error else None
+            loop.call_soon_threadsafe(_resolve, future, result, exc)
+        self._fail_pending(worker, WorkerError(f"worker {worker.index} exited"))
+        self._respawn(worker)
+
+    def _respawn(self, worker):
+        """
+        Replace a dead worker. Its sessions are lost (their requests keep
+        failing with WorkerError until the clients reconnect).
+        """
+        if worker.process.is_alive():
+            worker.process.terminate()
+        with self._lock:
+            if self._closed or self._workers[worker.index] is not worker:
+                return
+        replacement = _Worker(self._ctx, worker.index, self.slots, self.pipeline_depth)
+        with self._lock:
+            if self._closed:
+                replacement.inbox.put(None)
+                return
+            self._workers[worker.index] = replacement
+        self._start_collector(replacement)
+
+    def _fail_pending(self, worker, exc):
+        with self._lock:
+            failed = [rid for rid, (_, _, w, _) in self._pending.items() if w is worker]
+            pending = [self._pending.pop(rid) for rid in failed]
+        for loop, future, _, ref in pending:
+            if ref is not None:
+                self.slots.release(ref)
+            loop.call_soon_threadsafe(_resolve, future, None, exc)
+
+
+def _resolve(future, result, exc):
+    if future.done():
+        return
+    if exc is not None:
+        future.set_exception(exc)
+    else:
+        future.set_result(result)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """
+    Process-wide worker pool, started on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SessionWorkerPool(settings.rppg_workers or None, settings.rppg_shm_slots,
+                                      settings.rppg_shm_slot_bytes, settings.rppg_pipeline_depth)
+            atexit.register(shutdown_worker_pool)
+        return _pool
+
+
+def shutdown_worker_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
@@ -0,0 +1,6 @@
+def upgrade(connection):
+    # Databases created from the models before migrations were versioned
+    # already have the column
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(users)")}
+    if "avatar_url" not in columns:
+        connection.execute("ALTER TABLE users ADD COLUMN avatar_url TEXT")
@@ -0,0 +1,114 @@
+"""
+Micro-benchmark of the face detector backends on a local clip set.
+
+For every clip (video file, or a directory of still images) the frames are
+resized like the WebSocket pipeline does and passed through
+``RPPGService.detect_faces`` (adaptive scale policy) with each backend.
+Reports per-frame latency and recall, i.e. the share of frames with at least
+one face; the clips are expected to show a face in every frame.
+
+    python scripts/bench_detectors.py path/to/clips --backends dlib_hog,opencv_dnn
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.detectors import DETECTOR_BACKENDS, DetectorUnavailable, get_detector  # noqa: E402
+from app.services.rppg import RPPGService  # noqa: E402
+
+VIDEO_EXTS = {".mp4", ".avi", ".mov", ".mkv", ".webm"}
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def iter_frames(path, max_frames):
+    if path.is_dir():
+        files = sorted(p for p in path.iterdir() if p.suffix.lower() in IMAGE_EXTS)
+        for p in files[:max_frames]:
+            frame = cv2.imread(str(p), cv2.IMREAD_COLOR)
+            if frame is not None:
+                yield frame
+        return
+    cap = cv2.VideoCapture(str(path))
+    count = 0
+    while count < max_frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        count += 1
+        yield frame
+    cap.release()
+
+
+def load_clips(root, max_frames, max_width):
+    clips = {}
+    paths = [root] if root.suffix.lower() in VIDEO_EXTS else sorted(root.iterdir())
+    for path in paths:
+        if not (path.is_dir() or path.suffix.lower() in VIDEO_EXTS):
+            continue
+        frames = []
+        for frame in iter_frames(path, max_frames):
+            h, w = frame.shape[:2]
+            if w > max_width:
+                frame = cv2.resize(frame, (max_width, max(1, int(h * max_width / w))), interpolation=cv2.INTER_AREA)
+            frames.append(frame)
+        if frames:
+            clips[path.name] = frames
+    return clips
+
+
+def bench(backend, clips):
+    latencies = []
+    hits = 0
+    for frames in clips.values():
+        service = RPPGService()
+        service.detector = backend
+        for frame in frames:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            t0 = time.perf_counter()
+            faces = service.detect_faces(gray, frame)
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+            hits += bool(faces)
+    lat = np.asarray(latencies)
+    return {
+        "frames": lat.size,
+        "mean_ms": float(lat.mean()),
+        "p95_ms": float(np.percentile(lat, 95)),
+        "recall": hits / float(lat.size),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clips", type=Path, help="video file, or directory of videos / image-sequence directories")
+    parser.add_argument("--backends", default=",".join(DETECTOR_BACKENDS))
+    parser.add_argument("--max-frames", type=int, default=300, help="frames per clip")
+    parser.add_argument("--max-width", type=int, default=640)
+    args = parser.parse_args()
+
+    clips = load_clips(args.clips, args.max_frames, args.max_width)
+    if not clips:
+        parser.error(f"no clips found in {args.clips}")
+
+    print(f"{len(clips)} clips, {sum(len(f) for f in clips.values())} frames")
+    print(f"{'backend':<12} {'frames':>7} {'mean ms':>9} {'p95 ms':>9} {'recall':>7}")
+    for name in args.backends.split(","):
+        try:
+            t0 = time.perf_counter()
+            backend = get_detector(name)
+            load_ms = (time.perf_counter() - t0) * 1000.0
+        except DetectorUnavailable as e:
+            print(f"{name:<12} unavailable: {e}")
+            continue
+        r = bench(backend, clips)
+        print(f"{name:<12} {r['frames']:>7} {r['mean_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['recall']:>7.1%}"
+              f"  (load {load_ms:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import json
+
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -132,3 +134,46 @@ def test_sql_injection_like_login_rejected():
         data={"username": "bob' OR 1=1 --", "password": "password123"},
     )
     assert response.status_code in (400, 401)
+
+
+def test_video_socket_session_end_to_end(monkeypatch):
+    import cv2
+    import numpy as np
+
+    from app.core.config import settings
+    from app.services.frames import encode_means_message
+    from app.services.workers import shutdown_worker_pool
+
+    def means_batches(n=300, fs=30.0, batch=30, start=0):
+        t = (start + np.arange(n)) / fs
+        pulse = np.sin(2 * np.pi * 72.0 / 60.0 * t)
+        rgb = np.stack([150 + 0.3 * pulse, 120 + pulse, 100 + 0.2 * pulse], axis=1)
+        ts = 1000.0 + t * 1000.0
+        return [encode_means_message(ts[i:i + batch], rgb[i:i + batch], seq=start + i) for i in range(0, n, batch)]
+
+    monkeypatch.setattr(settings, "rppg_workers", 1)
+    shutdown_worker_pool()
+    try:
+        with client.websocket_connect("/ws/video") as ws:
+            session = ws.receive_json()
+            assert session["type"] == "session" and session["resumed"] is False
+            ws.send_text(json.dumps({"type": "config", "vitalsCadence": {"bpm": 0}}))
+
+            _, jpeg = cv2.imencode(".jpg", np.full((48, 64, 3), 90, np.uint8))
+            ws.send_bytes(jpeg.tobytes())
+            assert ws.receive_json()["quality"] == "No Face"
+
+            for message in means_batches():
+                ws.send_bytes(message)
+                result = ws.receive_json()
+            assert abs(result["bpm"] - 72.0) < 3.0
+
+        # Reconnecting with the token continues the same signal at once
+        with client.websocket_connect(f"/ws/video?resume={session['resumeToken']}") as ws:
+            resumed = ws.receive_json()
+            assert resumed["resumed"] is True and resumed["resumeToken"] == session["resumeToken"]
+            ws.send_bytes(means_batches(n=30, start=300)[0])
+            result = ws.receive_json()
+            assert result["seq"] == 329 and abs(result["bpm"] - 72.0) < 3.0
+    finally:
+        shutdown_worker_pool()
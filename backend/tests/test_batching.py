@@ -0,0 +1,135 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.batching import MicroBatcher
+from app.services.detectors import BatchedDetector, FaceDetector, OpenCVDnnDetector
+from app.services.rppg import RPPGService
+from app.services.segmentation import SkinSegmenter
+
+
+def test_concurrent_requests_share_batches():
+    sizes = []
+    release = threading.Event()
+
+    def square(items):
+        release.wait(5)
+        sizes.append(len(items))
+        return [x * x for x in items]
+
+    batcher = MicroBatcher(square, max_batch=4, max_delay_ms=50.0)
+    futures = [batcher.submit(i) for i in range(10)]
+    release.set()
+    try:
+        assert [f.result(timeout=5) for f in futures] == [i * i for i in range(10)]
+    finally:
+        batcher.close()
+    assert sizes == [4, 4, 2]
+    assert (batcher.batches, batcher.items) == (3, 10)
+
+
+def test_batch_errors_reach_every_caller():
+    def fail(items):
+        raise ValueError("bad batch")
+
+    batcher = MicroBatcher(fail, max_delay_ms=20.0)
+    futures = [batcher.submit(i) for i in range(3)]
+    try:
+        for f in futures:
+            with pytest.raises(ValueError):
+                f.result(timeout=5)
+    finally:
+        batcher.close()
+
+
+def test_batches_with_missing_results_fail_every_caller():
+    batcher = MicroBatcher(lambda items: items[:-1], max_delay_ms=20.0)
+    futures = [batcher.submit(i) for i in range(3)]
+    try:
+        for f in futures:
+            with pytest.raises(RuntimeError):
+                f.result(timeout=5)
+    finally:
+        batcher.close()
+
+
+class CountingDetector(FaceDetector):
+    name = "counting"
+    batchable = True
+
+    def __init__(self):
+        self.calls = []
+
+    def detect_batch(self, images, upsample=0):
+        self.calls.append((len(images), upsample))
+        return [[(int(image[0, 0]), 0, 10, 10)] for image in images]
+
+
+def test_batched_detector_scatters_boxes_to_sessions():
+    backend = CountingDetector()
+    detector = BatchedDetector(backend, max_batch=8, max_delay_ms=100.0)
+    results = {}
+
+    def session(i):
+        results[i] = detector.detect(np.full((20, 20), i, np.uint8), upsample=i % 2)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    detector.batcher.close()
+    assert results == {i: [(i, 0, 10, 10)] for i in range(6)}
+    # One batch, one backend call per upsample level
+    assert detector.batcher.batches == 1
+    assert sorted(backend.calls) == [(3, 0), (3, 1)]
+
+
+def test_dnn_batch_output_is_split_per_image():
+    class Net:
+        def setInput(self, blob):
+            self.n = blob.shape[0]
+
+        def forward(self):
+            # image id, class, confidence, x1, y1, x2, y2
+            return np.array([[[[0, 1, 0.9, 0.25, 0.25, 0.5, 0.5],
+                               [1, 1, 0.8, 0.5, 0.5, 1.0, 1.0],
+                               [1, 1, 0.2, 0.0, 0.0, 1.0, 1.0]]]], dtype=np.float32)
+
+    detector = OpenCVDnnDetector.__new__(OpenCVDnnDetector)
+    detector._net = Net()
+    detector._lock = threading.Lock()
+    detector.confidence = 0.5
+    boxes = detector.detect_batch([np.zeros((100, 200, 3), np.uint8), np.zeros((60, 80), np.uint8),
+                                   np.zeros((10, 10, 3), np.uint8)])
+    assert detector._net.n == 3
+    assert boxes == [[(50, 25, 50, 25)], [(40, 30, 40, 30)], []]
+
+
+def test_skin_model_switches_to_a_segmentation_network(monkeypatch, tmp_path):
+    class HalfSkin(SkinSegmenter):
+        name = "half"
+
+        def segment_batch(self, images):
+            masks = []
+            for image in images:
+                mask = np.zeros(image.shape[:2], np.uint8)
+                mask[:, : image.shape[1] // 2] = 255
+                masks.append(mask)
+            return masks
+
+    monkeypatch.setattr(settings, "skin_linknet_weights", str(tmp_path / "missing.pth"))
+    service = RPPGService()
+    # Unknown backends, or networks that cannot load, keep the LUT
+    service.configure(skin_model="unknown")
+    service.configure(skin_model="linknet")
+    assert service.skin_model == "lut"
+
+    service._segmenter = HalfSkin()
+    roi = np.zeros((20, 40, 3), np.uint8)
+    roi[:, :20] = (10, 200, 50)
+    assert service.extract_roi_means(roi, 0, 0, 40, 20) == (50.0, 200.0, 10.0)
+    service.configure(skin_model="lut")
+    assert service._segmenter is None
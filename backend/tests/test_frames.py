@@ -0,0 +1,122 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.services.frames import (
+    PIXEL_I420,
+    PIXEL_JPEG,
+    PIXEL_NV12,
+    PIXEL_RGBA,
+    decode_frame,
+    encode_batch_message,
+    encode_frame_message,
+    jpeg_size,
+    message_timestamp,
+    parse_batch_message,
+    parse_frame_message,
+    read_frame,
+    reduced_decode_flag,
+)
+
+
+def encoded(width, height, ext=".jpg"):
+    rng = np.random.default_rng(0)
+    image = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3)).astype(np.uint8), (0, 0), 3)
+    return image, cv2.imencode(ext, image)[1].tobytes()
+
+
+def test_jpeg_size_reads_header():
+    _, data = encoded(1920, 1080)
+    assert jpeg_size(data) == (1920, 1080)
+    _, png = encoded(64, 48, ".png")
+    assert jpeg_size(png) is None
+    assert jpeg_size(data[:20]) is None
+
+
+def test_reduced_decode_keeps_at_least_target_width():
+    assert reduced_decode_flag(640) == cv2.IMREAD_COLOR
+    assert reduced_decode_flag(1280) == cv2.IMREAD_REDUCED_COLOR_2
+    assert reduced_decode_flag(1920) == cv2.IMREAD_REDUCED_COLOR_2
+    assert reduced_decode_flag(2560) == cv2.IMREAD_REDUCED_COLOR_4
+    assert reduced_decode_flag(5120) == cv2.IMREAD_REDUCED_COLOR_8
+
+
+def test_decode_frame_matches_full_decode_and_resize():
+    for width, height in ((1920, 1080), (480, 360)):
+        _, data = encoded(width, height)
+        full = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if width > 640:
+            full = cv2.resize(full, (640, int(height * 640 / width)), interpolation=cv2.INTER_AREA)
+        frame = decode_frame(data)
+        assert frame.shape == full.shape
+        assert np.abs(frame.astype(int) - full).mean() < 2.0
+
+    _, png = encoded(1280, 720, ".png")
+    assert decode_frame(png).shape == (360, 640, 3)
+    assert decode_frame(b"not an image") is None
+
+
+def test_raw_frames_round_trip_without_copy():
+    image, jpeg = encoded(320, 240)
+    rgba = cv2.cvtColor(image, cv2.COLOR_BGR2RGBA)
+    message = encode_frame_message(rgba, PIXEL_RGBA, seq=7, timestamp=1234.5)
+    header, pixels = parse_frame_message(message)
+    assert (header.seq, header.timestamp, header.width, header.height) == (7, 1234.5, 320, 240)
+    assert pixels.shape == (240, 320, 4) and not pixels.flags.owndata
+    frame, header = read_frame(message)
+    assert np.array_equal(frame, image) and header.seq == 7
+
+    i420 = cv2.cvtColor(image, cv2.COLOR_BGR2YUV_I420)
+    frame, header = read_frame(encode_frame_message(i420, PIXEL_I420, seq=8))
+    assert header.pixel_format == PIXEL_I420
+    assert np.abs(frame.astype(int) - image).mean() < 4.0
+
+    # NV12 interleaves U and V after the Y plane
+    nv12 = i420.copy()
+    u = i420[240:300].reshape(-1)
+    v = i420[300:360].reshape(-1)
+    nv12[240:].reshape(-1)[0::2] = u
+    nv12[240:].reshape(-1)[1::2] = v
+    frame_nv12, _ = read_frame(encode_frame_message(nv12, PIXEL_NV12))
+    assert np.array_equal(frame_nv12, frame)
+
+    # Encoded images still work, and carry no header
+    frame, header = read_frame(jpeg)
+    assert frame.shape == (240, 320, 3) and header is None
+
+
+def test_malformed_raw_frames_are_rejected():
+    message = encode_frame_message(np.zeros((10, 10, 4), np.uint8), PIXEL_RGBA)
+    with pytest.raises(ValueError):
+        parse_frame_message(message[:-1])
+    with pytest.raises(ValueError):
+        parse_frame_message(message[:5] + bytes([9]) + message[6:])
+    assert read_frame(message[:-1]) == (None, None)
+
+
+def test_frame_bursts_split_into_frame_messages():
+    image, jpeg = encoded(160, 120)
+    frames = [encode_frame_message(np.frombuffer(jpeg, np.uint8), PIXEL_JPEG, seq=i, timestamp=100.0 + 33.0 * i,
+                                   size=(160, 120)) for i in range(3)]
+    message = encode_batch_message(frames)
+    parts = parse_batch_message(message)
+    assert [bytes(p) for p in parts] == frames
+    assert message_timestamp(message) == 166.0
+    frame, header = read_frame(parts[2])
+    assert frame.shape == (120, 160, 3) and header.seq == 2
+
+    assert parse_batch_message(frames[0]) is None
+    with pytest.raises(ValueError):
+        parse_batch_message(message[:-1])
+    assert message_timestamp(message[:-1]) is None
+
+
+def test_crop_frames_carry_offset_and_keep_full_frame_scale():
+    image, _ = encoded(1280, 960)
+    crop = image[200:520, 400:720]
+    jpeg = cv2.imencode(".jpg", crop)[1].tobytes()
+    message = encode_frame_message(jpeg, PIXEL_JPEG, seq=3, offset=(400, 200), full_size=(1280, 960), size=(320, 320))
+    frame, header = read_frame(message)
+    assert (header.offset_x, header.offset_y, header.full_width, header.full_height) == (400, 200, 1280, 960)
+    # Same 0.5 scale as the 1280 px frame would get
+    assert frame.shape == (160, 160, 3)
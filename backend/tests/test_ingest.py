@@ -0,0 +1,108 @@
+import asyncio
+
+import cv2
+import numpy as np
+
+from app.services.detectors import FaceDetector
+from app.services.frames import PIXEL_RGBA, encode_frame_message, encode_means_message, message_timestamp
+from app.services.ingest import FrameQueue, QueuedMessage
+from app.services.rppg import RPPGService
+
+
+class NoFace(FaceDetector):
+    fixed_input = True
+
+    def detect(self, image, upsample=0):
+        return []
+
+
+def frame(ts):
+    return QueuedMessage("frame", b"", ts, ts / 1000.0, True)
+
+
+def drain(queue):
+    async def run():
+        out = []
+        while len(queue):
+            out.append(await queue.get())
+        return out
+    return asyncio.run(run())
+
+
+def pulse_means(count, samples=30):
+    ts = np.arange(samples, dtype=np.float64) * 33.0
+    return [encode_means_message(ts + i * samples * 33.0, np.full((samples, 3), 120.0), seq=i) for i in range(count)]
+
+
+def test_latest_frame_wins_and_keeps_control_messages():
+    queue = FrameQueue(maxsize=1)
+    queue.put(frame(0.0))
+    queue.put(QueuedMessage("config", {"type": "config"}, None, None, False))
+    queue.put(frame(33.0))
+    queue.put(frame(66.0))
+    kinds = [(m.kind, m.timestamp) for m in drain(queue)]
+    assert kinds == [("config", None), ("frame", 66.0)]
+    assert queue.dropped == 2
+
+
+def test_bounded_queue_drop_policies_and_lag_limit():
+    queue = FrameQueue(maxsize=2, policy="drop_newest")
+    for ts in (0.0, 33.0, 66.0):
+        queue.put(frame(ts))
+    assert [m.timestamp for m in drain(queue)] == [0.0, 33.0]
+    assert queue.dropped == 1
+
+    queue = FrameQueue(maxsize=3, policy="drop_oldest", max_lag_ms=100.0)
+    for ts in (0.0, 50.0, 150.0):
+        queue.put(frame(ts))
+    # 0 ms is 150 ms behind the newest frame: stale on dequeue
+    assert [m.timestamp for m in drain(queue)] == [50.0, 150.0]
+    assert queue.dropped == 1
+
+
+def test_waiting_bursts_stay_within_their_byte_budget():
+    def burst(ts, size=400):
+        return QueuedMessage("batch", bytes(size), ts, ts / 1000.0, False)
+
+    queue = FrameQueue(maxsize=1, max_burst_bytes=1000)
+    for ts in (0.0, 100.0, 200.0):
+        assert queue.put(burst(ts))
+    queue.put(frame(250.0))
+    # Too large on its own
+    assert not queue.put(burst(300.0, size=1001))
+    assert [(m.kind, m.timestamp) for m in drain(queue)] == [("batch", 100.0), ("batch", 200.0), ("frame", 250.0)]
+    assert queue.dropped == 2
+
+    queue = FrameQueue(policy="drop_newest", max_burst_bytes=1000)
+    assert queue.put(burst(0.0)) and queue.put(burst(100.0)) and not queue.put(burst(200.0))
+    assert [m.timestamp for m in drain(queue)] == [0.0, 100.0] and queue.dropped == 1
+    # Dequeued bursts free their share of the budget
+    assert queue.put(burst(300.0)) and queue.put(burst(400.0))
+
+
+def test_flooded_means_batches_stay_within_their_byte_budget():
+    messages = pulse_means(2000)
+    size = len(messages[0])
+    queue = FrameQueue(max_means_bytes=10 * size)
+    for i, data in enumerate(messages):
+        assert queue.put(QueuedMessage("means", data, float(i), None, False))
+    # The newest ten wait, in order; the rest were dropped as they came
+    assert [m.timestamp for m in drain(queue)] == [float(i) for i in range(1990, 2000)]
+    assert queue.dropped == 1990
+
+    queue = FrameQueue(policy="drop_newest", max_means_bytes=10 * size)
+    accepted = [queue.put(QueuedMessage("means", data, float(i), None, False)) for i, data in enumerate(messages)]
+    assert sum(accepted) == 10 and queue.dropped == 1990
+
+
+def test_capture_timestamps_drive_fps_not_processing_time():
+    assert message_timestamp(encode_means_message([10.0, 20.0], np.ones((2, 3)))) == 20.0
+    assert message_timestamp(b"\xff\xd8\xff") is None
+
+    service = RPPGService()
+    service.detector = NoFace()
+    rgba = cv2.cvtColor(np.full((48, 64, 3), 90, np.uint8), cv2.COLOR_BGR2RGBA)
+    # A burst of queued frames captured at 15 fps, processed back to back
+    for i in range(60):
+        service.process_frame(encode_frame_message(rgba, PIXEL_RGBA, seq=i, timestamp=1000.0 + i * 1000.0 / 15))
+    assert abs(service.capture_fps - 15.0) < 0.5
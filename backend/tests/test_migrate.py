@@ -0,0 +1,44 @@
+import pytest
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import Base
+from app.migrate import MIGRATIONS_DIR, available_migrations, migrate
+
+
+def columns(engine, table):
+    return {c["name"] for c in inspect(engine).get_columns(table)}
+
+
+def test_migrations_apply_once_in_order(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    names = [path.name for _, path in available_migrations(MIGRATIONS_DIR)]
+    assert names[0] == "001_init.sql"
+    assert migrate(engine) == names
+    assert migrate(engine) == []
+    assert "avatar_url" in columns(engine, "users")
+    with Session(engine) as db:
+        db.add(models.User(username="a", hashed_password="x", avatar_url="data:"))
+        db.commit()
+        assert db.query(models.User).one().avatar_url == "data:"
+
+
+def test_databases_created_from_the_models_migrate(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    Base.metadata.create_all(bind=engine)
+    assert len(migrate(engine)) == len(available_migrations(MIGRATIONS_DIR))
+    assert "avatar_url" in columns(engine, "users")
+
+
+def test_failed_migration_is_rolled_back(tmp_path):
+    (tmp_path / "001_first.sql").write_text("CREATE TABLE a (x INTEGER);")
+    (tmp_path / "002_broken.sql").write_text("CREATE TABLE b (x INTEGER);\nINSERT INTO missing VALUES (1);")
+    (tmp_path / "notes.txt").write_text("ignored")
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    with pytest.raises(Exception):
+        migrate(engine, tmp_path)
+    assert inspect(engine).get_table_names() == ["a", "schema_migrations"]
+
+    (tmp_path / "002_broken.sql").write_text("CREATE TABLE b (x INTEGER);")
+    assert migrate(engine, tmp_path) == ["002_broken.sql"]
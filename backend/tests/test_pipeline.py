@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from app.services.detectors import FaceDetector
+from app.services.frames import PIXEL_RGBA, encode_batch_message, encode_frame_message
+from app.services.pipeline import FramePipeline
+from app.services.rppg import RPPGService
+
+
+class BoxDetector(FaceDetector):
+    name = "box"
+
+    def detect(self, image, upsample=0):
+        # No face in the dark frames
+        return [(100, 60, 80, 80)] if image.mean() > 45 else []
+
+
+def pulse_frames(n=240, fs=30.0, bpm=90.0):
+    rng = np.random.default_rng(5)
+    texture = rng.integers(0, 60, size=(240, 320, 1)).astype(float)
+    frames = []
+    for i in range(n):
+        level = 110 + 6 * np.sin(2 * np.pi * bpm / 60.0 * i / fs)
+        rgba = np.empty((240, 320, 4), np.uint8)
+        rgba[..., :3] = np.clip(texture + [level + 40, level, level - 20], 0, 255)
+        rgba[..., 3] = 255
+        if i % 50 == 7:
+            rgba[..., :3] = 20
+        frames.append(encode_frame_message(rgba, PIXEL_RGBA, seq=i, timestamp=1000.0 + i * 1000.0 / fs))
+    return frames
+
+
+def new_service(**config):
+    service = RPPGService()
+    service.detector = BoxDetector()
+    service.configure(**{"localisation_mode": "track", "detect_interval": 5, "vitals_cadence": {"bpm": 0}, **config})
+    return service
+
+
+def test_pipelined_frames_match_serial_processing():
+    frames = pulse_frames()
+    serial = new_service()
+    expected = [serial.process_frame(f) for f in frames]
+
+    service = new_service()
+    pipeline = FramePipeline(service, queue_size=2)
+    try:
+        futures = [pipeline.submit(f) for f in frames]
+        results = [f.result(timeout=30) for f in futures]
+    finally:
+        pipeline.close()
+
+    assert results == expected
+    assert [r["seq"] for r in results] == list(range(len(frames)))
+    assert sum(r["quality"] == "No Face" for r in results) == 5
+    np.testing.assert_array_equal(service.samples.view(), serial.samples.view())
+    assert service.fps == serial.fps and results[-1]["bpm"] > 0
+
+
+def test_pipeline_errors_complete_in_order():
+    service = new_service()
+    # One buffer row per frame
+    service.configure(resample_mode="off")
+    calls = []
+    roi_means = service.roi_means_stage
+
+    def failing(job):
+        calls.append(job.header.seq)
+        if job.header.seq == 1:
+            raise RuntimeError("boom")
+        roi_means(job)
+
+    service.roi_means_stage = failing
+    pipeline = FramePipeline(service)
+    try:
+        futures = [pipeline.submit(f) for f in pulse_frames(3)]
+        order = []
+        for i, f in enumerate(futures):
+            f.add_done_callback(lambda _, i=i: order.append(i))
+        with pytest.raises(RuntimeError):
+            futures[1].result(timeout=10)
+        assert futures[2].result(timeout=10)["seq"] == 2
+    finally:
+        pipeline.close()
+    assert order == [0, 1, 2]
+    # The failed frame never reached the signal buffers
+    assert len(service.samples) == 2
+
+
+def test_bursts_give_the_same_signal_as_single_frames():
+    frames = pulse_frames(330)
+    for filter_mode in ("filtfilt", "streaming"):
+        single = new_service(filter_mode=filter_mode, vitals_cadence={"bpm": 4.0})
+        expected = [single.process_frame(f) for f in frames][-1]
+
+        burst = new_service(filter_mode=filter_mode, vitals_cadence={"bpm": 4.0})
+        for i in range(0, len(frames), 30):
+            result = burst.process_batch_message(encode_batch_message(frames[i:i + 30]))
+
+        assert result == expected and result["seq"] == 329 and result["bpm"] > 0
+        np.testing.assert_allclose(burst.samples.view(), single.samples.view(), atol=1e-9)
+        np.testing.assert_allclose(burst.filtered.view(), single.filtered.view(), atol=1e-9)
+
+
+def test_restored_session_reads_from_the_first_frame():
+    import pickle
+
+    frames = pulse_frames(360)
+    for config in ({}, {"filter_mode": "streaming", "spectrum_mode": "sliding"}):
+        before = new_service(**config)
+        last = [before.process_frame(f) for f in frames[:300]][-1]
+        snapshot = pickle.loads(pickle.dumps(before.snapshot()))
+
+        # Reconnect after a one-second gap
+        resumed = new_service()
+        calls = []
+        detect = resumed.detector.detect
+        resumed.detector.detect = lambda image, upsample=0: calls.append(1) or detect(image, upsample)
+        assert resumed.restore(snapshot)
+        first = resumed.process_frame(frames[330])
+        assert abs(first["bpm"] - last["bpm"]) < 5 and first["bpm"] > 0
+        assert resumed.filter_mode == before.filter_mode and resumed.fps == before.fps
+        # The face is tracked on from the snapshot, not detected again
+        assert calls == [] and resumed.tracker.box is not None
+
+        assert new_service(**config).process_frame(frames[330])["bpm"] == 0
+    assert not RPPGService().restore({"version": 0})
@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+from app.core.config import settings
+from app.services.registry import ModelRegistry, preload_models, registry
+from app.services.segmentation import SegmenterUnavailable, get_segmenter
+
+
+class Model:
+    warm = 0
+
+    def warm_up(self):
+        self.warm += 1
+
+
+def test_models_load_and_warm_up_once():
+    built = []
+
+    def factory():
+        built.append(1)
+        return Model()
+
+    models = ModelRegistry()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(models.get("detector", "x", factory)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(built) == 1 and results[0].warm == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_failed_loads_are_not_kept():
+    models = ModelRegistry()
+    with pytest.raises(RuntimeError):
+        models.get("detector", "y", lambda: (_ for _ in ()).throw(RuntimeError("no model")))
+    assert models.loaded() == []
+    assert models.get("detector", "y", Model).warm == 1
+    assert models.loaded() == [("detector", "y")]
+
+
+def test_preload_models_by_backend_name(monkeypatch):
+    # dlib is a hard dependency, so its detector always loads
+    failed = preload_models(["dlib_hog", "no_such_model"])
+    assert failed == ["no_such_model"]
+    assert ("detector", "dlib_hog") in registry
+
+    monkeypatch.setattr(settings, "skin_unet11_weights", "")
+    with pytest.raises(SegmenterUnavailable):
+        get_segmenter("unet11")
@@ -0,0 +1,52 @@
+import json
+
+from app.services.results import ResultStream, decode_result, encode_result
+
+
+def sample(bpm=72.0, quality="Good", crop=None, seq=7):
+    result = {"bpm": bpm, "spo2": 97.5, "resp_rate": 14.0, "snr": 12.3, "lighting": 120.4,
+              "quality": quality, "roi": [10, -4, 60, 30], "seq": seq, "dropped": 2}
+    if crop is not None:
+        result["crop"] = crop
+    return result
+
+
+def test_binary_result_round_trip():
+    message = encode_result(sample(crop=[4, 8, 200, 160]), 41, keyframe=True)
+    assert len(message) == 72
+    decoded = decode_result(message)
+    assert decoded == dict(sample(crop=[4, 8, 200, 160]), id=41, keyframe=True)
+
+    bare = decode_result(encode_result({"bpm": 0, "quality": "No Face", "crop": None}, 0))
+    assert bare["quality"] == "No Face" and bare["crop"] is None
+    assert "seq" not in bare and "roi" not in bare and not bare["keyframe"]
+
+
+def test_default_stream_sends_every_result_as_json():
+    stream = ResultStream()
+    messages = [stream.encode(sample(), t * 0.1) for t in range(5)]
+    assert all(json.loads(m) == sample() for m in messages)
+
+
+def test_change_only_stream_with_rate_cap_and_keyframes():
+    stream = ResultStream()
+    stream.apply_config({"resultEncoding": "binary", "resultMinDelta": 0.5, "resultMaxRate": 5,
+                         "resultKeyframeInterval": 1.0})
+    sent = {}
+    bpm = [72.0, 72.2, 72.4, 73.0, 73.0, 73.1, 73.1, 73.1, 73.1, 73.1, 73.1, 73.1, 80.0]
+    for i, b in enumerate(bpm):
+        message = stream.encode(sample(bpm=b, seq=i), i * 0.1)
+        if message is not None:
+            sent[i] = decode_result(message)
+    # 0: first keyframe; 3: +1.0 bpm, but within 0.2 s of nothing sent -> ok;
+    # 10: keyframe after 1 s; 12: change, rate cap of 5/s satisfied
+    assert sorted(sent) == [0, 3, 10, 12]
+    assert [sent[i]["keyframe"] for i in (0, 3, 10, 12)] == [True, False, True, False]
+    assert [sent[i]["id"] for i in (0, 3, 10, 12)] == [0, 1, 2, 3]
+    assert sent[12]["bpm"] == 80.0
+
+    # Rate cap: a change 0.1 s after the last message waits for the next result
+    assert stream.encode(sample(bpm=90.0), 1.3) is None
+    assert stream.encode(sample(bpm=90.0), 1.45) is not None
+    # Quality changes count whatever the vitals do
+    assert stream.encode(sample(bpm=90.0, quality="Poor"), 1.7) is not None
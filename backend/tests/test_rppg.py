@@ -0,0 +1,499 @@
+import numpy as np
+
+from app.services.buffers import RingBuffer, UniformResampler
+from app.services.detectors import DetectorUnavailable, FaceDetector, boxes_from_ssd, get_detector
+from app.services.filters import StreamingBandpass
+from app.services.rppg import (
+    COL_BVP,
+    COL_GREEN,
+    HR_BAND,
+    POS_WINDOW,
+    RPPGService,
+    grid_means,
+    pos_sample,
+    pos_series,
+)
+
+
+FS = 30.0
+
+
+def synthetic_rgb(n, bpm=120.0, fs=FS, noise=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) / fs
+    pulse = np.sin(2 * np.pi * (bpm / 60.0) * t)
+    r = 150.0 + 0.3 * pulse + noise * rng.standard_normal(n)
+    g = 120.0 + 1.0 * pulse + noise * rng.standard_normal(n)
+    b = 100.0 + 0.2 * pulse + noise * rng.standard_normal(n)
+    return np.stack([r, g, b], axis=1)
+
+
+def fill_service(service, rgb):
+    for r, g, b in rgb:
+        service.samples.append((r, g, b, 0.299 * r + 0.587 * g + 0.114 * b))
+
+
+def test_ring_buffer_ordered_view_wraps_without_copy():
+    buf = RingBuffer(4, width=2)
+    for i in range(6):
+        evicted = buf.append((i, -i))
+    assert len(buf) == 4
+    assert evicted.tolist() == [1.0, -1.0]
+    view = buf.view()
+    assert view[:, 0].tolist() == [2.0, 3.0, 4.0, 5.0]
+    assert np.shares_memory(view, buf._data)
+    assert not view.flags.writeable
+    assert buf.last(2)[:, 1].tolist() == [-4.0, -5.0]
+
+    buf.extend([(i, -i) for i in range(6, 9)])
+    assert buf.view()[:, 0].tolist() == [5.0, 6.0, 7.0, 8.0]
+
+
+def test_vitals_read_from_ring_buffer():
+    service = RPPGService()
+    fill_service(service, synthetic_rgb(400))
+    assert len(service.samples) == service.buffer_size
+    assert service.samples.column(COL_GREEN).shape == (service.buffer_size,)
+    bpm, snr = service.calculate_bpm_snr(service.calculate_pos_signal())
+    assert abs(bpm - 120.0) < 3.0
+    assert snr > 0
+    assert 85 <= service.calculate_spo2() <= 100
+    assert service.calculate_resp_rate() >= 0
+    assert service.calculate_lighting() > 90
+
+
+def test_sliding_spectrum_matches_batch_estimate():
+    service = RPPGService()
+    service.configure(spectrum_mode="sliding")
+    for r, g, b in synthetic_rgb(700, bpm=110.0, noise=3.0, seed=1):
+        service._append_sample((r, g, b, 0.0))
+    assert service._sdft is not None
+
+    batch_bpm, batch_snr = service.calculate_bpm_snr(service.calculate_pos_signal())
+    sliding_bpm, sliding_snr = service.calculate_bpm_snr_sliding()
+    assert sliding_bpm == batch_bpm
+    assert abs(sliding_snr - batch_snr) < 2.0
+
+    service.configure(spectrum_mode="batch")
+    assert service._sdft is None
+
+
+def test_streaming_filter_stage_tracks_heart_rate_and_rebuilds():
+    service = RPPGService()
+    service.configure(filter_mode="streaming")
+    for r, g, b in synthetic_rgb(400, bpm=96.0, noise=0.5, seed=2):
+        service._append_sample((r, g, b, 0.0))
+    assert service._streaming_ready()
+    bvp_filter = service._bvp_filter
+    bpm, snr = service.calculate_bpm_snr(service.filtered.column(COL_BVP), prefiltered=True)
+    assert abs(bpm - 96.0) < 6.0
+    assert snr > 0
+
+    # Same design is reused from the cache
+    assert StreamingBandpass(bvp_filter.order, HR_BAND, service.fps).sos is bvp_filter.sos
+
+    # A new motion_rejection changes the order, fps drift changes the fs bucket
+    service.configure(motion_rejection=100)
+    service._append_sample((150.0, 120.0, 100.0, 0.0))
+    assert service._bvp_filter is not bvp_filter
+    assert service._bvp_filter.order == 4
+    bvp_filter = service._bvp_filter
+    service.fps = 20.0
+    service._append_sample((150.0, 120.0, 100.0, 0.0))
+    assert service._bvp_filter is not bvp_filter
+    assert service._bvp_filter.fs == 20.0
+    assert len(service.filtered) == len(service.samples)
+
+
+def test_pos_sample_matches_pos_series():
+    rgb = synthetic_rgb(120, noise=1.0)
+    series = pos_series(rgb)
+    for i in range(POS_WINDOW - 1, len(rgb)):
+        assert abs(series[i] - pos_sample(rgb[i - POS_WINDOW + 1:i + 1])) < 1e-9
+
+
+def test_vitals_run_on_their_own_cadence():
+    service = RPPGService()
+    calls = {"bpm": 0, "resp_rate": 0}
+
+    def counting(name, fn):
+        def wrapper():
+            calls[name] += 1
+            return fn()
+        return wrapper
+
+    service.estimate_bpm = counting("bpm", service.estimate_bpm)
+    service.calculate_resp_rate = counting("resp_rate", service.calculate_resp_rate)
+
+    rgb = synthetic_rgb(300 + 150)
+    for r, g, b in rgb[:300]:
+        service._append_sample((r, g, b, 0.0))
+    first = service.compute_vitals()
+    assert first["bpm"] > 0
+    for r, g, b in rgb[300:]:
+        service._append_sample((r, g, b, 0.0))
+        service.compute_vitals()
+
+    # 150 samples at 30 fps = 5 s of stream time: 4 Hz BPM, 0.5 Hz respiration
+    assert 20 <= calls["bpm"] <= 22
+    assert calls["resp_rate"] == 3
+
+    before = calls["bpm"]
+    service.configure(vitals_cadence={"bpm": 0, "unknown": 5})
+    service.compute_vitals()
+    service.compute_vitals()
+    assert calls["bpm"] == before + 2
+    assert "unknown" not in service.scheduler.cadence
+
+
+def test_bpm_smoothing_spans_the_same_time_at_any_cadence():
+    rgb = synthetic_rgb(300 + 150)
+    spans = {}
+    for cadence in (0, 2, 4, 10):
+        service = RPPGService()
+        service.configure(motion_rejection=100, vitals_cadence={"bpm": cadence})
+        for r, g, b in rgb[:300]:
+            service._append_sample((r, g, b, 0.0))
+        for r, g, b in rgb[300:]:
+            service._append_sample((r, g, b, 0.0))
+            service.compute_vitals()
+        spans[cadence] = len(service.bpm_history) / (cadence or service.fps)
+    # One second of estimates, however often they are made
+    assert spans == {0: 1.0, 2: 1.0, 4: 1.0, 10: 1.0}
+
+
+class FakeDetector(FaceDetector):
+    name = "fake"
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def detect(self, image, upsample=0):
+        return self.fn(image, upsample)
+
+
+def textured_frame(offset_x=0, offset_y=0, size=(240, 320)):
+    rng = np.random.default_rng(3)
+    frame = np.full(size, 40, dtype=np.uint8)
+    patch = rng.integers(0, 255, size=(80, 80), dtype=np.uint8)
+    frame[60 + offset_y:140 + offset_y, 100 + offset_x:180 + offset_x] = patch
+    return frame
+
+
+def test_track_mode_detects_once_then_tracks():
+    service = RPPGService()
+    calls = []
+
+    def detector(gray, upsample):
+        calls.append(upsample)
+        return [(100, 60, 80, 80)]
+
+    service.detector = FakeDetector(detector)
+    service.configure(localisation_mode="track", detect_interval=5)
+    assert service.locate_face(textured_frame()) == (100, 60, 80, 80)
+    # Tracking runs at reduced resolution: within a couple of pixels
+    x, y, w, h = service.locate_face(textured_frame(3, 2))
+    assert abs(x - 103) <= 2 and abs(y - 62) <= 2 and (w, h) == (80, 80)
+    for _ in range(3):
+        service.locate_face(textured_frame(3, 2))
+    assert len(calls) == 1
+    # Interval reached: full detection again
+    service.locate_face(textured_frame(3, 2))
+    assert len(calls) == 2
+    # Tracking confidence lost: full detection again
+    service.locate_face(np.full((240, 320), 40, dtype=np.uint8))
+    assert len(calls) == 3
+    assert {"detect", "track"} <= set(service.timings.snapshot())
+
+    service.configure(localisation_mode="detect")
+    service.locate_face(textured_frame())
+    service.locate_face(textured_frame())
+    assert len(calls) == 5
+
+
+def test_detection_downscales_then_escalates():
+    service = RPPGService()
+    seen = []
+
+    def detector(gray, upsample):
+        seen.append((gray.shape[1], upsample))
+        if gray.shape[1] == 160:
+            # Face found on the half-size copy
+            return [(40, 20, 100, 100)]
+        return []
+
+    service.detector = FakeDetector(detector)
+    frame = np.zeros((240, 640), dtype=np.uint8)
+    # No previous face: detect on a 320 px copy, then full res upsampled
+    assert service.detect_faces(frame) == []
+    assert seen == [(320, 0), (640, 1)]
+
+    service._last_face_width = 400
+    seen.clear()
+    assert service.detect_faces(frame) == [(160, 80, 400, 400)]
+    assert seen == [(160, 0)]
+    assert service._last_face_width == 400
+
+
+def test_missed_detections_escalate_only_every_few_frames():
+    from app.services.rppg import DETECT_ESCALATE_EVERY
+
+    service = RPPGService()
+    calls = []
+    service.detector = FakeDetector(lambda gray, upsample: calls.append((gray.shape[1], upsample)) or [])
+    service._last_face_width = 400
+    frame = np.zeros((240, 640), dtype=np.uint8)
+    per_frame = []
+    for _ in range(2 * DETECT_ESCALATE_EVERY):
+        calls.clear()
+        assert service.detect_faces(frame) == []
+        per_frame.append(list(calls))
+    # One cheap pass per missed frame, the full search on every few only,
+    # still sized from the face seen last
+    assert all(len(c) <= 2 for c in per_frame)
+    assert sum(len(c) for c in per_frame) == 2 * DETECT_ESCALATE_EVERY + 2
+    assert [c[-1] for c in per_frame if len(c) == 2] == [(640, 1), (640, 1)]
+    assert all(c[0] == (160, 0) for c in per_frame)
+    assert service._last_face_width == 400
+
+
+def test_ssd_output_to_boxes():
+    detections = np.zeros((1, 1, 3, 7))
+    detections[0, 0, 0] = [0, 1, 0.3, 0.1, 0.1, 0.2, 0.2]
+    detections[0, 0, 1] = [0, 1, 0.9, 0.25, 0.5, 0.75, 1.2]
+    detections[0, 0, 2] = [0, 1, 0.7, 0.0, 0.0, 0.5, 0.5]
+    boxes = boxes_from_ssd(detections, 200, 100, confidence=0.5)
+    assert boxes == [(50, 50, 100, 50), (0, 0, 100, 50)]
+
+
+def test_detector_backends_are_shared_and_selectable():
+    try:
+        detector = get_detector("dlib_hog")
+    except DetectorUnavailable:
+        detector = None
+    if detector is not None:
+        assert get_detector("dlib_hog") is detector
+        assert detector.detect(np.zeros((120, 160), dtype=np.uint8)) == []
+
+    service = RPPGService()
+    service.configure(face_detector="no_such_backend")
+    assert service.detector_name is None
+
+
+def test_unavailable_detector_falls_back_to_dlib(monkeypatch):
+    from app.core.config import settings
+    from app.services.frames import PIXEL_RGBA, encode_frame_message
+
+    monkeypatch.setattr(settings, "face_detector", "opencv_dnn")
+    monkeypatch.setattr(settings, "face_detector_dnn_config", "no_such_deploy.prototxt")
+    service = RPPGService()
+    frame = encode_frame_message(np.full((120, 160, 4), 90, np.uint8), PIXEL_RGBA, seq=1, timestamp=1.0)
+    result = service.process_frame(frame)
+    assert result["detector"] == "dlib_hog" and result["detector_fallback_from"] == "opencv_dnn"
+
+    service = RPPGService()
+    service.configure(face_detector="opencv_dnn", report_timings=True)
+    assert service.detector_name == "dlib_hog" and service.detector_fallback_from == "opencv_dnn"
+    service.configure(face_detector="dlib_hog")
+    result = service.process_frame(frame)
+    assert result["detector"] == "dlib_hog" and "detector_fallback_from" not in result
+
+
+def test_fused_roi_extraction_matches_per_roi_means():
+    rng = np.random.default_rng(4)
+    frame = np.clip(np.array([150, 170, 215]) + rng.normal(0, 8, (240, 320, 3)), 0, 255).astype(np.uint8)
+    # A dark, non-skin block exercises the unmasked fallback
+    frame[150:200, 40:100] = 20
+    rois = [(60, 30, 80, 40), (40, 150, 60, 50), (150, 60, 40, 40), (300, 200, 40, 40), (500, 10, 10, 10)]
+    service = RPPGService()
+    fused = service.extract_rois_fused(frame, rois)
+    assert fused[-1] is None
+    for box, means in zip(rois[:-1], fused[:-1]):
+        expected = service.extract_roi_means(frame, *box)
+        # Morphology runs once over the whole region instead of per ROI
+        assert np.allclose(means, expected, atol=1.0)
+
+    grid = [(x, y, 40, 40) for x in range(40, 200, 40) for y in range(20, 180, 40)]
+    assert service.extract_rois(frame, grid) == service.extract_rois_fused(frame, grid)
+
+
+def test_grid_means_match_per_block_loop():
+    rng = np.random.default_rng(5)
+    crop = rng.integers(0, 256, (64, 96, 3)).astype(np.uint8)
+    mask = np.where(rng.random((64, 96)) < 0.5, 255, 0).astype(np.uint8)
+    mask[:8, :12] = 0  # one block without skin falls back to the plain mean
+    rows = grid_means(crop, mask, 8)
+    assert rows.shape == (64, 4)
+    for i in range(8):
+        for j in range(8):
+            block = crop[i * 8:(i + 1) * 8, j * 12:(j + 1) * 12].astype(float)
+            m = mask[i * 8:(i + 1) * 8, j * 12:(j + 1) * 12] > 0
+            expected = block[m].mean(axis=0) if m.mean() >= 0.1 else block.reshape(-1, 3).mean(axis=0)
+            assert np.allclose(rows[i * 8 + j, :3], expected[::-1], atol=1e-3)
+            assert np.isclose(rows[i * 8 + j, 3], m.mean(), atol=1e-4)
+
+
+def test_grid_mode_weights_regions_by_their_own_snr():
+    service = RPPGService()
+    service.configure(roi_mode="grid", roi_grid=4)
+    rng = np.random.default_rng(6)
+    pulse = synthetic_rgb(300, bpm=120.0, noise=0.05)
+    for k, (r, g, b) in enumerate(pulse):
+        regions = np.empty((16, 4))
+        regions[:, :3] = (r, g, b)
+        regions[:, 3] = 0.8
+        # Half the face is covered by a moving, noisy occluder
+        regions[8:, :3] = 120.0 + 3.0 * rng.standard_normal((8, 3))
+        regions[12:, 3] = 0.0
+        service._append_sample((r, g, b, 0.0), regions)
+
+    bpm, snr = service.calculate_bpm_snr_grid()
+    assert abs(bpm - 120.0) < 3.0
+    assert snr > 50
+    weights = service.region_weights
+    assert weights.shape == (16,)
+    assert np.all(weights[12:] == 0)
+    assert weights[:8].min() > 3 * weights[8:12].max()
+
+    # Changing the grid drops the region history
+    service.configure(roi_grid=8)
+    assert service.regions is None
+
+
+def test_skin_lut_matches_ycrcb_bounds_and_calibrates():
+    import cv2
+
+    from app.services.skin import DEFAULT_SKIN_LUT, SKIN_YCRCB_LOWER, SKIN_YCRCB_UPPER
+
+    rng = np.random.default_rng(7)
+    image = rng.integers(0, 256, (120, 160, 3)).astype(np.uint8)
+    exact = cv2.inRange(cv2.cvtColor(image, cv2.COLOR_BGR2YCrCb), SKIN_YCRCB_LOWER, SKIN_YCRCB_UPPER)
+    lut = DEFAULT_SKIN_LUT.classify(image)
+    assert lut.shape == exact.shape and lut.dtype == np.uint8
+    # Only colours near the box edges may land in the other bin
+    assert np.mean(lut != exact) < 0.02
+
+    # A bluish, dim skin tone the fixed bounds reject
+    face = np.clip(np.array([120, 105, 110]) + rng.normal(0, 3, (200, 200, 3)), 0, 255).astype(np.uint8)
+    service = RPPGService()
+    service.configure(skin_calibration=True, skin_morphology=False)
+    assert np.mean(service.skin_segmentation(face) > 0) < 0.1
+    assert service.calibrate_skin(face, (0, 0, 200, 200))
+    assert np.mean(service.skin_segmentation(face) > 0) > 0.9
+    service.configure(skin_calibration=False)
+    assert service.skin_lut is None
+
+
+def test_crop_upload_mode_processes_crops_in_face_coordinates():
+    import cv2
+
+    from app.services.frames import PIXEL_RGBA, encode_frame_message
+
+    rng = np.random.default_rng(8)
+    full = np.full((960, 1280, 3), 40, dtype=np.uint8)
+    full[240:560, 400:720] = cv2.resize(rng.integers(0, 255, (80, 80, 3), dtype=np.uint8), (320, 320))
+    calls = []
+
+    def detector(gray, upsample):
+        calls.append(gray.shape)
+        ys, xs = np.nonzero(gray != 40)
+        if len(xs) == 0:
+            return []
+        return [(xs.min(), ys.min(), xs.max() - xs.min() + 1, ys.max() - ys.min() + 1)]
+
+    def message(image, offset=(0, 0)):
+        rgba = cv2.cvtColor(image, cv2.COLOR_BGR2RGBA)
+        return encode_frame_message(rgba, PIXEL_RGBA, seq=len(calls), offset=offset, full_size=(1280, 960))
+
+    service = RPPGService()
+    service.detector = FakeDetector(detector)
+    service.configure(upload_mode="crop", localisation_mode="track", detect_interval=30)
+    first = service.process_frame(message(full))
+    # Processed at 640 px wide; the crop is asked for in the client's 1280 px frame
+    assert first["roi"][:2] == [240, 136]
+    assert first["crop"] == [240, 80, 640, 640]
+
+    x, y, w, h = first["crop"]
+    second = service.process_frame(message(full[y:y + h, x:x + w], offset=(x, y)))
+    assert abs(second["roi"][0] - 240) <= 2 and abs(second["roi"][1] - 136) <= 2
+    assert all(abs(a - b) <= 4 for a, b in zip(second["crop"], first["crop"]))
+    assert len(calls) == 1
+
+    # Face gone from the crop: ask for a full frame
+    blank = np.full((h, w, 3), 40, dtype=np.uint8)
+    lost = service.process_frame(message(blank, offset=(x, y)))
+    assert lost["quality"] == "No Face" and lost["crop"] is None
+
+
+def test_roi_means_messages_skip_the_image_pipeline():
+    from app.services.frames import encode_means_message, parse_means_message
+
+    rgb = synthetic_rgb(300, bpm=90.0)
+    timestamps = 1000.0 + np.arange(300) * 1000.0 / FS
+    header, records = parse_means_message(encode_means_message(timestamps[:10], rgb[:10], seq=5))
+    assert (header.regions, header.count, header.seq) == (1, 10, 5)
+    assert np.allclose(records["rgb"][:, 0], rgb[:10], atol=1e-3)
+
+    service = RPPGService()
+    service.fps = 10.0
+    service.configure(vitals_cadence={"bpm": 0})
+
+    def fail(*args):
+        raise AssertionError("detector must not run")
+
+    service.detector = FakeDetector(fail)
+    for start in range(0, 300, 10):
+        # Three regions per record, e.g. forehead and cheeks
+        batch = np.repeat(rgb[start:start + 10, None, :], 3, axis=1)
+        result = service.process_means_message(encode_means_message(timestamps[start:start + 10], batch, seq=start))
+    assert len(service.samples) == 300
+    assert abs(service.fps - FS) < 1.0
+    assert result["seq"] == 299 and "roi" not in result
+    assert abs(result["bpm"] - 90.0) < 3.0
+    assert service.process_means_message(b"RPMS\x01\x01\x05\x00") is None
+
+
+def test_resampler_is_independent_of_chunking():
+    rng = np.random.default_rng(1)
+    t = np.cumsum(rng.uniform(0.02, 0.045, 400))
+    # A capture gap: the grid restarts after it instead of interpolating
+    t[200:] += 2.0
+    x = np.stack([np.sin(2 * np.pi * 1.3 * t), np.cos(t)], axis=1)
+    for mode in ("linear", "cubic"):
+        whole = UniformResampler(mode).push(t, x)
+        chunked = UniformResampler(mode)
+        parts, i = [], 0
+        while i < len(t):
+            n = int(rng.integers(1, 20))
+            parts.append(chunked.push(t[i:i + n], x[i:i + n]))
+            i += n
+        np.testing.assert_allclose(np.concatenate(parts), whole, atol=1e-9)
+
+        first = UniformResampler(mode)
+        out = first.push(t[:200], x[:200])
+        grid = t[0] + np.arange(len(out)) / first.fs
+        assert first.fs == 33.0
+        assert np.max(np.abs(out[:, 0] - np.sin(2 * np.pi * 1.3 * grid))) < (0.02 if mode == "linear" else 0.01)
+
+
+def test_jittered_capture_gives_the_same_readings_live_and_replayed():
+    rng = np.random.default_rng(3)
+    # Capture jitter of +-40% and some dropped frames around 30 fps
+    dt = rng.uniform(0.6, 1.4, 600) / FS
+    dt[rng.random(600) < 0.1] *= 2.5
+    t = np.cumsum(dt)
+    pulse = np.sin(2 * np.pi * 80.0 / 60.0 * t)
+    rgb = np.stack([150 + 0.3 * pulse, 120 + pulse, 100 + 0.2 * pulse], axis=1)
+    ts = 1000.0 + t * 1000.0
+
+    def run(chunk, mode="linear"):
+        service = RPPGService()
+        service.configure(resample_mode=mode)
+        for i in range(0, len(ts), chunk):
+            result = service.process_means(ts[i:i + chunk], rgb[i:i + chunk])
+        return result
+
+    live = run(1)
+    assert abs(live["bpm"] - 80.0) < 4.0
+    assert run(600) == live and run(37) == live
+    assert abs(run(1, "cubic")["bpm"] - 80.0) < 4.0
@@ -0,0 +1,32 @@
+from app.services.sessions import SessionCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_snapshots_expire_and_are_taken_once():
+    clock = Clock()
+    cache = SessionCache(ttl=30.0, max_entries=2, clock=clock)
+    a, b, c = (cache.new_token() for _ in range(3))
+    assert len({a, b, c}) == 3
+
+    cache.put(a, "a")
+    clock.now = 20.0
+    cache.put(b, "b")
+    assert cache.take(a) == "a" and cache.take(a) is None
+
+    cache.put(a, "a2")
+    cache.put(c, "c")
+    # Over the cap: the oldest entry goes
+    assert len(cache) == 2 and cache.take(b) is None
+    clock.now = 50.0
+    assert cache.take(a) is None and len(cache) == 0
+
+    disabled = SessionCache(max_entries=0, clock=clock)
+    disabled.put(a, "a")
+    assert disabled.take(a) is None
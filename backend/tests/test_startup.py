@@ -0,0 +1,66 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+# Seconds for importing app.main on top of its web libraries (FastAPI,
+# SQLAlchemy, pydantic, jose, passlib): the app's own modules only
+IMPORT_BUDGET_S = 0.5
+HEAVY_MODULES = ("cv2", "numpy", "scipy", "dlib", "torch")
+
+PROBE = """
+import json, sys, time
+import fastapi, fastapi.security, pydantic_settings, sqlalchemy.orm, sqlalchemy.ext.declarative
+import jose.jwt, passlib.context
+start = time.perf_counter()
+import app.main
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "heavy": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def test_app_import_is_within_budget(tmp_path):
+    env = dict(os.environ, PYTHONPATH=str(BACKEND_DIR))
+    runs = []
+    for _ in range(2):
+        # Run elsewhere: importing must not create or touch the database
+        out = subprocess.run([sys.executable, "-c", PROBE], cwd=tmp_path, env=env,
+                             capture_output=True, text=True, check=True)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    assert runs[0]["heavy"] == []
+    assert min(r["seconds"] for r in runs) < IMPORT_BUDGET_S, runs
+    assert list(tmp_path.iterdir()) == []
+
+
+
+def test_startup_does_not_wait_for_the_workers(monkeypatch):
+    import time
+
+    from fastapi.testclient import TestClient
+
+    from app.core.config import settings
+    from app.main import app
+    from app.services import workers
+
+    # Stand-in for spawning the processes, which costs ~0.1 s per worker
+    started = []
+
+    def start_pool():
+        time.sleep(0.1 * settings.rppg_workers)
+        started.append(settings.rppg_workers)
+
+    monkeypatch.setattr(settings, "db_migrate_on_startup", False)
+    monkeypatch.setattr(settings, "create_default_admin", False)
+    monkeypatch.setattr(workers, "get_worker_pool", start_pool)
+    startup = {}
+    for size in (1, 8):
+        monkeypatch.setattr(settings, "rppg_workers", size)
+        start = time.perf_counter()
+        with TestClient(app) as client:
+            startup[size] = time.perf_counter() - start
+            assert client.get("/").status_code == 200
+    assert started == [1, 8]
+    assert startup[8] < startup[1] + 0.2, startup
@@ -0,0 +1,247 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.services.frames import encode_means_message
+from app.services.workers import SessionWorkerPool, WorkerError
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = SessionWorkerPool(2, slots=4, slot_size=64 * 1024)
+    yield pool
+    pool.shutdown()
+
+
+def pulse_batches(bpm, n=300, fs=30.0, batch=30):
+    t = np.arange(n) / fs
+    pulse = np.sin(2 * np.pi * bpm / 60.0 * t)
+    rgb = np.stack([150 + 0.3 * pulse, 120 + pulse, 100 + 0.2 * pulse], axis=1)
+    ts = 1000.0 + t * 1000.0
+    return [encode_means_message(ts[i:i + batch], rgb[i:i + batch], seq=i) for i in range(0, n, batch)]
+
+
+def test_sessions_stay_resident_in_their_worker(pool):
+    async def run():
+        a = pool.open_session()
+        b = pool.open_session()
+        # Spread over both workers
+        assert pool._sessions[a] is not pool._sessions[b]
+        pool.configure(a, {"vitalsCadence": {"bpm": 0}})
+        pool.configure(b, {"vitalsCadence": {"bpm": 0}})
+        results = {}
+        for sid, bpm in ((a, 72.0), (b, 132.0)):
+            for message in pulse_batches(bpm):
+                results[sid] = await pool.process(sid, "means", message)
+        pool.close_session(a)
+        pool.close_session(b)
+        return results[a], results[b]
+
+    ra, rb = asyncio.run(run())
+    # Each session accumulated its own 10 s of signal across requests
+    assert abs(ra["bpm"] - 72.0) < 3.0
+    assert abs(rb["bpm"] - 132.0) < 3.0
+    assert ra["seq"] == 299
+
+
+def test_sessions_resume_from_a_snapshot(pool):
+    async def run():
+        a = pool.open_session()
+        pool.configure(a, {"vitalsCadence": {"bpm": 0}})
+        for message in pulse_batches(72.0):
+            await pool.process(a, "means", message)
+        snapshot = await pool.process(a, "snapshot")
+        pool.close_session(a)
+
+        # Another worker picks up where the closed session stopped
+        b = pool.open_session(snapshot)
+        first = await pool.process(b, "means", pulse_batches(72.0, n=30)[0])
+        pool.close_session(b)
+        return snapshot, first
+
+    snapshot, first = asyncio.run(run())
+    assert snapshot["config"]["vitals_cadence"]["bpm"] == 0 and len(snapshot["samples"]) == 300
+    assert abs(first["bpm"] - 72.0) < 3.0
+
+
+def test_worker_errors_reach_the_caller(pool):
+    async def run():
+        sid = pool.open_session()
+        pool.close_session(sid)
+        pool._sessions[sid] = pool._workers[0]
+        try:
+            await pool.process(sid, "frame", b"", None)
+        finally:
+            del pool._sessions[sid]
+
+    with pytest.raises(WorkerError):
+        asyncio.run(run())
+
+
+def test_frames_go_through_shared_memory_slots(pool):
+    import cv2
+
+    from app.services.frames import PIXEL_RGBA, encode_frame_message
+
+    small = encode_frame_message(np.full((60, 80, 4), 90, np.uint8), PIXEL_RGBA, seq=1, timestamp=1.0)
+    # Over the 64 KiB slot size: pickled instead
+    large = encode_frame_message(cv2.cvtColor(np.full((240, 320, 3), 90, np.uint8), cv2.COLOR_BGR2RGBA),
+                                 PIXEL_RGBA, seq=2, timestamp=34.0)
+
+    refs = []
+    put = pool.slots.put
+
+    def recording_put(data):
+        refs.append(put(data))
+        return refs[-1]
+
+    async def run():
+        sid = pool.open_session()
+        results = []
+        for message in (small, large, small):
+            task = asyncio.ensure_future(pool.process(sid, "frame", message, None))
+            await asyncio.sleep(0)
+            results.append(await task)
+        pool.close_session(sid)
+        return results
+
+    pool.slots.put = recording_put
+    try:
+        results = asyncio.run(run())
+    finally:
+        del pool.slots.put
+    assert [r["seq"] for r in results] == [1, 2, 1]
+    assert refs[0] is not None and refs[1] is None and refs[2] is not None
+    # Slots are recycled as results come back
+    assert pool.slots.free == 4
+
+
+def test_pipelined_worker_answers_frames_in_order():
+    from app.services.frames import PIXEL_RGBA, encode_frame_message
+
+    pool = SessionWorkerPool(1, slots=4, slot_size=64 * 1024, pipeline_depth=3)
+    frames = [encode_frame_message(np.full((60, 80, 4), 90 + i, np.uint8), PIXEL_RGBA, seq=i,
+                                   timestamp=1000.0 + 33.0 * i) for i in range(12)]
+
+    async def run():
+        sid = pool.open_session()
+        futures = [pool.submit(sid, "frame", f, None) for f in frames[:6]]
+        # Applied after the frames already queued, before the next ones
+        pool.configure(sid, {"reportTimings": True})
+        futures += [pool.submit(sid, "frame", f, None) for f in frames[6:]]
+        futures.append(pool.submit(sid, "means", pulse_batches(72.0, n=30)[0]))
+        results = [await f for f in futures]
+        pool.close_session(sid)
+        return results
+
+    try:
+        results = asyncio.run(run())
+        assert pool.slots.free == 4
+    finally:
+        pool.shutdown()
+    assert [r["seq"] for r in results] == list(range(12)) + [29]
+    assert ["timings" in r for r in results[:12]] == [False] * 6 + [True] * 6
+
+
+def test_requests_behind_frames_in_flight_do_not_hold_up_other_sessions(monkeypatch):
+    import queue
+    import threading
+
+    from app.services.frames import PIXEL_RGBA, encode_frame_message
+    from app.services.rppg import RPPGService
+    from app.services.workers import _WorkerSessions
+
+    gate = threading.Event()
+    decode = RPPGService.decode_stage
+
+    def slow_decode(self, job):
+        gate.wait(10)
+        return decode(self, job)
+
+    monkeypatch.setattr(RPPGService, "decode_stage", slow_decode)
+    inbox, outbox = queue.Queue(), queue.Queue()
+    sessions = _WorkerSessions(inbox, outbox, pipeline_depth=3)
+    frame = encode_frame_message(np.full((60, 80, 4), 90, np.uint8), PIXEL_RGBA, seq=0, timestamp=1000.0)
+    sessions.handle(("open", 1, None, None))
+    sessions.handle(("open", 2, None, None))
+    sessions.handle(("frame", 1, 10, frame, None))
+    # Parked behind the frame, which is stuck in decoding
+    sessions.handle(("config", 1, None, {"reportTimings": True}))
+    sessions.handle(("snapshot", 1, 11))
+    sessions.handle(("means", 2, 20, pulse_batches(72.0, n=30)[0]))
+    assert outbox.get(timeout=5)[0] == 20
+
+    gate.set()
+    assert outbox.get(timeout=5)[:1] == (10,)
+    sessions.handle(inbox.get(timeout=5))
+    request_id, snapshot, error = outbox.get(timeout=5)
+    assert (request_id, error) == (11, None)
+    assert snapshot["config"]["report_timings"] is True
+    for sid in (1, 2):
+        sessions.handle(("close", sid, None))
+    assert not sessions.pipelines
+
+
+def test_only_sessions_with_batching_backends_are_pipelined(monkeypatch):
+    import queue
+
+    from app.core.config import settings
+    from app.services.detectors import BatchedDetector, FaceDetector
+    from app.services.workers import _WorkerSessions
+
+    class Batchable(FaceDetector):
+        name = "batchable"
+        batchable = True
+
+        def detect(self, image, upsample=0):
+            return []
+
+    monkeypatch.setattr(settings, "rppg_batch_max_delay_ms", 5.0)
+    sessions = _WorkerSessions(queue.Queue(), queue.Queue(), pipeline_depth=1)
+    sessions.handle(("open", 1, None, None))
+    # dlib_hog cannot batch: no threads and handoffs for nothing
+    assert 1 not in sessions.pipelines
+
+    detector = BatchedDetector(Batchable(), max_delay_ms=5.0)
+    sessions.sessions[1].detector = detector
+    sessions.handle(("config", 1, None, {}))
+    assert 1 in sessions.pipelines
+    sessions.sessions[1].detector = Batchable()
+    sessions.handle(("config", 1, None, {}))
+    assert 1 not in sessions.pipelines
+    sessions.handle(("close", 1, None))
+    detector.batcher.close()
+
+
+def test_crashed_workers_are_replaced():
+    import time
+
+    pool = SessionWorkerPool(2)
+
+    async def run():
+        sid = pool.open_session()
+        worker = pool._sessions[sid]
+        await pool.process(sid, "means", pulse_batches(72.0, n=30)[0])
+        worker.process.kill()
+        # Fails at once, or when the result thread notices the exit
+        with pytest.raises(WorkerError):
+            await pool.process(sid, "snapshot")
+        pool.close_session(sid)
+
+        deadline = time.monotonic() + 30
+        while pool._workers[worker.index] is worker and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        sids = [pool.open_session() for _ in range(4)]
+        results = [await pool.process(s, "means", pulse_batches(72.0, n=30)[0]) for s in sids]
+        for s in sids:
+            pool.close_session(s)
+        return worker, results
+
+    try:
+        worker, results = asyncio.run(run())
+        assert pool._workers[worker.index] is not worker
+        assert all(w.process.is_alive() for w in pool._workers)
+    finally:
+        pool.shutdown()
+    assert [r["seq"] for r in results] == [29] * 4
@@ -20,7 +20,8 @@ const DEFAULT_SETTINGS: AppSettings = {
   maxHR: 220,
   showGrid: true,
   language: 'zh-CN',
-  resolution: '1080p'
+  resolution: '1080p',
+  frameTransport: 'jpeg'
 };
 
 const App: React.FC = () => {
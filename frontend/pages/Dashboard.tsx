@@ -2,7 +2,10 @@ import React, { useState, useEffect } from 'react';
 import { Waveform } from '../components/Waveform';
 import { AppSettings, ReportData } from '../types';
 import { getTranslation } from '../utils/i18n';
+import { BPM_SAMPLE_INTERVAL_MS, BpmSampler, calcAvgBpm, calcMinMax } from '../utils/bpmStats';
 import { api } from '../services/api';
+import { CropBox, encodeJpegFrame, encodeRgbaFrame } from '../services/frameProtocol';
+import { decodeResultMessage } from '../services/resultProtocol';
 
 interface DashboardProps {
   settings: AppSettings;
@@ -28,27 +31,17 @@ const Dashboard: React.FC<DashboardProps> = ({ settings, token, onUpdateSettings
   const videoRef = React.useRef<HTMLVideoElement>(null);
   const canvasRef = React.useRef<HTMLCanvasElement>(null);
   const wsRef = React.useRef<WebSocket | null>(null);
-  const sessionRef = React.useRef<{ startAt: Date | null; bpmSamples: number[] }>({
+  const cropRef = React.useRef<CropBox | null>(null);
+  // Token of the current server session; reconnecting with it resumes the session's signal
+  const resumeRef = React.useRef<string | null>(null);
+  const sessionRef = React.useRef<{ startAt: Date | null; bpm: BpmSampler }>({
     startAt: null,
-    bpmSamples: [],
+    bpm: new BpmSampler(),
   });
 
   const formatDate = (d: Date) => d.toISOString().slice(0, 10);
   const formatTime = (d: Date) => d.toTimeString().slice(0, 5);
 
-  const calcAvgBpm = (samples: number[]) => {
-    const valid = samples.filter((x) => Number.isFinite(x) && x > 0);
-    if (valid.length === 0) return 0;
-    const sum = valid.reduce((a, b) => a + b, 0);
-    return sum / valid.length;
-  };
-
-  const calcMinMax = (samples: number[]) => {
-    const valid = samples.filter((x) => Number.isFinite(x) && x > 0);
-    if (valid.length === 0) return { min: 0, max: 0 };
-    return { min: Math.min(...valid), max: Math.max(...valid) };
-  };
-
   const handleSave = async () => {
     if (isSaving) return;
 
@@ -59,7 +52,7 @@ const Dashboard: React.FC<DashboardProps> = ({ settings, token, onUpdateSettings
     }
 
     const endAt = new Date();
-    const avg = calcAvgBpm(sessionRef.current.bpmSamples);
+    const avg = calcAvgBpm(sessionRef.current.bpm.samples);
 
     setIsSaving(true);
     try {
@@ -91,7 +84,7 @@ const Dashboard: React.FC<DashboardProps> = ({ settings, token, onUpdateSettings
       return;
     }
     const endAt = new Date();
-    const samples = sessionRef.current.bpmSamples;
+    const samples = sessionRef.current.bpm.samples;
     const avg = calcAvgBpm(samples);
     const mm = calcMinMax(samples);
 
@@ -132,10 +125,15 @@ const Dashboard: React.FC<DashboardProps> = ({ settings, token, onUpdateSettings
   useEffect(() => {
     let interval: NodeJS.Timeout;
     let isMounted = true; // Flag to track if effect is active
+    let reconnectTimer: ReturnType<typeof setTimeout> | undefined;
+    let sampleTimer: ReturnType<typeof setInterval> | undefined;
+    let retries = 0;
 
     if (isMonitoring) {
       sessionRef.current.startAt = new Date();
-      sessionRef.current.bpmSamples = [];
+      sessionRef.current.bpm.reset();
+      // Session stats sample the latest reading on this clock, not per message
+      sampleTimer = setInterval(() => sessionRef.current.bpm.tick(), BPM_SAMPLE_INTERVAL_MS);
 
       const captureSize =
         settings.resolution === '1080p'
@@ -175,82 +173,129 @@ const Dashboard: React.FC<DashboardProps> = ({ settings, token, onUpdateSettings
           }
         });
 
-      // 2. Connect WebSocket
-      try {
-        wsRef.current = new WebSocket("ws://localhost:8000/ws/video");
+      // 2. Connect WebSocket; after a drop it reconnects with the resume token
+      const connect = () => {
+        try {
+          const resume = resumeRef.current ? `?resume=${encodeURIComponent(resumeRef.current)}` : '';
+          wsRef.current = new WebSocket(`ws://localhost:8000/ws/video${resume}`);
+          wsRef.current.binaryType = 'arraybuffer';
         
-        wsRef.current.onopen = () => {
-          if (!isMounted) {
-              wsRef.current?.close();
-              return;
-          }
-          console.log("Connected to Backend");
-          try {
-            wsRef.current?.send(
-              JSON.stringify({
-                type: 'config',
-                rPPGSensitivity: settings.rPPGSensitivity,
-                motionRejection: settings.motionRejection,
-              }),
-            );
-          } catch {
-            undefined;
-          }
-          // Start sending frames
-          interval = setInterval(() => {
-              if (videoRef.current && canvasRef.current && wsRef.current?.readyState === WebSocket.OPEN) {
-                  const ctx = canvasRef.current.getContext('2d');
-                  if (ctx) {
-                      canvasRef.current.width = sendWidth;
-                      canvasRef.current.height = sendHeight;
-                      ctx.drawImage(videoRef.current, 0, 0, sendWidth, sendHeight);
-                      canvasRef.current.toBlob(blob => {
-                          if (blob && wsRef.current?.readyState === WebSocket.OPEN) wsRef.current.send(blob);
-                      }, 'image/jpeg', 0.8);
-                  }
+          wsRef.current.onopen = () => {
+            if (!isMounted) {
+                wsRef.current?.close();
+                return;
+            }
+            console.log("Connected to Backend");
+            retries = 0;
+            cropRef.current = null;
+            try {
+              wsRef.current?.send(
+                JSON.stringify({
+                  type: 'config',
+                  rPPGSensitivity: settings.rPPGSensitivity,
+                  motionRejection: settings.motionRejection,
+                  // Server answers with a face box to upload instead of whole frames
+                  uploadMode: 'crop',
+                  // Binary results, only when a reading moves by 0.5 or more (full state every 2 s)
+                  resultEncoding: 'binary',
+                  resultMinDelta: 0.5,
+                  resultKeyframeInterval: 2,
+                }),
+              );
+            } catch {
+              undefined;
+            }
+            // Start sending frames
+            let seq = 0;
+            if (interval) clearInterval(interval);
+            interval = setInterval(() => {
+                const video = videoRef.current;
+                if (video && canvasRef.current && wsRef.current?.readyState === WebSocket.OPEN) {
+                    const ctx = canvasRef.current.getContext('2d', { willReadFrequently: settings.frameTransport === 'raw' });
+                    if (ctx) {
+                        // Whole frame, or only the face crop the server asked for (in sendWidth x sendHeight coordinates)
+                        const [cx, cy, cw, ch] = cropRef.current ?? [0, 0, sendWidth, sendHeight];
+                        const k = video.videoWidth ? video.videoWidth / sendWidth : 1;
+                        canvasRef.current.width = cw;
+                        canvasRef.current.height = ch;
+                        const placement = {
+                            seq: seq++,
+                            timestamp: performance.timeOrigin + performance.now(),
+                            offsetX: cx,
+                            offsetY: cy,
+                            fullWidth: sendWidth,
+                            fullHeight: sendHeight,
+                        };
+                        ctx.drawImage(video, cx * k, cy * k, cw * k, ch * k, 0, 0, cw, ch);
+                        if (settings.frameTransport === 'raw') {
+                            // Raw RGBA: no JPEG encode here or decode on the server (LAN only, ~1.2 MB/frame at 640x480)
+                            wsRef.current?.send(encodeRgbaFrame(ctx.getImageData(0, 0, cw, ch), placement));
+                            return;
+                        }
+                        canvasRef.current.toBlob(blob => {
+                            if (!blob) return;
+                            blob.arrayBuffer().then(jpeg => {
+                                if (wsRef.current?.readyState === WebSocket.OPEN) wsRef.current.send(encodeJpegFrame(jpeg, cw, ch, placement));
+                            });
+                        }, 'image/jpeg', 0.8);
+                    }
+                }
+            }, 100); // 10 FPS
+          };
+
+          wsRef.current.onmessage = (event) => {
+            if (!isMounted) return;
+            try {
+              const data = event.data instanceof ArrayBuffer ? decodeResultMessage(event.data) : JSON.parse(event.data);
+              if (!data) return;
+              if (data.type === 'session') {
+                resumeRef.current = data.resumeToken ?? null;
+                return;
               }
-          }, 100); // 10 FPS
-        };
-
-        wsRef.current.onmessage = (event) => {
-          if (!isMounted) return;
-          try {
-            const data = JSON.parse(event.data);
-            if (data.bpm !== undefined && data.bpm !== null) {
-              const next = Number(data.bpm);
-              setBpm(next);
-              sessionRef.current.bpmSamples.push(next);
+              if (data.crop !== undefined) cropRef.current = data.crop as CropBox | null;
+              if (data.bpm !== undefined && data.bpm !== null) {
+                const next = Number(data.bpm);
+                setBpm(next);
+                sessionRef.current.bpm.update(next);
+              }
+              if (data.spo2 !== undefined && data.spo2 !== null) setSpo2(Number(data.spo2));
+              if (data.resp_rate !== undefined && data.resp_rate !== null) setRespRate(Number(data.resp_rate));
+              if (data.snr !== undefined && data.snr !== null) setSnr(Number(data.snr));
+              if (data.lighting !== undefined && data.lighting !== null) setLighting(Number(data.lighting));
+              if (data.quality !== undefined && data.quality !== null) setSignalQuality(String(data.quality));
+            } catch (error) {
+              console.error("Error parsing WebSocket message:", error);
             }
-            if (data.spo2 !== undefined && data.spo2 !== null) setSpo2(Number(data.spo2));
-            if (data.resp_rate !== undefined && data.resp_rate !== null) setRespRate(Number(data.resp_rate));
-            if (data.snr !== undefined && data.snr !== null) setSnr(Number(data.snr));
-            if (data.lighting !== undefined && data.lighting !== null) setLighting(Number(data.lighting));
-            if (data.quality !== undefined && data.quality !== null) setSignalQuality(String(data.quality));
-          } catch (error) {
-            console.error("Error parsing WebSocket message:", error);
-          }
-        };
-
-        wsRef.current.onclose = () => {
-          console.log("WebSocket Closed");
-          if (isMounted) {
-            // 可以添加重连逻辑
-          }
-        };
+          };
+
+          wsRef.current.onclose = () => {
+            console.log("WebSocket Closed");
+            if (interval) clearInterval(interval);
+            sessionRef.current.bpm.clear();
+            if (isMounted && isMonitoring) {
+              // Dropped link: reconnect with backoff (0.5 s doubling up to 10 s); the
+              // resume token picks the server session up where it stopped
+              const delay = Math.min(10000, 500 * 2 ** retries);
+              retries += 1;
+              reconnectTimer = setTimeout(connect, delay);
+            }
+          };
 
-        wsRef.current.onerror = (error) => {
-          console.error("WebSocket Error:", error);
+          wsRef.current.onerror = (error) => {
+            console.error("WebSocket Error:", error);
+            if (isMounted) {
+              // 可以添加错误处理逻辑
+            }
+          };
+        } catch (error) {
+          console.error("Error creating WebSocket connection:", error);
           if (isMounted) {
-            // 可以添加错误处理逻辑
+            setIsMonitoring(false);
+            window.alert("无法连接到心率检测服务，请检查后端服务是否运行");
           }
-        };
-      } catch (error) {
-        console.error("Error creating WebSocket connection:", error);
-        if (isMounted) {
-          setIsMonitoring(false);
-          window.alert("无法连接到心率检测服务，请检查后端服务是否运行");
         }
-      }
+      };
+      connect();
 
     } else {
       // Stop Camera
@@ -259,7 +304,8 @@ const Dashboard: React.FC<DashboardProps> = ({ settings, token, onUpdateSettings
         stream.getTracks().forEach(track => track.stop());
         videoRef.current.srcObject = null;
       }
-      // Close WebSocket
+      // Close WebSocket; the next start is a new session
+      resumeRef.current = null;
       if (wsRef.current) {
         wsRef.current.close();
       }
@@ -269,6 +315,8 @@ const Dashboard: React.FC<DashboardProps> = ({ settings, token, onUpdateSettings
     return () => {
       isMounted = false;
       if (interval) clearInterval(interval);
+      if (sampleTimer) clearInterval(sampleTimer);
+      if (reconnectTimer) clearTimeout(reconnectTimer);
       if (wsRef.current) wsRef.current.close();
       if (videoRef.current?.srcObject) {
          const stream = videoRef.current.srcObject as MediaStream;
@@ -276,7 +324,7 @@ const Dashboard: React.FC<DashboardProps> = ({ settings, token, onUpdateSettings
          videoRef.current.srcObject = null;
       }
     };
-  }, [isMonitoring, settings.cameraSource, settings.esp32Address, settings.resolution]);
+  }, [isMonitoring, settings.cameraSource, settings.esp32Address, settings.resolution, settings.frameTransport]);
 
   const toggleFullScreen = () => {
     if (videoRef.current) {
@@ -439,6 +439,21 @@ const Settings: React.FC<SettingsProps> = ({ settings, onSave, token, currentUse
                                  ))}
                              </div>
                         </div>
+
+                        <div className="flex flex-col gap-2">
+                             <label className="text-sm font-semibold text-gray-900 dark:text-white">{t.frameTransport}</label>
+                             <div className="flex bg-gray-100 dark:bg-slate-800 p-1 rounded-xl h-12">
+                                 {(['jpeg', 'raw'] as const).map(mode => (
+                                     <button 
+                                        key={mode} 
+                                        onClick={() => handleChange('frameTransport', mode)}
+                                        className={`flex-1 rounded-lg text-sm font-bold transition-all ${localSettings.frameTransport === mode ? 'bg-white dark:bg-slate-600 shadow-sm text-primary' : 'text-gray-500 dark:text-gray-400'}`}
+                                     >
+                                         {mode === 'jpeg' ? t.transportJpeg : t.transportRaw}
+                                     </button>
+                                 ))}
+                             </div>
+                        </div>
                     </div>
                 </div>
             </section>
@@ -0,0 +1,54 @@
+// Raw pixel frame messages for /ws/video (see backend app/services/frames.py).
+// Little-endian header: magic "RPPG", version u8, pixel format u8,
+// header size u16, sequence u32, capture timestamp f64 (ms), width u16,
+// height u16, then (version 2) crop offset x/y u16 and full frame
+// width/height u16, followed by the pixels.
+const FRAME_MAGIC = [0x52, 0x50, 0x50, 0x47];
+const FRAME_VERSION = 2;
+const HEADER_SIZE = 32;
+
+export const PIXEL_RGBA = 1;
+export const PIXEL_JPEG = 4;
+
+// Crop request from the server: [x, y, w, h] in the sent frame's coordinates
+export type CropBox = [number, number, number, number];
+
+export interface FramePlacement {
+  seq: number;
+  timestamp: number;
+  offsetX: number;
+  offsetY: number;
+  fullWidth: number;
+  fullHeight: number;
+}
+
+const encodeFrame = (
+  format: number,
+  width: number,
+  height: number,
+  payload: Uint8Array | Uint8ClampedArray,
+  p: FramePlacement,
+): ArrayBuffer => {
+  const buffer = new ArrayBuffer(HEADER_SIZE + payload.byteLength);
+  const view = new DataView(buffer);
+  FRAME_MAGIC.forEach((b, i) => view.setUint8(i, b));
+  view.setUint8(4, FRAME_VERSION);
+  view.setUint8(5, format);
+  view.setUint16(6, HEADER_SIZE, true);
+  view.setUint32(8, p.seq >>> 0, true);
+  view.setFloat64(12, p.timestamp, true);
+  view.setUint16(20, width, true);
+  view.setUint16(22, height, true);
+  view.setUint16(24, p.offsetX, true);
+  view.setUint16(26, p.offsetY, true);
+  view.setUint16(28, p.fullWidth, true);
+  view.setUint16(30, p.fullHeight, true);
+  new Uint8Array(buffer, HEADER_SIZE).set(payload);
+  return buffer;
+};
+
+export const encodeRgbaFrame = (image: ImageData, p: FramePlacement): ArrayBuffer =>
+  encodeFrame(PIXEL_RGBA, image.width, image.height, image.data, p);
+
+export const encodeJpegFrame = (jpeg: ArrayBuffer, width: number, height: number, p: FramePlacement): ArrayBuffer =>
+  encodeFrame(PIXEL_JPEG, width, height, new Uint8Array(jpeg), p);
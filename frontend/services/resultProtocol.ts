@@ -0,0 +1,71 @@
+// Binary result messages from /ws/video (see backend app/services/results.py).
+// Little-endian header: magic "RPRS", version u8, flags u8, quality code u8,
+// pad, result id u32, frame seq u32; then bpm, spo2, resp_rate, snr,
+// lighting as f32 and dropped frames u32; then ROI and crop as 4 x i32 when
+// flagged.
+import type { CropBox } from './frameProtocol';
+
+const RESULT_MAGIC = [0x52, 0x50, 0x52, 0x53];
+const RESULT_VERSION = 1;
+const HEADER_SIZE = 16;
+const BODY_SIZE = 24;
+
+const FLAG_KEYFRAME = 1;
+const FLAG_SEQ = 2;
+const FLAG_ROI = 4;
+const FLAG_CROP = 8;
+
+const QUALITY_CODES = ['', 'Good', 'Fair', 'Poor', 'No Face', 'ROI Error'];
+
+export interface ResultMessage {
+  id: number;
+  keyframe: boolean;
+  seq?: number;
+  bpm: number;
+  spo2: number;
+  resp_rate: number;
+  snr: number;
+  lighting: number;
+  quality: string;
+  dropped: number;
+  roi?: [number, number, number, number];
+  crop?: CropBox | null;
+}
+
+const round1 = (v: number) => Math.round(v * 10) / 10;
+
+const readBox = (view: DataView, offset: number): [number, number, number, number] => [
+  view.getInt32(offset, true),
+  view.getInt32(offset + 4, true),
+  view.getInt32(offset + 8, true),
+  view.getInt32(offset + 12, true),
+];
+
+export const decodeResultMessage = (buffer: ArrayBuffer): ResultMessage | null => {
+  if (buffer.byteLength < HEADER_SIZE + BODY_SIZE) return null;
+  const view = new DataView(buffer);
+  if (RESULT_MAGIC.some((b, i) => view.getUint8(i) !== b) || view.getUint8(4) !== RESULT_VERSION) return null;
+  const flags = view.getUint8(5);
+  const result: ResultMessage = {
+    id: view.getUint32(8, true),
+    keyframe: (flags & FLAG_KEYFRAME) !== 0,
+    bpm: round1(view.getFloat32(16, true)),
+    spo2: round1(view.getFloat32(20, true)),
+    resp_rate: round1(view.getFloat32(24, true)),
+    snr: round1(view.getFloat32(28, true)),
+    lighting: round1(view.getFloat32(32, true)),
+    quality: QUALITY_CODES[view.getUint8(6)] ?? '',
+    dropped: view.getUint32(36, true),
+  };
+  if (flags & FLAG_SEQ) result.seq = view.getUint32(12, true);
+  let offset = HEADER_SIZE + BODY_SIZE;
+  if (flags & FLAG_ROI) {
+    result.roi = readBox(view, offset);
+    offset += 16;
+  }
+  if (flags & FLAG_CROP) {
+    const crop = readBox(view, offset);
+    result.crop = crop[2] > 0 && crop[3] > 0 ? crop : null;
+  }
+  return result;
+};
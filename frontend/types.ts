@@ -67,4 +67,5 @@ export interface AppSettings {
   showGrid: boolean;
   language: 'zh-CN' | 'en-US';
   resolution: '1080p' | '720p' | '480p';
+  frameTransport: 'jpeg' | 'raw';
 }
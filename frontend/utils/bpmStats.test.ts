@@ -0,0 +1,35 @@
+import assert from 'node:assert/strict';
+import { test } from 'node:test';
+
+import { BpmSampler, calcAvgBpm, calcMinMax } from './bpmStats.ts';
+
+test('session stats are weighted by time, not by message rate', () => {
+  const sampler = new BpmSampler();
+  // 10 s steady at 120: one message, then keyframes every 2 s
+  for (let s = 0; s < 10; s++) {
+    if (s % 2 === 0) sampler.update(120);
+    sampler.tick();
+  }
+  // 2 s noisy: a message per frame at 10 fps
+  for (let s = 0; s < 2; s++) {
+    for (let f = 0; f < 10; f++) sampler.update(f % 2 ? 150 : 130);
+    sampler.tick();
+  }
+  assert.equal(sampler.samples.length, 12);
+  assert.equal(calcAvgBpm(sampler.samples), (10 * 120 + 2 * 150) / 12);
+  assert.deepEqual(calcMinMax(sampler.samples), { min: 120, max: 150 });
+});
+
+test('gaps without a reading are not sampled', () => {
+  const sampler = new BpmSampler();
+  sampler.tick();
+  sampler.update(100);
+  sampler.tick();
+  sampler.clear();
+  sampler.tick();
+  sampler.update(0);
+  sampler.tick();
+  assert.deepEqual(sampler.samples, [100]);
+  assert.equal(calcAvgBpm([]), 0);
+  assert.deepEqual(calcMinMax([Number.NaN, 0]), { min: 0, max: 0 });
+});
@@ -0,0 +1,46 @@
+// Heart-rate statistics of a monitoring session (saved average, report).
+// The server sends a bpm only when it moves (resultMinDelta) or on a
+// keyframe, so message arrivals are not a clock: the session is sampled
+// from the latest reading at a fixed rate instead, which weights every
+// stretch of the session by its duration.
+
+export const BPM_SAMPLE_INTERVAL_MS = 1000;
+
+const validSamples = (samples: number[]) => samples.filter((x) => Number.isFinite(x) && x > 0);
+
+export const calcAvgBpm = (samples: number[]) => {
+  const valid = validSamples(samples);
+  if (valid.length === 0) return 0;
+  return valid.reduce((a, b) => a + b, 0) / valid.length;
+};
+
+export const calcMinMax = (samples: number[]) => {
+  const valid = validSamples(samples);
+  if (valid.length === 0) return { min: 0, max: 0 };
+  return { min: Math.min(...valid), max: Math.max(...valid) };
+};
+
+export class BpmSampler {
+  samples: number[] = [];
+  private latest = 0;
+
+  // A bpm from the server; held until the next one
+  update(bpm: number) {
+    this.latest = bpm;
+  }
+
+  // No current reading (e.g. the connection dropped): gaps are not sampled
+  clear() {
+    this.latest = 0;
+  }
+
+  // Called every BPM_SAMPLE_INTERVAL_MS
+  tick() {
+    if (Number.isFinite(this.latest) && this.latest > 0) this.samples.push(this.latest);
+  }
+
+  reset() {
+    this.samples = [];
+    this.latest = 0;
+  }
+}
@@ -87,6 +87,9 @@ export const translations = {
       streamAddr: "网络流地址 (ESP32)",
       test: "测试",
       resolution: "流媒体分辨率",
+      frameTransport: "帧传输方式",
+      transportJpeg: "JPEG 压缩",
+      transportRaw: "原始像素 (局域网)",
       sensitivity: "rPPG 灵敏度",
       sensitivityDesc: "决定皮肤像素变化的检测精细程度",
       motion: "运动抑制等级",
@@ -228,6 +231,9 @@ export const translations = {
       streamAddr: "Stream Address (ESP32)",
       test: "Test",
       resolution: "Stream Resolution",
+      frameTransport: "Frame Transport",
+      transportJpeg: "JPEG",
+      transportRaw: "Raw Pixels (LAN)",
       sensitivity: "rPPG Sensitivity",
       sensitivityDesc: "Detection precision of skin pixel changes",
       motion: "Motion Rejection",